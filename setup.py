@@ -1,8 +1,15 @@
 # setup.py
-from setuptools import setup, find_packages
+from setuptools import setup, find_namespace_packages
 
 setup(
     name="Merket_Video",
     version="0.1",
-    packages=find_packages()
-)
\ No newline at end of file
+    packages=find_namespace_packages(include=['src', 'src.*']),
+    package_data={'src.data': ['symbols.csv', 'symbols_curated.csv']},
+    entry_points={
+        'console_scripts': [
+            'market-video-batch=src.cli:main',
+            'market-video-progress=src.progress_server:main'
+        ]
+    }
+)
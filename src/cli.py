@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 命令列批次渲染入口
+
+用法:
+    market-video-batch watchlist.txt --workers 4 --summary summary.json
+
+自選股文件可以是文字文件（每行一個股票代碼，# 開頭為註解），
+或 JSON 文件（列表，元素為股票代碼字串或包含 ticker、subtitles、options 的字典）。
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+
+# 任務結束狀態
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+def parse_args(argv=None):
+    """解析命令列參數
+
+    參數:
+        argv (list, 可選): 參數列表，預設為 sys.argv[1:]
+
+    返回:
+        argparse.Namespace: 解析結果
+    """
+    parser = argparse.ArgumentParser(
+        prog='market-video-batch',
+        description='在本進程內批次渲染自選股視頻，輸出各階段耗時與 JSON 摘要'
+    )
+    parser.add_argument('watchlist', help='自選股文件（.txt 每行一個代碼，或 .json 任務列表）')
+    parser.add_argument('--config', help='主控制器配置文件（JSON 或 YAML）')
+    parser.add_argument('--output-dir', help='輸出目錄（覆蓋配置）')
+    parser.add_argument('--workers', type=int, default=1, help='工作者數量（預設 1）')
+    parser.add_argument('--mode', choices=('thread', 'process'),
+                        help='工作者模式（預設：單個工作者為 thread，多個工作者為 process；thread 只支援 1 個工作者）')
+    parser.add_argument('--task-store', choices=('memory', 'sqlite'), default='memory',
+                        help='任務存儲（預設 memory，不與網頁服務共用任務）')
+    parser.add_argument('--option', action='append', default=[], metavar='KEY=VALUE',
+                        help='套用到所有任務的生成選項，可重複（值按 JSON 解析，例如 enable_tts=false）')
+    parser.add_argument('--force-render', action='store_true', help='忽略渲染結果緩存')
+    parser.add_argument('--provider', choices=('yahoo', 'local', 'record'),
+                        help='行情數據來源（local 從 --fixtures-dir 離線重播，record 錄製 Yahoo Finance 的結果）')
+    parser.add_argument('--fixtures-dir', help='local/record 數據來源使用的數據目錄')
+    parser.add_argument('--timeout', type=float, default=None, help='整個批次的逾時秒數')
+    parser.add_argument('--summary', help='JSON 摘要的輸出文件（預設輸出到標準輸出）')
+    parser.add_argument('--log-level', default='WARNING', help='日誌級別（預設 WARNING）')
+    return parser.parse_args(argv)
+
+def load_watchlist(path):
+    """讀取自選股文件
+
+    參數:
+        path (str): 文件路徑
+
+    返回:
+        list: 批次任務數據列表（process_batch 的格式）
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    if path.endswith('.json'):
+        entries = json.loads(content)
+    else:
+        entries = []
+        for line in content.splitlines():
+            line = line.split('#', 1)[0].strip()
+            if line:
+                entries.extend(t for t in line.replace(',', ' ').split() if t)
+
+    batch = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'ticker': entry}
+        batch.append({
+            'type': 'stock_video',
+            'ticker': entry['ticker'].strip().upper(),
+            'subtitles': entry.get('subtitles') or [],
+            'options': dict(entry.get('options') or {})
+        })
+    return batch
+
+def load_config(path):
+    """讀取主控制器配置文件
+
+    參數:
+        path (str): 文件路徑（.yaml/.yml 或 JSON）
+
+    返回:
+        dict: 配置字典
+    """
+    if not path:
+        return {}
+
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(f) or {}
+        return json.load(f)
+
+def parse_options(pairs):
+    """解析 KEY=VALUE 形式的選項
+
+    參數:
+        pairs (list): KEY=VALUE 字串列表
+
+    返回:
+        dict: 選項字典
+    """
+    options = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            options[key.strip()] = json.loads(value)
+        except ValueError:
+            options[key.strip()] = value
+    return options
+
+def wait_for_tasks(controller, task_ids, timeout=None, poll_interval=0.5):
+    """等待所有任務結束
+
+    參數:
+        controller (MainController): 主控制器
+        task_ids (list): 任務 ID 列表
+        timeout (float, 可選): 逾時秒數
+        poll_interval (float): 檢查間隔秒數
+
+    返回:
+        dict: 任務 ID -> 任務記錄
+    """
+    deadline = time.time() + timeout if timeout else None
+    tasks = {}
+    pending = list(dict.fromkeys(task_ids))
+
+    while pending:
+        for task_id in list(pending):
+            task = controller.get_task_status(task_id)
+            if task is None or task['status'] in FINISHED_STATUSES:
+                tasks[task_id] = task
+                pending.remove(task_id)
+
+        if not pending:
+            break
+
+        if deadline and time.time() > deadline:
+            logging.getLogger(__name__).error(f"批次逾時，取消 {len(pending)} 個未完成任務")
+            for task_id in pending:
+                controller.cancel_task(task_id)
+                tasks[task_id] = controller.get_task_status(task_id)
+            break
+
+        time.sleep(poll_interval)
+
+    return tasks
+
+def build_summary(tasks, wall_time):
+    """整理批次摘要
+
+    參數:
+        tasks (dict): 任務 ID -> 任務記錄
+        wall_time (float): 總耗時秒數
+
+    返回:
+        dict: 摘要（任務結果、狀態統計、各階段耗時合計）
+    """
+    summary = {'wall_time': round(wall_time, 3), 'counts': {}, 'stage_totals': {}, 'tasks': []}
+
+    for task_id, task in tasks.items():
+        status = task['status'] if task else 'missing'
+        summary['counts'][status] = summary['counts'].get(status, 0) + 1
+        if task is None:
+            summary['tasks'].append({'id': task_id, 'status': status})
+            continue
+
+        timings = task.get('timings') or {}
+        for stage, duration in timings.items():
+            summary['stage_totals'][stage] = round(summary['stage_totals'].get(stage, 0) + duration, 3)
+
+        summary['tasks'].append({
+            'id': task_id,
+            'ticker': task.get('ticker'),
+            'status': status,
+            'cached': bool(task.get('cached')),
+            'error': task.get('error'),
+            'result': task.get('result'),
+            'timings': timings
+        })
+
+    return summary
+
+def print_timings(summary, stream=sys.stderr):
+    """輸出每個任務的各階段耗時表
+
+    參數:
+        summary (dict): 批次摘要
+        stream (file): 輸出流
+    """
+    stages = [s for s in summary['stage_totals'] if s != 'total']
+    header = ['ticker', 'status'] + stages + ['total']
+    rows = []
+    for task in summary['tasks']:
+        timings = task.get('timings') or {}
+        rows.append([str(task.get('ticker') or task['id']), task['status']] +
+                    [f"{timings[s]:.2f}" if s in timings else '-' for s in stages + ['total']])
+
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)), file=stream)
+
+    counts = ', '.join(f"{status}: {count}" for status, count in summary['counts'].items())
+    print(f"\n共 {len(summary['tasks'])} 個任務 ({counts})，總耗時 {summary['wall_time']:.2f} 秒", file=stream)
+
+def main(argv=None):
+    """命令列入口
+
+    參數:
+        argv (list, 可選): 參數列表
+
+    返回:
+        int: 退出碼（0 全部成功，1 有任務失敗或取消）
+    """
+    args = parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger = logging.getLogger(__name__)
+
+    try:
+        batch = load_watchlist(args.watchlist)
+        config = load_config(args.config)
+    except Exception as e:
+        logger.error(f"讀取輸入文件失敗: {e}")
+        return 2
+
+    if not batch:
+        logger.error(f"自選股文件中沒有股票代碼: {args.watchlist}")
+        return 2
+
+    if args.output_dir:
+        config['output_dir'] = args.output_dir
+    config['workers'] = dict(config.get('workers') or {}, count=max(1, args.workers))
+    if args.mode:
+        config['workers']['mode'] = args.mode
+    config['task_store'] = dict(config.get('task_store') or {}, backend=args.task_store)
+    if args.provider or args.fixtures_dir:
+        data_config = dict(config.get('data') or {})
+        provider_config = dict(data_config.get('provider') or {})
+        if args.provider:
+            provider_config['type'] = args.provider
+        if args.fixtures_dir:
+            provider_config['fixtures_dir'] = args.fixtures_dir
+        data_config['provider'] = provider_config
+        config['data'] = data_config
+
+    shared_options = parse_options(args.option)
+    if args.force_render:
+        shared_options['force_render'] = True
+    for item in batch:
+        item['options'] = dict(shared_options, **item['options'])
+
+    # 延遲導入渲染組件，--help 與參數錯誤時不需要載入
+    from src.core.main_controller import MainController
+
+    start_time = time.time()
+    controller = MainController(config)
+    try:
+        task_ids = controller.process_batch(batch)
+        tasks = wait_for_tasks(controller, task_ids, args.timeout)
+    except KeyboardInterrupt:
+        logger.warning("已中斷，取消未完成的任務")
+        for task in controller.task_store.list_tasks():
+            if task['status'] in ('waiting', 'processing'):
+                controller.cancel_task(task['id'])
+        return 130
+    finally:
+        controller.shutdown()
+
+    summary = build_summary(tasks, time.time() - start_time)
+    print_timings(summary)
+
+    encoded = json.dumps(summary, ensure_ascii=False, indent=2, default=str)
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            f.write(encoded)
+    else:
+        print(encoded)
+
+    return 0 if summary['counts'].get('completed', 0) == len(summary['tasks']) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
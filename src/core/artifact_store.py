@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 渲染結果緩存
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from src.data.cache_manager import get_cache_manager
+
+# 不影響渲染輸出的選項，不計入任務指紋
+NON_RENDER_OPTIONS = {'force_render', 'priority_class', 'user_id'}
+
+def compute_fingerprint(ticker, subtitles, options, data_version=None):
+    """計算任務指紋
+
+    相同的股票代碼、數據版本、字幕與渲染選項會得到相同的指紋，用於合併重複請求與查找已緩存的結果。
+
+    參數:
+        ticker (str): 股票代碼
+        subtitles (list): 字幕列表
+        options (dict): 生成選項
+        data_version (str, 可選): 數據版本（StockDataCollector.get_data_version），
+            未提供且選項中也沒有時使用當天日期
+
+    返回:
+        str: 指紋（SHA-256 十六進位字串）
+    """
+    options = options or {}
+    if data_version is None:
+        data_version = options.get('data_version') or datetime.now().strftime('%Y-%m-%d')
+
+    payload = {
+        'ticker': str(ticker).upper(),
+        'data_version': data_version,
+        'subtitles': [
+            {
+                'text': subtitle.get('text', ''),
+                'startTime': subtitle.get('startTime'),
+                'endTime': subtitle.get('endTime')
+            }
+            for subtitle in (subtitles or [])
+        ],
+        'options': {k: v for k, v in options.items() if k not in NON_RENDER_OPTIONS}
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+class ArtifactStore:
+    """渲染結果緩存
+
+    以任務指紋為目錄保存完成任務的輸出文件副本與 manifest.json。
+    輸出目錄中的同名文件會被之後的任務原地覆寫，因此保存副本而非硬連結。
+    條目超過有效期後失效，總大小超過上限時按最近使用時間淘汰。
+    """
+
+    # 任務結果中屬於輸出文件的字段
+    RESULT_FILE_KEYS = ('video_file', 'subtitle_file', 'audio_file', 'timeline_file', 'digital_human_video')
+
+    def __init__(self, config=None):
+        """初始化渲染結果緩存
+
+        參數:
+            config (dict, 可選): 緩存設定 (dir, ttl_hours, max_size_mb)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.cache_dir = self.config.get('dir', os.path.join(os.getcwd(), 'cache', 'artifacts'))
+        self.ttl = float(self.config.get('ttl_hours', 24)) * 3600
+        self.max_size = float(self.config.get('max_size_mb', 2048)) * 1024 * 1024
+        self.lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 條目由本緩存按有效期與容量自行淘汰，緩存管理只統計用量並清理遺留文件
+        get_cache_manager().register('artifacts', self.cache_dir, owner='artifact_store',
+                                     expire_days=self.ttl / 86400, evictable=False)
+
+    def get(self, fingerprint):
+        """查找已緩存的結果
+
+        參數:
+            fingerprint (str): 任務指紋
+
+        返回:
+            dict: 結果字典（文件路徑指向緩存目錄），不存在或已過期時返回 None
+        """
+        entry_dir = os.path.join(self.cache_dir, fingerprint)
+        manifest = self._read_manifest(entry_dir)
+        if manifest is None:
+            return None
+
+        if time.time() - manifest.get('created_at', 0) > self.ttl:
+            self.logger.info(f"渲染緩存已過期: {fingerprint}")
+            self._remove_entry(entry_dir)
+            return None
+
+        result = {}
+        for key, value in manifest.get('result', {}).items():
+            if key in self.RESULT_FILE_KEYS and value:
+                path = os.path.join(entry_dir, value)
+                if not os.path.exists(path):
+                    self.logger.warning(f"渲染緩存文件缺失: {path}")
+                    self._remove_entry(entry_dir)
+                    return None
+                result[key] = path
+            else:
+                result[key] = value
+
+        # 更新最近使用時間（用於淘汰順序）
+        try:
+            os.utime(os.path.join(entry_dir, 'manifest.json'))
+        except OSError:
+            pass
+
+        return result
+
+    def put(self, fingerprint, result):
+        """保存完成任務的輸出文件
+
+        參數:
+            fingerprint (str): 任務指紋
+            result (dict): 任務結果
+
+        返回:
+            dict: 指向緩存目錄的結果字典，保存失敗時返回 None
+        """
+        entry_dir = os.path.join(self.cache_dir, fingerprint)
+        temp_dir = f"{entry_dir}.tmp{os.getpid()}_{threading.get_ident()}"
+
+        try:
+            os.makedirs(temp_dir, exist_ok=True)
+            stored = {}
+            size = 0
+
+            for key, value in (result or {}).items():
+                if key in self.RESULT_FILE_KEYS and value and os.path.isfile(value):
+                    name = os.path.basename(value)
+                    shutil.copy2(value, os.path.join(temp_dir, name))
+                    size += os.path.getsize(value)
+                    stored[key] = name
+                elif key in self.RESULT_FILE_KEYS:
+                    stored[key] = None
+                else:
+                    stored[key] = value
+
+            manifest = {
+                'fingerprint': fingerprint,
+                'created_at': time.time(),
+                'size': size,
+                'result': stored
+            }
+            with open(os.path.join(temp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+            # 以目錄改名原子地發佈條目
+            with self.lock:
+                if os.path.exists(entry_dir):
+                    self._remove_entry(entry_dir)
+                os.rename(temp_dir, entry_dir)
+
+            self.logger.info(f"渲染結果已緩存: {fingerprint} ({size / 1024 / 1024:.1f} MB)")
+            self.evict()
+            return self.get(fingerprint)
+
+        except Exception as e:
+            self.logger.error(f"緩存渲染結果失敗: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return None
+
+    def evict(self):
+        """刪除過期條目，總大小超過上限時按最近使用時間淘汰
+
+        返回:
+            int: 刪除的條目數量
+        """
+        now = time.time()
+        entries = []
+        removed = 0
+
+        with self.lock:
+            for name in os.listdir(self.cache_dir):
+                entry_dir = os.path.join(self.cache_dir, name)
+                manifest = self._read_manifest(entry_dir)
+                if manifest is None:
+                    continue
+
+                if now - manifest.get('created_at', 0) > self.ttl:
+                    self._remove_entry(entry_dir)
+                    removed += 1
+                    continue
+
+                last_used = os.path.getmtime(os.path.join(entry_dir, 'manifest.json'))
+                entries.append((last_used, manifest.get('size', 0), entry_dir))
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                self._remove_entry(entry_dir)
+                total_size -= size
+                removed += 1
+
+        if removed:
+            self.logger.info(f"已淘汰 {removed} 個渲染緩存條目")
+        return removed
+
+    def _read_manifest(self, entry_dir):
+        """讀取條目的 manifest.json
+
+        參數:
+            entry_dir (str): 條目目錄
+
+        返回:
+            dict: manifest 內容，不存在或無法讀取時返回 None
+        """
+        manifest_path = os.path.join(entry_dir, 'manifest.json')
+        if not os.path.isfile(manifest_path):
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"讀取渲染緩存 manifest 失敗: {manifest_path}, {e}")
+            return None
+
+    def _remove_entry(self, entry_dir):
+        """刪除緩存條目
+
+        參數:
+            entry_dir (str): 條目目錄
+        """
+        shutil.rmtree(entry_dir, ignore_errors=True)
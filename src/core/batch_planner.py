@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 批次任務規劃
+"""
+
+import time
+import logging
+
+# 股票代碼後綴對應的市場指數
+MARKET_INDEX_SYMBOLS = {
+    '.TW': '^TWII',   # 台灣加權指數
+    '.TWO': '^TWII',
+    '.HK': '^HSI'     # 恆生指數
+}
+DEFAULT_MARKET_INDEX = '^GSPC'  # S&P 500
+
+def market_index_for(ticker):
+    """獲取股票所屬市場的指數代碼
+
+    參數:
+        ticker (str): 股票代碼
+
+    返回:
+        str: 指數代碼
+    """
+    ticker = str(ticker).upper()
+    for suffix, index_symbol in MARKET_INDEX_SYMBOLS.items():
+        if ticker.endswith(suffix):
+            return index_symbol
+    return DEFAULT_MARKET_INDEX
+
+class BatchPlanner:
+    """批次任務規劃器
+
+    在批次任務分發到工作者之前，把所有股票與相關市場指數合併為少數幾次批量下載，
+    以寬表一次計算技術指標，再寫入股票數據收集器的緩存。
+    之後每個任務的 get_stock_data 與市場指數查詢都直接命中緩存，
+    100 檔股票的批次只需要幾次數據請求而非數百次。
+    """
+
+    def __init__(self, stock_collector, config=None):
+        """初始化批次任務規劃器
+
+        參數:
+            stock_collector (StockDataCollector): 股票數據收集器（使用其緩存目錄與指標計算）
+            config (dict, 可選): 設定 (chunk_size, min_batch_size, include_market_index)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.stock_collector = stock_collector
+        self.chunk_size = max(1, int(self.config.get('chunk_size', 50)))
+        self.min_batch_size = int(self.config.get('min_batch_size', 2))
+        self.include_market_index = self.config.get('include_market_index', True)
+
+    def plan(self, batch_data):
+        """整理批次中需要的股票數據
+
+        參數:
+            batch_data (list): 批次任務數據列表
+
+        返回:
+            list: 需要預取的代碼（股票與市場指數，去重並保持順序）
+        """
+        symbols = []
+        for item in batch_data:
+            if item.get('type') != 'stock_video' or not item.get('ticker'):
+                continue
+            ticker = item['ticker']
+            symbols.append(ticker)
+            if self.include_market_index:
+                symbols.append(market_index_for(ticker))
+
+        return list(dict.fromkeys(symbols))
+
+    def prefetch(self, symbols, period="1y", interval="1d"):
+        """批量下載股票數據並寫入緩存
+
+        已有新鮮緩存的代碼不會重新下載；批量下載失敗的代碼留給各任務自行獲取。
+
+        參數:
+            symbols (list): 股票或指數代碼列表
+            period (str): 時間範圍
+            interval (str): 數據間隔
+
+        返回:
+            dict: 統計 (symbols, cached, downloaded, requests, failed, duration)
+        """
+        start_time = time.time()
+        stats = {'symbols': len(symbols), 'cached': 0, 'downloaded': 0, 'requests': 0, 'failed': [], 'duration': 0.0}
+
+        missing = [s for s in symbols if not self.stock_collector.has_fresh_cache(s, period, interval)]
+        stats['cached'] = len(symbols) - len(missing)
+
+        if not missing:
+            stats['duration'] = round(time.time() - start_time, 3)
+            return stats
+
+        # 只做分組下載並寫入緩存，失敗的代碼不逐個重試
+        frames = self.stock_collector.get_many(missing, period, interval, use_cache=False, chunk_size=self.chunk_size,
+                                               write_cache=True, fallback=False, stats=stats)
+        stats['failed'] = [symbol for symbol in missing if symbol not in frames]
+
+        stats['duration'] = round(time.time() - start_time, 3)
+        self.logger.info(
+            f"批量預取完成: {stats['symbols']} 個代碼, 緩存命中 {stats['cached']}, "
+            f"下載 {stats['downloaded']} ({stats['requests']} 次請求), 失敗 {len(stats['failed'])}, "
+            f"耗時 {stats['duration']:.2f} 秒"
+        )
+        return stats
+
+    def prepare(self, batch_data):
+        """規劃並預取批次所需的數據
+
+        參數:
+            batch_data (list): 批次任務數據列表
+
+        返回:
+            dict: 預取統計，批次太小時返回 None
+        """
+        symbols = self.plan(batch_data)
+        if len(symbols) < self.min_batch_size:
+            return None
+        return self.prefetch(symbols)
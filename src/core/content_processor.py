@@ -7,8 +7,6 @@
 
 import re
 import logging
-import jieba
-import jieba.analyse
 import pandas as pd
 from datetime import datetime
 
@@ -22,13 +20,25 @@ class ContentProcessor:
         """初始化內容處理器"""
         self.logger = logging.getLogger(__name__)
         
-        # 初始化結巴分詞
-        try:
-            jieba.initialize()
-            self.jieba_available = True
-        except:
-            self.logger.warning("結巴分詞初始化失敗，將使用簡單的文本分析方法")
-            self.jieba_available = False
+        # 結巴分詞在首次提取關鍵詞時才載入（載入詞典需要數秒），None 表示尚未載入
+        self.jieba_available = None
+        
+    def _load_jieba(self):
+        """載入結巴分詞
+        
+        返回:
+            bool: 結巴分詞是否可用
+        """
+        if self.jieba_available is None:
+            try:
+                import jieba
+                import jieba.analyse
+                jieba.initialize()
+                self.jieba_available = True
+            except Exception:
+                self.logger.warning("結巴分詞初始化失敗，將使用簡單的文本分析方法")
+                self.jieba_available = False
+        return self.jieba_available
         
     def process_article(self, article_text, strategy='sentence'):
         """處理文章內容
@@ -239,8 +249,9 @@ class ContentProcessor:
             list: 關鍵詞列表 [(詞, 權重), ...]
         """
         # 使用結巴分詞進行提取
-        if self.jieba_available:
+        if self._load_jieba():
             try:
+                import jieba.analyse
                 keywords = jieba.analyse.extract_tags(text, topK=top_k, withWeight=True)
                 return keywords
             except Exception as e:
@@ -8,15 +8,28 @@
 import os
 import logging
 import json
+import re
 from datetime import datetime
+import time
+import uuid
+import socket
 import threading
-import queue
 
 from src.core.content_processor import ContentProcessor
 from src.core.subtitle_manager import SubtitleManager
 from src.core.tts_controller import TTSController
 from src.core.sync_manager import SyncManager
+from src.core.task_runner import StockVideoTaskRunner
+from src.core.worker_pool import WorkerPool
+from src.core.task_store import create_task_store
+from src.core.artifact_store import ArtifactStore, compute_fingerprint
+from src.core.task_workspace import register_scratch_namespace
+from src.core.progress_broker import ProgressBroker
+from src.core.batch_planner import BatchPlanner, market_index_for
+from src.core.warmup_scheduler import WarmupScheduler
+from src.utils.cancellation import CancellationToken, TaskCancelled
 from src.data.stock_collector import StockDataCollector
+from src.data.cache_manager import get_cache_manager
 from src.data.data_processor import DataProcessor
 from src.media.video_generator import VideoGenerator
 from src.media.digital_human import DigitalHuman
@@ -27,6 +40,13 @@ class MainController:
     負責協調各個模組和組件，實現整個系統的流程控制。
     """
     
+    # 任務優先級類別（數值越小越優先）
+    PRIORITY_CLASSES = {
+        'interactive': 0,  # 編輯器預覽，用戶正在等待
+        'on_demand': 1,    # 一般的視頻生成請求
+        'batch': 2         # 批次與回補任務
+    }
+    
     def __init__(self, config=None):
         """初始化主控制器
         
@@ -40,24 +60,87 @@ class MainController:
         # 確保輸出目錄存在
         os.makedirs(self.output_dir, exist_ok=True)
         
+        # 緩存管理：各模組註冊自己的緩存目錄，統一執行過期清理與容量上限
+        self.cache_manager = get_cache_manager(self.config.get('cache', {}))
+        
         # 初始化各個模組
         self.content_processor = ContentProcessor()
         self.subtitle_manager = SubtitleManager()
         self.tts_controller = TTSController(self.config.get('tts', {}))
         self.sync_manager = SyncManager()
-        self.stock_collector = StockDataCollector(self.config.get('api_keys', {}))
+        self.stock_collector = StockDataCollector(self.config.get('api_keys', {}), self.config.get('data', {}))
         self.data_processor = DataProcessor()
         self.video_generator = VideoGenerator(self.config.get('video', {}))
         self.digital_human = DigitalHuman(self.config.get('digital_human', {}))
         
-        # 初始化任務隊列
-        self.task_queue = queue.Queue()
-        self.tasks = {}
-        self.task_worker_thread = None
+        # 初始化任務存儲（預設為 SQLite，多個進程共享同一份任務狀態）
+        task_store_config = self.config.get('task_store', {})
+        self.task_store = create_task_store(task_store_config)
+        self.task_lease = float(task_store_config.get('lease_seconds', 900))
+        
+        # 已結束任務的保留策略：超過有效期或數量上限時刪除，大型輸入在結束後寫到磁碟
+        finished_ttl_hours = task_store_config.get('finished_ttl_hours', 24)
+        self.finished_ttl = float(finished_ttl_hours) * 3600 if finished_ttl_hours is not None else None
+        self.max_finished_tasks = task_store_config.get('max_finished', 1000)
+        self.compact_finished = task_store_config.get('compact_finished', True)
+        self.spill_dir = task_store_config.get('spill_dir', os.path.join(os.getcwd(), 'cache', 'task_payloads'))
+        self.task_available = threading.Event()
+        self.last_stale_check = 0.0
         self.is_worker_running = False
         
+        # 任務暫存目錄由任務自行清理，註冊後緩存管理統計用量並清理遺留文件
+        register_scratch_namespace(self.config.get('workspace', {}))
+        
+        # 渲染結果緩存：相同指紋的已完成任務直接返回緩存的輸出
+        artifact_config = self.config.get('artifact_cache', {})
+        self.artifact_store = ArtifactStore(artifact_config) if artifact_config.get('enabled', True) else None
+        
+        # 進度推送：訂閱者以 Server-Sent Events 或長輪詢接收進度，其他進程處理的任務從任務存儲讀取
+        self.progress_broker = ProgressBroker(self.task_store.get, self.config.get('progress_stream', {}))
+        
+        # 調度設定：批次任務在階段邊界讓出給等待中的互動任務
+        self.scheduler_config = self.config.get('scheduler', {})
+        self.preempt_batch = self.scheduler_config.get('preempt_batch', True)
+        
+        # 批次規劃：批次任務分發前合併下載股票與市場指數數據
+        batch_config = self.config.get('batch_planner', {})
+        self.batch_planner = BatchPlanner(self.stock_collector, batch_config) if batch_config.get('enabled', True) else None
+        
+        # 本進程中正在處理的任務的取消令牌
+        self.cancel_tokens = {}
+        self.cancel_watch_thread = None
+        
+        # 本進程持有租約的任務 -> 心跳線程的停止事件（長時間階段執行期間持續續期）
+        self.heartbeats = {}
+        self.heartbeat_lock = threading.Lock()
+        
+        # 重新排隊本機上已退出進程遺留的處理中任務
+        self._recover_orphaned_tasks()
+        
+        # 工作者設定：process 模式使用工作進程池，thread 模式在本進程內以單個線程執行
+        # 多個工作者預設使用 process 模式；thread 模式的渲染受 GIL 限制，只允許 1 個工作者
+        self.workers_config = self.config.get('workers', {})
+        self.worker_count = max(1, int(self.workers_config.get('count', 1)))
+        self.worker_mode = self.workers_config.get('mode') or ('process' if self.worker_count > 1 else 'thread')
+        if self.worker_mode == 'thread' and self.worker_count > 1:
+            self.logger.warning(f"thread 模式只支援 1 個工作者（設定為 {self.worker_count}），多個工作者請使用 process 模式")
+            self.worker_count = 1
+        self.worker_pool = None
+        self.task_worker_threads = []
+        self.worker_stats = []
+        
         # 啟動任務處理線程
         self.start_task_worker()
+        
+        # 預熱排程：在渲染高峰前預先填充數據、圖表、模板與語音緩存
+        warmup_config = self.config.get('warmup', {})
+        self.warmup_scheduler = WarmupScheduler(self.config, self._warm_workers) if warmup_config.get('enabled', False) else None
+        if self.warmup_scheduler:
+            self.warmup_scheduler.start()
+            if warmup_config.get('run_on_start', False):
+                self.warmup_scheduler.run_in_background()
+        
+        self.cache_manager.start()
     
     def process_article(self, article_text, options=None):
         """處理文章
@@ -109,6 +192,23 @@ class MainController:
             self.logger.error(f"處理文章時出錯: {e}")
             return None
     
+    def _data_version(self, ticker, options):
+        """獲取任務使用的股票數據版本（用於任務指紋）
+
+        只讀取本地的緩存與行情數據存儲，提交請求時不向上游請求數據；
+        本地沒有數據時返回 None，指紋改用交易日。
+
+        參數:
+            ticker (str): 股票代碼
+            options (dict): 生成選項（可用 data_version 指定）
+
+        返回:
+            str: 數據版本，無法獲取時返回 None
+        """
+        if options.get('data_version'):
+            return options['data_version']
+        return self.stock_collector.get_data_version(ticker)
+
     def generate_stock_video(self, ticker, subtitles, options=None):
         """生成股票視頻
         
@@ -127,8 +227,14 @@ class MainController:
         if options is None:
             options = {}
             
-        # 創建任務 ID
-        task_id = f"task_{datetime.now().strftime('%Y%m%d%H%M%S')}_{ticker}"
+        # 優先級類別與提交用戶（同一優先級內按用戶公平分配）
+        priority_class = options.get('priority_class', 'on_demand')
+        if priority_class not in self.PRIORITY_CLASSES:
+            self.logger.warning(f"未知的優先級類別: {priority_class}，使用 on_demand")
+            priority_class = 'on_demand'
+            
+        # 創建任務 ID（多個進程共享任務存儲，加入隨機後綴避免同一秒內重複）
+        task_id = f"task_{datetime.now().strftime('%Y%m%d%H%M%S')}_{ticker}_{uuid.uuid4().hex[:6]}"
         
         # 創建任務
         task = {
@@ -138,217 +244,622 @@ class MainController:
             'ticker': ticker,
             'subtitles': subtitles,
             'options': options,
+            'priority': self.PRIORITY_CLASSES[priority_class],
+            'priority_class': priority_class,
+            'user_id': str(options.get('user_id', 'anonymous')),
             'progress': 0,
             'result': None,
             'error': None,
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'fingerprint': compute_fingerprint(ticker, subtitles, options, self._data_version(ticker, options))
         }
         
-        # 添加到任務字典
-        self.tasks[task_id] = task
+        if options.get('force_render', False):
+            self.task_store.add(task)
+        else:
+            # 相同任務已完成：直接返回緩存的輸出
+            cached = self.artifact_store.get(task['fingerprint']) if self.artifact_store else None
+            if cached:
+                task.update({
+                    'status': 'completed',
+                    'progress': 100,
+                    'progress_message': "使用緩存結果",
+                    'result': cached,
+                    'cached': True,
+                    'finished_at': time.time()
+                })
+                self._compact_fields(task_id, task, ('subtitles', 'options'))
+                self.task_store.add(task)
+                self.logger.info(f"使用緩存的渲染結果: {task_id} ({task['fingerprint'][:12]})")
+                return task_id
+                
+            # 相同任務正在排隊或處理中：合併到既有任務
+            existing_id = self.task_store.add_unless_active(task)
+            if existing_id != task_id:
+                self.logger.info(f"合併重複請求到既有任務: {existing_id}")
+                return existing_id
         
-        # 添加到任務隊列
-        self.task_queue.put(task)
+        # 通知工作者有新任務
+        self.task_available.set()
         
         self.logger.info(f"已創建股票視頻生成任務: {task_id}")
         return task_id
     
     def start_task_worker(self):
-        """啟動任務處理線程"""
+        """啟動任務處理工作者
+        
+        workers.mode 為 thread 時在本進程內啟動 1 個工作線程（單個工作者時的預設），
+        為 process 時（多個工作者時的預設）啟動 workers.count 個工作進程，每個進程持有各自熱啟動的渲染組件。
+        """
         if self.is_worker_running:
             return
             
         self.is_worker_running = True
-        self.task_worker_thread = threading.Thread(target=self._task_worker)
-        self.task_worker_thread.daemon = True
-        self.task_worker_thread.start()
         
-        self.logger.info("任務處理線程已啟動")
+        # 監視任務存儲中的取消請求（可能來自其他進程）
+        self.cancel_watch_thread = threading.Thread(target=self._watch_cancellations)
+        self.cancel_watch_thread.daemon = True
+        self.cancel_watch_thread.start()
+        
+        if self.worker_mode == 'process':
+            self.worker_pool = WorkerPool(
+                self.config,
+                self.worker_count,
+                self._next_task,
+                self._update_task_progress,
+                self._finish_task,
+                on_requeue=self._requeue_task,
+                max_attempts=self.workers_config.get('max_attempts', 2),
+                start_method=self.workers_config.get('start_method', 'spawn'),
+                reserved_workers=self.workers_config.get('reserved_interactive', 0),
+                reserved_priority=self.PRIORITY_CLASSES['interactive']
+            )
+            self.worker_pool.start()
+            self.logger.info(f"任務處理進程池已啟動: {self.worker_count} 個進程")
+            return
+        
+        for worker_id in range(self.worker_count):
+            stats = {
+                'id': worker_id,
+                'current_task': None,
+                'busy_since': None,
+                'busy_time': 0.0,
+                'started_at': time.time(),
+                'tasks_completed': 0,
+                'tasks_failed': 0
+            }
+            self.worker_stats.append(stats)
+            thread = threading.Thread(target=self._task_worker, args=(stats,))
+            thread.daemon = True
+            thread.start()
+            self.task_worker_threads.append(thread)
+        
+        self.logger.info(f"任務處理線程已啟動: {self.worker_count} 個線程")
     
     def stop_task_worker(self):
-        """停止任務處理線程"""
+        """停止任務處理工作者"""
         self.is_worker_running = False
-        if self.task_worker_thread:
-            self.task_worker_thread.join(timeout=1.0)
-            self.task_worker_thread = None
+        
+        if self.worker_pool:
+            self.worker_pool.stop()
+            self.worker_pool = None
             
-        self.logger.info("任務處理線程已停止")
+        for thread in self.task_worker_threads:
+            thread.join(timeout=1.0)
+        self.task_worker_threads = []
+        
+        if self.cancel_watch_thread:
+            self.cancel_watch_thread.join(timeout=1.0)
+            self.cancel_watch_thread = None
+        self.worker_stats = []
+            
+        self.logger.info("任務處理工作者已停止")
     
-    def _task_worker(self):
-        """任務處理線程"""
-        while self.is_worker_running:
-            try:
-                # 嘗試獲取任務，超時 1 秒
-                task = self.task_queue.get(timeout=1.0)
-                
-                # 更新任務狀態
-                task['status'] = 'processing'
-                self.tasks[task['id']] = task
+    def get_worker_stats(self):
+        """獲取各工作者的使用率統計
+        
+        返回:
+            dict: 工作模式與每個工作者的處理數量、忙碌時間及使用率
+        """
+        if self.worker_pool:
+            workers = self.worker_pool.get_stats()
+        else:
+            now = time.time()
+            workers = []
+            for stats in self.worker_stats:
+                busy_time = stats['busy_time']
+                if stats['busy_since'] is not None:
+                    busy_time += now - stats['busy_since']
+                uptime = max(now - stats['started_at'], 1e-6)
+                workers.append({
+                    'id': stats['id'],
+                    'current_task': stats['current_task'],
+                    'tasks_completed': stats['tasks_completed'],
+                    'tasks_failed': stats['tasks_failed'],
+                    'busy_seconds': round(busy_time, 2),
+                    'uptime_seconds': round(uptime, 2),
+                    'utilization': round(min(busy_time / uptime, 1.0), 4)
+                })
                 
-                # 根據任務類型執行不同處理
-                if task['type'] == 'stock_video':
-                    self._process_stock_video_task(task)
-                else:
-                    self.logger.warning(f"未知的任務類型: {task['type']}")
-                    task['status'] = 'failed'
-                    task['error'] = f"未知的任務類型: {task['type']}"
+        return {
+            'mode': self.worker_mode,
+            'count': self.worker_count,
+            'queued': self.task_store.count('waiting'),
+            'workers': workers
+        }
+    
+    def get_queue_metrics(self, window=3600):
+        """獲取各優先級類別的排隊統計
+        
+        統計來自共享的任務存儲，所有進程看到相同的數據。
+        
+        參數:
+            window (float): 統計最近多少秒內開始處理的任務
+            
+        返回:
+            dict: 類別名稱 -> {waiting, oldest_wait, count, avg_wait, p50_wait, p95_wait, max_wait}（秒）
+        """
+        names = {value: name for name, value in self.PRIORITY_CLASSES.items()}
+        metrics = self.task_store.queue_metrics(window)
+        return {names.get(priority, str(priority)): values for priority, values in sorted(metrics.items())}
+    
+    def _next_task(self, timeout=1.0, max_priority=None):
+        """從任務存儲領取下一個待處理的任務
+        
+        領取在存儲中原子完成，多個線程、進程或 gunicorn worker 同時領取時每個任務只會交給一個工作者；
+        已取消的任務不再處於等待狀態，不會被領取。
+        
+        參數:
+            timeout (float): 沒有等待中任務時的等待秒數，0 表示不等待
+            max_priority (int, 可選): 只領取優先級數值不大於此值的任務
+            
+        返回:
+            dict: 任務信息，沒有可處理的任務時返回 None
+        """
+        self._maintain_task_store()
+        
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        task = self.task_store.claim(worker_id, max_priority)
+        if task is None:
+            if not timeout:
+                return None
+            # 本進程提交的任務會立即喚醒，其他進程提交的任務在輪詢時領取
+            self.task_available.wait(timeout)
+            self.task_available.clear()
+            task = self.task_store.claim(worker_id, max_priority)
+            if task is None:
+                return None
+            
+        if task['type'] != 'stock_video':
+            self.logger.warning(f"未知的任務類型: {task['type']}")
+            self.task_store.update(task['id'], {
+                'status': 'failed',
+                'error': f"未知的任務類型: {task['type']}"
+            }, claimed_by=task['claimed_by'])
+            return None
+            
+        self._start_heartbeat(task)
+        return task
+    
+    def _start_heartbeat(self, task):
+        """啟動任務的租約心跳線程
+        
+        每 lease_seconds / 3 秒續期一次，階段執行期間不寫進度也不會被當作超時任務重新排隊。
+        租約已失去（任務被重新排隊、取消或由其他領取者持有）時通知本進程的工作者停止處理。
+        
+        參數:
+            task (dict): 已領取的任務信息
+        """
+        stop_event = threading.Event()
+        with self.heartbeat_lock:
+            self.heartbeats[task['id']] = stop_event
+        
+        def beat():
+            interval = max(self.task_lease / 3, 1.0)
+            while not stop_event.wait(interval):
+                try:
+                    if not self.task_store.heartbeat(task['id'], task['claimed_by']):
+                        self.logger.warning(f"任務租約已失去，停止處理: {task['id']}")
+                        self._signal_cancel(task['id'])
+                        return
+                except Exception as e:
+                    self.logger.warning(f"任務心跳失敗: {task['id']}, {e}")
+        
+        thread = threading.Thread(target=beat, name=f"heartbeat-{task['id']}")
+        thread.daemon = True
+        thread.start()
+    
+    def _stop_heartbeat(self, task_id):
+        """停止任務的租約心跳線程
+        
+        參數:
+            task_id (str): 任務 ID
+        """
+        with self.heartbeat_lock:
+            stop_event = self.heartbeats.pop(task_id, None)
+        if stop_event is not None:
+            stop_event.set()
+    
+    def _requeue_task(self, task):
+        """把工作進程崩潰時中斷的任務放回等待隊列
+        
+        參數:
+            task (dict): 任務信息
+        """
+        self._stop_heartbeat(task['id'])
+        self.task_store.requeue(task['id'], task.get('attempts'), claimed_by=task.get('claimed_by'))
+        self.task_available.set()
+    
+    def _maintain_task_store(self):
+        """定期維護任務存儲
+        
+        把心跳超過租約時間的處理中任務放回等待隊列，並刪除超過保留期限或數量上限的已結束任務。
+        """
+        now = time.time()
+        if now - self.last_stale_check < 60:
+            return
+        self.last_stale_check = now
+        
+        try:
+            self.task_store.requeue_stale(self.task_lease)
+        except Exception as e:
+            self.logger.warning(f"檢查超時任務時出錯: {e}")
+            
+        self.prune_finished_tasks()
+            
+    def prune_finished_tasks(self):
+        """刪除超過保留期限或數量上限的已結束任務及其寫到磁碟的輸入
+        
+        返回:
+            int: 刪除的任務數量
+        """
+        try:
+            removed = self.task_store.prune_finished(self.finished_ttl, self.max_finished_tasks)
+        except Exception as e:
+            self.logger.warning(f"清理已結束任務時出錯: {e}")
+            return 0
+            
+        for task in removed:
+            payload_file = task.get('payload_file')
+            if payload_file and os.path.exists(payload_file):
+                try:
+                    os.remove(payload_file)
+                except OSError as e:
+                    self.logger.warning(f"刪除任務輸入文件失敗: {payload_file}, {e}")
                     
-                # 標記任務完成
-                self.task_queue.task_done()
-                
-            except queue.Empty:
-                # 隊列為空，繼續等待
+        if removed:
+            self.logger.info(f"已清理 {len(removed)} 個已結束的任務")
+        return len(removed)
+    
+    def _compact_fields(self, task_id, fields, spill_keys):
+        """把已結束任務的大型字段寫到磁碟，記錄中只保留文件路徑
+        
+        參數:
+            task_id (str): 任務 ID
+            fields (dict): 即將寫入任務存儲的字段（會被原地修改）
+            spill_keys (iterable): 要寫到磁碟的字段名稱
+        """
+        payload = {key: fields[key] for key in spill_keys if fields.get(key) is not None}
+        if not self.compact_finished or not payload:
+            return
+            
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            payload_file = os.path.join(self.spill_dir, f"{task_id}.json")
+            with open(payload_file, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False, default=str)
+        except Exception as e:
+            self.logger.warning(f"寫出任務輸入失敗，保留在任務記錄中: {task_id}, {e}")
+            return
+            
+        for key in payload:
+            fields[key] = None
+        fields['payload_file'] = payload_file
+        
+    def _load_payload(self, task):
+        """讀回已寫到磁碟的任務字段
+        
+        參數:
+            task (dict): 任務記錄（會被原地修改）
+            
+        返回:
+            dict: 任務記錄
+        """
+        payload_file = task.get('payload_file')
+        if not payload_file or not os.path.exists(payload_file):
+            return task
+            
+        try:
+            with open(payload_file, 'r', encoding='utf-8') as f:
+                for key, value in json.load(f).items():
+                    if task.get(key) is None:
+                        task[key] = value
+        except Exception as e:
+            self.logger.warning(f"讀取任務輸入失敗: {payload_file}, {e}")
+        return task
+    
+    def get_registry_stats(self):
+        """獲取任務存儲的大小估算
+        
+        返回:
+            dict: 任務數量（按狀態）、估算位元組數、寫到磁碟的輸入大小與保留策略
+        """
+        stats = self.task_store.usage()
+        
+        spilled_files = 0
+        spilled_bytes = 0
+        if os.path.isdir(self.spill_dir):
+            for entry in os.scandir(self.spill_dir):
+                if entry.is_file():
+                    spilled_files += 1
+                    spilled_bytes += entry.stat().st_size
+                    
+        stats.update({
+            'spilled_files': spilled_files,
+            'spilled_bytes': spilled_bytes,
+            'finished_ttl_seconds': self.finished_ttl,
+            'max_finished': self.max_finished_tasks
+        })
+        return stats
+    
+    def get_data_cache_stats(self):
+        """獲取進程內行情數據緩存統計
+        
+        返回:
+            dict: 緩存統計（含分鐘級數據的指標流統計），未啟用時 enabled 為 False
+        """
+        if self.stock_collector.memory_cache is None:
+            return {'enabled': False, 'indicator_streams': self.stock_collector.get_indicator_stream_stats()}
+        return {'enabled': True, **self.stock_collector.memory_cache.stats(),
+                'indicator_streams': self.stock_collector.get_indicator_stream_stats()}
+    
+    def get_cache_stats(self):
+        """獲取磁碟緩存統計（各命名空間的使用量、上限與清理結果）
+        
+        返回:
+            dict: 緩存統計
+        """
+        return self.cache_manager.stats()
+    
+    def get_warmup_status(self):
+        """獲取預熱排程狀態
+        
+        返回:
+            dict: 排程狀態，未啟用時返回 {'enabled': False}
+        """
+        if self.warmup_scheduler is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.warmup_scheduler.status()}
+    
+    def _warm_workers(self):
+        """預熱完成後通知工作進程預熱進程內狀態（線程模式的工作者與主進程共用狀態，不需通知）"""
+        if self.worker_pool:
+            notified = self.worker_pool.warm_workers()
+            self.logger.info(f"已通知 {notified} 個工作進程預熱")
+    
+    def run_warmup(self):
+        """立即在背景執行一次預熱
+        
+        返回:
+            bool: 是否已啟動
+        """
+        if self.warmup_scheduler is None:
+            self.logger.warning("預熱排程未啟用")
+            return False
+        return self.warmup_scheduler.run_in_background()
+    
+    def _recover_orphaned_tasks(self):
+        """重新排隊由本機上已不存在的進程領取的處理中任務（例如服務重啟）"""
+        hostname = socket.gethostname()
+        
+        try:
+            for task in self.task_store.list_tasks(status='processing'):
+                parts = (task.get('claimed_by') or '').split(':')
+                if len(parts) < 2 or parts[0] != hostname or not parts[1].isdigit():
+                    continue
+                    
+                pid = int(parts[1])
+                try:
+                    os.kill(pid, 0)
+                    continue
+                except ProcessLookupError:
+                    pass
+                except PermissionError:
+                    continue
+                    
+                self.logger.warning(f"重新排隊中斷的任務: {task['id']}")
+                self.task_store.requeue(task['id'], claimed_by=task['claimed_by'])
+        except Exception as e:
+            self.logger.warning(f"恢復中斷任務時出錯: {e}")
+    
+    def _task_worker(self, stats):
+        """任務處理線程
+        
+        參數:
+            stats (dict): 本線程的使用率統計
+        """
+        runner = StockVideoTaskRunner(self.config)
+        runner.warm_up()
+        
+        # 讓出時執行互動任務所用的執行器（與批次任務的組件狀態分開），首次需要時建立
+        preempt_runners = []
+        
+        def get_preempt_runner():
+            if not preempt_runners:
+                preempt_runners.append(StockVideoTaskRunner(self.config))
+            return preempt_runners[0]
+        
+        while self.is_worker_running:
+            task = self._next_task(timeout=1.0)
+            if task is None:
                 continue
                 
-            except Exception as e:
-                self.logger.error(f"處理任務時出錯: {e}")
-                if 'task' in locals() and task:
-                    task['status'] = 'failed'
-                    task['error'] = str(e)
-                    self.tasks[task['id']] = task
+            stats['current_task'] = task['id']
+            stats['busy_since'] = time.time()
+            
+            checkpoint = None
+            if self.preempt_batch and task.get('priority', 1) >= self.PRIORITY_CLASSES['batch']:
+                checkpoint = self._make_preemption_checkpoint(task, get_preempt_runner)
+            
+            self._process_stock_video_task(task, runner, checkpoint)
+            
+            stats['busy_time'] += time.time() - stats['busy_since']
+            stats['busy_since'] = None
+            stats['current_task'] = None
+            if task['status'] == 'completed':
+                stats['tasks_completed'] += 1
+            else:
+                stats['tasks_failed'] += 1
     
-    def _process_stock_video_task(self, task):
+    def _make_preemption_checkpoint(self, task, get_runner):
+        """建立批次任務的階段邊界回調
+        
+        批次任務在沒有執行中階段的邊界（例如數據與語音都已完成、渲染尚未開始）上，
+        先在同一個工作者上處理所有等待中的互動任務，使編輯器預覽不必等待長時間的批次任務結束；
+        批次任務的階段仍在執行時不讓出，互動任務不會與渲染等階段在同一個工作者上同時執行。
+        只用於 thread 模式；process 模式的工作進程不在階段邊界讓出，
+        互動任務的優先處理依靠 workers.reserved_interactive 保留的空閒進程（預設 0，即不保留）。
+        
+        參數:
+            task (dict): 批次任務信息
+            get_runner (callable): 返回用於執行互動任務的任務執行器
+            
+        返回:
+            callable: 階段邊界回調
+        """
+        def checkpoint():
+            while self.is_worker_running:
+                urgent = self._next_task(timeout=0, max_priority=self.PRIORITY_CLASSES['interactive'])
+                if urgent is None:
+                    return
+                    
+                self.logger.info(f"批次任務 {task['id']} 讓出給互動任務 {urgent['id']}")
+                self.task_store.update(task['id'], {'progress_message': "暫停以處理互動任務"}, claimed_by=task['claimed_by'])
+                self._process_stock_video_task(urgent, get_runner())
+                
+        return checkpoint
+    
+    def _process_stock_video_task(self, task, runner, checkpoint=None):
         """處理股票視頻生成任務
         
         參數:
             task (dict): 任務信息
+            runner (StockVideoTaskRunner): 本工作者的任務執行器
+            checkpoint (callable, 可選): 階段邊界回調
         """
+        cancel_token = CancellationToken()
+        self.cancel_tokens[task['id']] = cancel_token
+        
         try:
-            ticker = task['ticker']
-            subtitles = task['subtitles']
-            options = task['options']
+            result, timings = runner.run(
+                task,
+                lambda progress, message: self._update_task_progress(task['id'], progress, message, task['claimed_by']),
+                cancel_token,
+                checkpoint
+            )
+            task['timings'] = timings
+            self._finish_task(task, result, None)
             
-            # 更新進度
-            self._update_task_progress(task['id'], 5, "獲取股票數據")
+        except TaskCancelled:
+            self._finish_task(task, None, "任務已取消")
             
-            # 獲取股票數據
-            stock_data = self.stock_collector.get_stock_data(ticker)
-            if stock_data is None or stock_data.empty:
-                raise ValueError(f"無法獲取股票數據: {ticker}")
-                
-            # 處理股票數據
-            self._update_task_progress(task['id'], 10, "處理股票數據")
-            processed_data = self.data_processor.process_stock_data(stock_data)
+        except Exception as e:
+            self.logger.error(f"生成股票視頻時出錯: {e}")
+            self._finish_task(task, None, str(e))
             
-            # 生成字幕文件
-            self._update_task_progress(task['id'], 15, "生成字幕文件")
-            subtitle_file = None
-            if subtitles:
-                subtitle_format = options.get('subtitle_format', 'srt')
-                subtitle_file = os.path.join(self.output_dir, f"{ticker}_subtitles.{subtitle_format}")
-                
-                if subtitle_format == 'srt':
-                    self.subtitle_manager.export_to_srt(subtitles, subtitle_file)
-                elif subtitle_format == 'vtt':
-                    self.subtitle_manager.export_to_vtt(subtitles, subtitle_file)
-                else:
-                    self.logger.warning(f"不支援的字幕格式: {subtitle_format}")
-            
-            # 生成音頻
-            self._update_task_progress(task['id'], 20, "生成語音")
-            audio_files = []
-            if subtitles and options.get('enable_tts', True):
-                # 設置 TTS 引擎
-                tts_engine = options.get('tts_engine', 'azure')
-                tts_voice = options.get('tts_voice', 'zh-TW-YunJheNeural')
-                tts_rate = float(options.get('tts_rate', 1.0))
-                
-                self.tts_controller.set_engine(tts_engine)
-                self.tts_controller.set_voice(tts_voice)
-                self.tts_controller.set_speech_rate(tts_rate)
-                
-                # 批量生成語音
-                audio_files = self.tts_controller.batch_generate_speech(
-                    subtitles,
-                    os.path.join(self.output_dir, 'audio'),
-                    f"{ticker}_speech"
-                )
-            
-            # 合併音頻
-            self._update_task_progress(task['id'], 30, "合併音頻")
-            merged_audio = None
-            if audio_files:
-                # 準備音頻文件和時間點
-                audio_with_times = []
-                for i, audio_file in enumerate(audio_files):
-                    if i < len(subtitles):
-                        audio_with_times.append((audio_file, subtitles[i]['startTime']))
-                
-                # 合併音頻
-                merged_audio = self.sync_manager.merge_audio_files(
-                    audio_with_times,
-                    os.path.join(self.output_dir, f"{ticker}_merged_audio.mp3")
-                )
-            
-            # 處理數位人
-            digital_human_video = None
-            if options.get('enable_digital_human', False):
-                self._update_task_progress(task['id'], 40, "生成數位人視頻")
-                template_name = options.get('digital_human_template', 'default_avatar')
-                
-                if merged_audio:
-                    digital_human_video = self.digital_human.generate_video(
-                        template_name,
-                        merged_audio,
-                        os.path.join(self.output_dir, f"{ticker}_digital_human.mp4")
-                    )
-            
-            # 生成股票視頻
-            self._update_task_progress(task['id'], 60, "生成股票視頻")
-            stock_video = self.video_generator.create_stock_video(
-                processed_data,
-                subtitles,
-                merged_audio,
-                os.path.join(self.output_dir, f"{ticker}_stock_video.mp4"),
-                digital_human_video
-            )
+        finally:
+            self.cancel_tokens.pop(task['id'], None)
+            
+    def _signal_cancel(self, task_id):
+        """通知正在本進程中處理指定任務的工作者停止
+        
+        參數:
+            task_id (str): 任務 ID
+        """
+        cancel_token = self.cancel_tokens.get(task_id)
+        if cancel_token is not None:
+            cancel_token.cancel()
+        if self.worker_pool:
+            self.worker_pool.cancel_task(task_id)
             
-            if not stock_video:
-                raise ValueError("生成股票視頻失敗")
+    def _watch_cancellations(self):
+        """定期檢查本進程正在處理的任務是否已在任務存儲中被取消"""
+        while self.is_worker_running:
+            running = list(self.cancel_tokens)
+            if self.worker_pool:
+                running += self.worker_pool.running_task_ids()
                 
-            # 創建時間軸數據
-            self._update_task_progress(task['id'], 90, "完成視頻生成")
-            timeline = self.sync_manager.create_timeline(subtitles, audio_files)
-            
-            # 保存時間軸
-            timeline_file = os.path.join(self.output_dir, f"{ticker}_timeline.json")
-            self.sync_manager.save_timeline(timeline_file)
-            
-            # 完成任務
-            task['status'] = 'completed'
-            task['progress'] = 100
-            task['result'] = {
-                'video_file': stock_video,
-                'subtitle_file': subtitle_file,
-                'audio_file': merged_audio,
-                'timeline_file': timeline_file,
-                'digital_human_video': digital_human_video
-            }
+            for task_id in running:
+                try:
+                    task = self.task_store.get(task_id)
+                    if task is not None and task['status'] == 'cancelled':
+                        self._signal_cancel(task_id)
+                except Exception as e:
+                    self.logger.warning(f"檢查任務取消狀態時出錯: {e}")
+                    
+            time.sleep(1.0)
             
-            self.tasks[task['id']] = task
-            self.logger.info(f"股票視頻生成任務完成: {task['id']}")
+    def _finish_task(self, task, result, error):
+        """記錄任務的最終結果
+        
+        參數:
+            task (dict): 任務信息
+            result (dict): 任務結果，失敗時為 None
+            error (str): 錯誤消息，成功時為 None
+        """
+        self._stop_heartbeat(task['id'])
+        
+        current = self.task_store.get(task['id'])
+        if current is None or current['status'] == 'cancelled':
+            self.logger.info(f"任務已取消，忽略結果: {task['id']}")
+            task['status'] = 'cancelled'
+            return
+        
+        # 租約已失去（超時後被重新排隊並由其他工作者領取）：結果由目前的領取者發佈
+        if current.get('claimed_by') != task.get('claimed_by'):
+            self.logger.warning(f"任務已由其他工作者領取，忽略結果: {task['id']}")
+            task['status'] = 'superseded'
+            return
             
-        except Exception as e:
-            self.logger.error(f"生成股票視頻時出錯: {e}")
-            task['status'] = 'failed'
-            task['error'] = str(e)
-            self.tasks[task['id']] = task
+        if error is not None:
+            fields = {'status': 'failed', 'error': error}
+        else:
+            fields = {'status': 'completed', 'progress': 100, 'result': result}
+            # 在標記完成前寫入緩存，之後提交的相同任務可以直接命中
+            if self.artifact_store and task.get('fingerprint'):
+                self.artifact_store.put(task['fingerprint'], result)
+            total = task.get('timings', {}).get('total', 0)
+            self.logger.info(f"股票視頻生成任務完成: {task['id']} (總耗時 {total:.2f} 秒)")
+            
+        fields['timings'] = task.get('timings', {})
+        fields['subtitles'] = task.get('subtitles')
+        fields['options'] = task.get('options')
+        fields['finished_at'] = time.time()
+        
+        # 只保留精簡記錄（狀態、耗時、輸出路徑），字幕與選項寫到磁碟
+        task.update(fields)
+        self._compact_fields(task['id'], fields, ('subtitles', 'options'))
+        if not self.task_store.update(task['id'], fields, claimed_by=task.get('claimed_by')):
+            self.logger.warning(f"任務已由其他工作者領取，忽略結果: {task['id']}")
+            task['status'] = 'superseded'
+            return
+        self.progress_broker.publish(task['id'], fields['status'], fields.get('progress'),
+                                     error=fields.get('error'), result=fields.get('result'))
     
-    def _update_task_progress(self, task_id, progress, message):
+    def _update_task_progress(self, task_id, progress, message, claimed_by):
         """更新任務進度
         
+        只在任務仍由此領取者持有時寫入：已被取代或過期的工作者不會覆寫他人重新領取的任務進度。
+        
         參數:
             task_id (str): 任務 ID
             progress (int): 進度百分比 (0-100)
             message (str): 進度消息
+            claimed_by (str): 領取者標識（與完成任務時相同）
         """
-        if task_id in self.tasks:
-            task = self.tasks[task_id]
-            task['progress'] = progress
-            task['progress_message'] = message
-            self.tasks[task_id] = task
-            
+        if self.task_store.update(task_id, {'progress': progress, 'progress_message': message}, claimed_by=claimed_by):
             self.logger.debug(f"任務 {task_id} 進度更新: {progress}%, {message}")
+            self.progress_broker.publish(task_id, 'processing', progress, message)
     
     def get_task_status(self, task_id):
         """獲取任務狀態
@@ -359,9 +870,36 @@ class MainController:
         返回:
             dict: 任務狀態
         """
-        if task_id in self.tasks:
-            return self.tasks[task_id]
-        return None
+        task = self.task_store.get(task_id)
+        return self._load_payload(task) if task else None
+    
+    def stream_task_progress(self, task_id):
+        """訂閱任務進度推送
+        
+        參數:
+            task_id (str): 任務 ID
+            
+        返回:
+            generator: Server-Sent Events 文本，任務結束時停止；任務不存在時返回 None
+        """
+        if self.task_store.get(task_id) is None:
+            return None
+        return self.progress_broker.subscribe(task_id)
+    
+    def poll_task_progress(self, task_id, cursor=None, timeout=None):
+        """長輪詢任務進度（每個請求最多佔用 WSGI 線程 poll_timeout 秒）
+        
+        參數:
+            task_id (str): 任務 ID
+            cursor (str, 可選): 上次返回的游標
+            timeout (float, 可選): 最長等待秒數
+            
+        返回:
+            dict: 游標、進度快照與是否結束；任務不存在時返回 None
+        """
+        if self.task_store.get(task_id) is None:
+            return None
+        return self.progress_broker.poll(task_id, cursor, timeout)
     
     def get_all_tasks(self):
         """獲取所有任務
@@ -369,7 +907,7 @@ class MainController:
         返回:
             list: 任務列表
         """
-        return list(self.tasks.values())
+        return self.task_store.list_tasks()
     
     def cancel_task(self, task_id):
         """取消任務
@@ -380,11 +918,19 @@ class MainController:
         返回:
             bool: 是否成功
         """
-        if task_id in self.tasks:
-            task = self.tasks[task_id]
+        task = self.task_store.get(task_id)
+        if task:
             if task['status'] in ['waiting', 'processing']:
-                task['status'] = 'cancelled'
-                self.tasks[task_id] = task
+                fields = {
+                    'status': 'cancelled',
+                    'finished_at': time.time(),
+                    'subtitles': task.get('subtitles'),
+                    'options': task.get('options')
+                }
+                self._compact_fields(task_id, fields, ('subtitles', 'options'))
+                self.task_store.update(task_id, fields)
+                self.progress_broker.publish(task_id, 'cancelled', task.get('progress'), "任務已取消")
+                self._signal_cancel(task_id)
                 self.logger.info(f"任務已取消: {task_id}")
                 return True
         return False
@@ -453,13 +999,22 @@ class MainController:
         """
         task_ids = []
         
+        # 先合併下載所有股票與市場指數數據，之後分發的任務直接命中緩存
+        if self.batch_planner:
+            try:
+                self.batch_planner.prepare(batch_data)
+            except Exception as e:
+                self.logger.warning(f"批次數據預取失敗，各任務將自行獲取數據: {e}")
+        
         for item in batch_data:
             task_type = item.get('type')
             
             if task_type == 'stock_video':
                 ticker = item.get('ticker')
                 subtitles = item.get('subtitles')
-                options = item.get('options')
+                # 批次提交的任務預設使用批次優先級
+                options = dict(item.get('options') or {})
+                options.setdefault('priority_class', 'batch')
                 
                 task_id = self.generate_stock_video(ticker, subtitles, options)
                 if task_id:
@@ -474,16 +1029,18 @@ class MainController:
                 
                 # 儲存結果為任務
                 if result:
-                    task_id = f"task_{datetime.now().strftime('%Y%m%d%H%M%S')}_article"
+                    task_id = f"task_{datetime.now().strftime('%Y%m%d%H%M%S')}_article_{uuid.uuid4().hex[:6]}"
                     task = {
                         'id': task_id,
                         'type': 'article_process',
                         'status': 'completed',
                         'progress': 100,
                         'result': result,
-                        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                        'finished_at': time.time()
                     }
-                    self.tasks[task_id] = task
+                    self._compact_fields(task_id, task, ('result',))
+                    self.task_store.add(task)
                     task_ids.append(task_id)
             else:
                 self.logger.warning(f"未知的任務類型: {task_type}")
@@ -543,6 +1100,8 @@ class MainController:
     def search_stock(self, keyword):
         """搜索股票
         
+        在本地代碼表中按代碼或名稱搜索，最新價格只從已緩存的數據附加，不下載歷史數據。
+        
         參數:
             keyword (str): 關鍵字或股票代碼
             
@@ -550,30 +1109,69 @@ class MainController:
             list: 搜索結果
         """
         try:
-            # 如果關鍵字看起來像股票代碼，則直接搜索
-            if len(keyword) <= 5 and (keyword.isalpha() or keyword.isdigit()):
-                try:
-                    stock_data = self.stock_collector.get_stock_data(keyword)
-                    if stock_data is not None and not stock_data.empty:
-                        return [{
-                            'ticker': keyword,
-                            'name': stock_data.attrs.get('name', keyword),
-                            'market': stock_data.attrs.get('market', 'unknown'),
-                            'last_price': stock_data['Close'].iloc[-1],
-                            'change': stock_data['Close'].iloc[-1] - stock_data['Close'].iloc[-2],
-                            'change_percent': (stock_data['Close'].iloc[-1] / stock_data['Close'].iloc[-2] - 1) * 100
-                        }]
-                except Exception as e:
-                    self.logger.warning(f"直接搜索股票失敗: {e}")
-            
-            # 使用關鍵字搜索
+            keyword = keyword.strip()
             search_results = self.stock_collector.search_stocks(keyword)
-            return search_results
+            if search_results:
+                return search_results
+                
+            # 代碼表中沒有的代碼：看起來像股票代碼時原樣返回（附加已緩存的價格）
+            if re.fullmatch(r'\^?[A-Za-z0-9\-]{1,6}(\.[A-Za-z]{1,3})?', keyword):
+                ticker = keyword.upper()
+                result = {'ticker': ticker, 'market': self._guess_market(ticker), 'name': ticker, 'name_zh': '', 'score': 0}
+                result.update(self.stock_collector.get_cached_quote(ticker) or {})
+                return [result]
+                
+            return []
             
         except Exception as e:
             self.logger.error(f"搜索股票時出錯: {e}")
             return []
     
+    def _guess_market(self, ticker):
+        """按代碼後綴推斷市場
+        
+        參數:
+            ticker (str): 股票代碼
+            
+        返回:
+            str: 市場 (TW, HK, US)
+        """
+        if ticker.endswith(('.TW', '.TWO')):
+            return 'TW'
+        if ticker.endswith('.HK'):
+            return 'HK'
+        return 'US'
+    
+    def compare_stocks(self, tickers, period='1y', output_file=None):
+        """比較多檔股票的相對表現與相關性（所有股票數據以一次分組下載獲取）
+        
+        參數:
+            tickers (list): 股票代碼列表
+            period (str): 時間範圍
+            output_file (str, 可選): 比較圖表的輸出文件路徑
+            
+        返回:
+            dict: 比較結果 (chart, correlation)，失敗時返回 None
+        """
+        tickers = [t.strip().upper() for t in tickers if t and t.strip()]
+        if len(tickers) < 2:
+            self.logger.error("需要至少兩檔股票進行比較")
+            return None
+            
+        try:
+            frames = self.stock_collector.get_many(tickers, period=period)
+            stock_data_list = [(data, ticker) for ticker, data in frames.items()
+                               if data is not None and not data.empty]
+            
+            return {
+                'chart': self.data_processor.compare_stocks(stock_data_list, output_file),
+                'correlation': self.data_processor.correlation_analysis(stock_data_list)
+            }
+            
+        except Exception as e:
+            self.logger.error(f"比較股票時出錯: {e}")
+            return None
+    
     def generate_report(self, ticker, period='1y', report_type='basic'):
         """生成報告
         
@@ -716,13 +1314,7 @@ class MainController:
         # 獲取市場指數
         market_data = None
         try:
-            index_symbol = "^GSPC"  # S&P 500
-            if ticker.endswith('.TW'):
-                index_symbol = "^TWII"  # 台灣加權指數
-            elif ticker.endswith('.HK'):
-                index_symbol = "^HSI"  # 恆生指數
-                
-            market_data = self.stock_collector.get_market_index(index_symbol)
+            market_data = self.stock_collector.get_market_index(market_index_for(ticker))
         except Exception as e:
             self.logger.warning(f"獲取市場指數失敗: {e}")
         
@@ -739,5 +1331,8 @@ class MainController:
     
     def shutdown(self):
         """關閉控制器"""
+        if self.warmup_scheduler:
+            self.warmup_scheduler.stop()
         self.stop_task_worker()
+        self.cache_manager.stop()
         self.logger.info("控制器已關閉")
\ No newline at end of file
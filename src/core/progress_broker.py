@@ -0,0 +1,532 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 任務進度推送
+"""
+
+import json
+import math
+import time
+import zlib
+import asyncio
+import logging
+import threading
+
+# 任務結束時推送的事件類型
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+def event_cursor(event):
+    """計算進度快照的游標（內容摘要，相同快照在任何進程中得到相同游標）
+
+    參數:
+        event (dict): 進度快照
+
+    返回:
+        str: 游標
+    """
+    encoded = json.dumps(event, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{zlib.crc32(encoded.encode('utf-8')):08x}"
+
+def task_event(task_id, task):
+    """把任務記錄轉為進度快照
+
+    參數:
+        task_id (str): 任務 ID
+        task (dict): 任務記錄，為 None 時表示任務不存在
+
+    返回:
+        dict: 進度快照
+    """
+    if task is None:
+        return {'task_id': task_id, 'status': 'not_found'}
+    event = {'task_id': task_id, 'status': task.get('status')}
+    if task.get('progress') is not None:
+        event['progress'] = task.get('progress')
+    if task.get('progress_message') is not None:
+        event['message'] = task.get('progress_message')
+    if task.get('status') in TERMINAL_STATUSES:
+        event.update({'error': task.get('error'), 'result': task.get('result')})
+    return event
+
+def is_terminal(event):
+    """進度快照是否為最後一個事件（任務已結束或不存在）"""
+    return event['status'] in TERMINAL_STATUSES or event['status'] == 'not_found'
+
+def sse_message(version, event):
+    """把進度快照格式化為 SSE 文本
+
+    參數:
+        version (int): 事件編號
+        event (dict): 進度快照
+
+    返回:
+        str: SSE 文本
+    """
+    name = 'done' if is_terminal(event) else 'progress'
+    return f"id: {version}\nevent: {name}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+def parse_timeout(value):
+    """解析長輪詢的 timeout 參數
+
+    參數:
+        value (str): 參數值
+
+    返回:
+        float: 秒數，不是有效數字時返回 None
+    """
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(timeout) else timeout
+
+class ProgressBroker:
+    """任務進度推送中心
+
+    每個任務一個頻道，頻道只保存最新的進度快照與版本號。
+    發佈進度只更新快照並喚醒等待中的訂閱者，訂閱者醒來後讀取最新快照，
+    因此訂閱者數量不影響發佈成本，中間的更新會被合併，推送頻率不超過 min_interval。
+
+    在其他進程中處理的任務不會在本進程發佈進度，頻道在一段時間沒有更新時
+    由其中一個訂閱者讀取任務存儲並代為發佈，同一任務的所有訂閱者共用這次讀取。
+
+    長輪詢 poll() 每個請求最多等待 poll_timeout 秒，以客戶端帶回的游標（快照摘要）判斷是否有新進度，
+    游標與頻道及進程無關，請求可以落在任何一個進程上。
+
+    本類在 WSGI 線程中等待，每個連線佔用一個線程，適合開發伺服器與少量訂閱者；
+    大量訂閱者由 AsyncProgressBroker（src/routes/progress_asgi.py 的 ASGI 端點）以協程服務。
+    """
+
+    def __init__(self, task_getter=None, config=None):
+        """初始化進度推送中心
+
+        參數:
+            task_getter (callable, 可選): 讀取任務記錄 (任務 ID) -> dict，用於跨進程的進度
+            config (dict, 可選): 設定 (min_interval, heartbeat, store_poll, poll_timeout)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.task_getter = task_getter
+        self.min_interval = float(self.config.get('min_interval', 0.5))
+        self.heartbeat = float(self.config.get('heartbeat', 15))
+        self.store_poll = float(self.config.get('store_poll', 2.0))
+        self.poll_timeout = float(self.config.get('poll_timeout', 25))
+
+        self.lock = threading.Lock()
+        self.channels = {}
+
+    def publish(self, task_id, status, progress=None, message=None, **extra):
+        """發佈任務進度
+
+        參數:
+            task_id (str): 任務 ID
+            status (str): 任務狀態
+            progress (int, 可選): 進度百分比
+            message (str, 可選): 進度消息
+            **extra: 其他字段（例如 error、result）
+        """
+        with self.lock:
+            channel = self.channels.get(task_id)
+            if channel is None:
+                # 沒有訂閱者時不保留頻道，訂閱時會從任務存儲讀取初始狀態
+                return
+            self._update_channel(channel, task_id, status, progress, message, extra)
+
+    def subscribe(self, task_id):
+        """訂閱任務進度（Server-Sent Events 格式）
+
+        參數:
+            task_id (str): 任務 ID
+
+        返回:
+            generator: 逐條產生 SSE 文本，任務結束時停止
+        """
+        channel = self._acquire(task_id)
+
+        # 以任務存儲中的當前狀態作為第一個事件
+        self._refresh_from_store(task_id, channel)
+
+        return self._stream(task_id, channel)
+
+    def poll(self, task_id, cursor=None, timeout=None):
+        """長輪詢任務進度
+
+        快照與游標不同時立即返回，否則等待新進度直到逾時。
+
+        參數:
+            task_id (str): 任務 ID
+            cursor (str, 可選): 上次返回的游標，為空時立即返回當前快照
+            timeout (float, 可選): 最長等待秒數，預設為 poll_timeout（不超過 poll_timeout）
+
+        返回:
+            dict: {'cursor': 新游標, 'event': 進度快照（逾時時為 None）, 'done': 任務是否已結束}
+        """
+        timeout = self.poll_timeout if timeout is None else max(0.0, min(float(timeout), self.poll_timeout))
+        deadline = time.time() + timeout
+        channel = self._acquire(task_id)
+
+        try:
+            self._refresh_from_store(task_id, channel)
+            while True:
+                with self.lock:
+                    event = channel['event']
+                    if event is not None and event_cursor(event) != cursor:
+                        return {'cursor': event_cursor(event), 'event': event, 'done': is_terminal(event)}
+
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return {'cursor': cursor, 'event': None, 'done': False}
+                    channel['condition'].wait(timeout=min(remaining, self.store_poll))
+                    stale = time.time() - channel['last_update'] >= self.store_poll
+
+                if stale:
+                    self._refresh_from_store(task_id, channel)
+        finally:
+            self._release(task_id, channel)
+
+    def subscriber_count(self, task_id=None):
+        """獲取訂閱者數量
+
+        參數:
+            task_id (str, 可選): 任務 ID，為 None 時返回所有任務的總數
+
+        返回:
+            int: 訂閱者數量
+        """
+        with self.lock:
+            if task_id is not None:
+                channel = self.channels.get(task_id)
+                return channel['subscribers'] if channel else 0
+            return sum(channel['subscribers'] for channel in self.channels.values())
+
+    def _acquire(self, task_id):
+        """取得任務頻道並登記一個訂閱者
+
+        參數:
+            task_id (str): 任務 ID
+
+        返回:
+            dict: 頻道
+        """
+        with self.lock:
+            channel = self.channels.get(task_id)
+            if channel is None:
+                channel = {
+                    'condition': threading.Condition(self.lock),
+                    'version': 0,
+                    'event': None,
+                    'subscribers': 0,
+                    'last_update': 0.0
+                }
+                self.channels[task_id] = channel
+            channel['subscribers'] += 1
+        return channel
+
+    def _release(self, task_id, channel):
+        """註銷一個訂閱者，沒有訂閱者時移除頻道
+
+        參數:
+            task_id (str): 任務 ID
+            channel (dict): 頻道
+        """
+        with self.lock:
+            channel['subscribers'] -= 1
+            if channel['subscribers'] <= 0 and self.channels.get(task_id) is channel:
+                del self.channels[task_id]
+
+    def _update_channel(self, channel, task_id, status, progress, message, extra):
+        """更新頻道快照並喚醒訂閱者（需持有鎖）"""
+        event = {'task_id': task_id, 'status': status}
+        if progress is not None:
+            event['progress'] = progress
+        if message is not None:
+            event['message'] = message
+        event.update(extra)
+        self._set_event(channel, event)
+
+    def _set_event(self, channel, event):
+        """快照有變化時更新頻道並喚醒訂閱者（需持有鎖）"""
+        if event == channel['event']:
+            return
+
+        channel['event'] = event
+        channel['version'] += 1
+        channel['last_update'] = time.time()
+        channel['condition'].notify_all()
+
+    def _refresh_from_store(self, task_id, channel):
+        """從任務存儲讀取任務狀態並發佈（用於其他進程處理的任務）
+
+        參數:
+            task_id (str): 任務 ID
+            channel (dict): 頻道
+        """
+        if self.task_getter is None:
+            return
+
+        with self.lock:
+            # 其他訂閱者剛讀取過或本進程剛發佈過
+            if channel['version'] and time.time() - channel['last_update'] < self.store_poll:
+                return
+            channel['last_update'] = time.time()
+
+        try:
+            task = self.task_getter(task_id)
+        except Exception as e:
+            self.logger.warning(f"讀取任務狀態失敗: {task_id}, {e}")
+            return
+
+        with self.lock:
+            self._set_event(channel, task_event(task_id, task))
+
+    def _stream(self, task_id, channel):
+        """產生 SSE 事件
+
+        參數:
+            task_id (str): 任務 ID
+            channel (dict): 頻道
+
+        返回:
+            generator: SSE 文本
+        """
+        seen_version = 0
+        last_sent = 0.0
+        last_write = time.time()
+
+        try:
+            while True:
+                with self.lock:
+                    # 等待新版本（或需要心跳、讀取任務存儲）
+                    if channel['version'] == seen_version:
+                        channel['condition'].wait(timeout=min(self.store_poll, self.heartbeat))
+                    version = channel['version']
+                    event = channel['event']
+
+                now = time.time()
+
+                if version != seen_version and event is not None:
+                    terminal = is_terminal(event)
+
+                    # 合併更新：距離上次推送不足 min_interval 時稍後推送最新快照
+                    if not terminal and now - last_sent < self.min_interval:
+                        time.sleep(self.min_interval - (now - last_sent))
+                        continue
+
+                    seen_version = version
+                    last_sent = last_write = time.time()
+                    yield sse_message(version, event)
+
+                    if terminal:
+                        return
+                    continue
+
+                if now - last_write >= self.heartbeat:
+                    last_write = now
+                    yield ": keep-alive\n\n"
+
+                if now - channel['last_update'] >= self.store_poll:
+                    self._refresh_from_store(task_id, channel)
+        finally:
+            self._release(task_id, channel)
+
+class AsyncProgressBroker:
+    """協程版的任務進度推送中心（用於 ASGI 伺服器）
+
+    每個訂閱者是事件迴圈中的一個協程而不是一個線程，單個進程可以同時服務大量 SSE 連線與長輪詢。
+    進度一律從任務存儲讀取（任務在其他進程中處理）：每個有訂閱者的任務只有一個讀取協程，
+    每 store_poll 秒在線程池中讀取一次任務記錄，同一任務的所有訂閱者共用這次讀取。
+    事件格式與游標和 ProgressBroker 相同，客戶端可以在兩者之間切換。
+    """
+
+    def __init__(self, task_getter, config=None):
+        """初始化協程版進度推送中心
+
+        參數:
+            task_getter (callable): 讀取任務記錄 (任務 ID) -> dict（同步函數，在線程池中執行）
+            config (dict, 可選): 設定 (min_interval, heartbeat, store_poll, poll_timeout)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.task_getter = task_getter
+        self.min_interval = float(self.config.get('min_interval', 0.5))
+        self.heartbeat = float(self.config.get('heartbeat', 15))
+        self.store_poll = float(self.config.get('store_poll', 2.0))
+        self.poll_timeout = float(self.config.get('poll_timeout', 25))
+
+        self.channels = {}
+
+    async def get_task(self, task_id):
+        """在線程池中讀取任務記錄
+
+        參數:
+            task_id (str): 任務 ID
+
+        返回:
+            dict: 任務記錄，不存在時返回 None
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.task_getter, task_id)
+
+    async def subscribe(self, task_id):
+        """訂閱任務進度（Server-Sent Events 格式）
+
+        參數:
+            task_id (str): 任務 ID
+
+        返回:
+            async generator: 逐條產生 SSE 文本，任務結束時停止
+        """
+        channel = self._acquire(task_id)
+        seen_version = 0
+        last_sent = 0.0
+
+        try:
+            while True:
+                if not await self._wait_version(channel, seen_version, self.heartbeat):
+                    yield ": keep-alive\n\n"
+                    continue
+
+                event = channel['event']
+                terminal = is_terminal(event)
+
+                # 合併更新：距離上次推送不足 min_interval 時稍後推送最新快照
+                wait = self.min_interval - (time.monotonic() - last_sent)
+                if not terminal and wait > 0:
+                    await asyncio.sleep(wait)
+                    event = channel['event']
+                    terminal = is_terminal(event)
+
+                seen_version = channel['version']
+                last_sent = time.monotonic()
+                yield sse_message(seen_version, event)
+
+                if terminal:
+                    return
+        finally:
+            self._release(task_id, channel)
+
+    async def poll(self, task_id, cursor=None, timeout=None):
+        """長輪詢任務進度
+
+        參數:
+            task_id (str): 任務 ID
+            cursor (str, 可選): 上次返回的游標，為空時立即返回當前快照
+            timeout (float, 可選): 最長等待秒數，預設為 poll_timeout（不超過 poll_timeout）
+
+        返回:
+            dict: {'cursor': 新游標, 'event': 進度快照（逾時時為 None）, 'done': 任務是否已結束}
+        """
+        timeout = self.poll_timeout if timeout is None else max(0.0, min(float(timeout), self.poll_timeout))
+        deadline = time.monotonic() + timeout
+        channel = self._acquire(task_id)
+
+        try:
+            seen_version = 0
+            while True:
+                # 第一個快照至少等待一次讀取任務存儲的時間，之後最多等待到截止時間
+                remaining = deadline - time.monotonic()
+                wait = remaining if seen_version else max(remaining, self.store_poll)
+                if not await self._wait_version(channel, seen_version, wait):
+                    return {'cursor': cursor, 'event': None, 'done': False}
+
+                event = channel['event']
+                seen_version = channel['version']
+                if event_cursor(event) != cursor:
+                    return {'cursor': event_cursor(event), 'event': event, 'done': is_terminal(event)}
+                if is_terminal(event):
+                    return {'cursor': cursor, 'event': None, 'done': True}
+        finally:
+            self._release(task_id, channel)
+
+    def subscriber_count(self, task_id=None):
+        """獲取訂閱者數量
+
+        參數:
+            task_id (str, 可選): 任務 ID，為 None 時返回所有任務的總數
+
+        返回:
+            int: 訂閱者數量
+        """
+        if task_id is not None:
+            channel = self.channels.get(task_id)
+            return channel['subscribers'] if channel else 0
+        return sum(channel['subscribers'] for channel in self.channels.values())
+
+    def _acquire(self, task_id):
+        """取得任務頻道並登記一個訂閱者，新頻道啟動讀取任務存儲的協程
+
+        參數:
+            task_id (str): 任務 ID
+
+        返回:
+            dict: 頻道
+        """
+        channel = self.channels.get(task_id)
+        if channel is None:
+            channel = {
+                'condition': asyncio.Condition(),
+                'version': 0,
+                'event': None,
+                'subscribers': 0
+            }
+            channel['reader'] = asyncio.ensure_future(self._read_store(task_id, channel))
+            self.channels[task_id] = channel
+        channel['subscribers'] += 1
+        return channel
+
+    def _release(self, task_id, channel):
+        """註銷一個訂閱者，沒有訂閱者時停止讀取並移除頻道
+
+        參數:
+            task_id (str): 任務 ID
+            channel (dict): 頻道
+        """
+        channel['subscribers'] -= 1
+        if channel['subscribers'] <= 0 and self.channels.get(task_id) is channel:
+            del self.channels[task_id]
+            channel['reader'].cancel()
+
+    async def _wait_version(self, channel, seen_version, timeout):
+        """等待頻道出現新版本
+
+        參數:
+            channel (dict): 頻道
+            seen_version (int): 已看到的版本
+            timeout (float): 最長等待秒數
+
+        返回:
+            bool: 是否有新版本
+        """
+        if channel['version'] != seen_version:
+            return True
+        if timeout is not None and timeout <= 0:
+            return False
+        condition = channel['condition']
+        try:
+            async with condition:
+                await asyncio.wait_for(condition.wait_for(lambda: channel['version'] != seen_version), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _read_store(self, task_id, channel):
+        """定期讀取任務記錄並更新頻道，任務結束或沒有訂閱者時停止
+
+        參數:
+            task_id (str): 任務 ID
+            channel (dict): 頻道
+        """
+        while True:
+            try:
+                event = task_event(task_id, await self.get_task(task_id))
+            except Exception as e:
+                self.logger.warning(f"讀取任務狀態失敗: {task_id}, {e}")
+            else:
+                if event != channel['event']:
+                    async with channel['condition']:
+                        channel['event'] = event
+                        channel['version'] += 1
+                        channel['condition'].notify_all()
+                if is_terminal(event):
+                    return
+            await asyncio.sleep(self.store_poll)
@@ -10,9 +10,10 @@ import json
 import logging
 import numpy as np
 from datetime import datetime
-from pydub import AudioSegment
 import subprocess
 
+from src.data.cache_manager import get_cache_manager
+
 class SyncManager:
     """同步管理器
     
@@ -33,6 +34,7 @@ class SyncManager:
         
         # 確保臨時目錄存在
         os.makedirs(self.temp_dir, exist_ok=True)
+        get_cache_manager().register('temp', self.temp_dir, owner='sync_manager', expire_days=1)
         
     def create_timeline(self, subtitles, audio_files=None, video_segments=None):
         """創建項目時間軸
@@ -72,9 +74,18 @@ class SyncManager:
         
         # 添加音頻軌道
         if audio_files:
+            # 合成時已知的音頻時長（例如由書籤偏移得到）
+            known_durations = {
+                sub['audio_file']: sub['audio_duration']
+                for sub in (subtitles or [])
+                if sub.get('audio_file') and sub.get('audio_duration')
+            }
+            
             for i, audio_file in enumerate(audio_files):
-                # 獲取音頻時長
-                audio_duration = self._get_audio_duration(audio_file)
+                # 獲取音頻時長（優先使用已知時長，避免重新解碼）
+                audio_duration = known_durations.get(audio_file)
+                if audio_duration is None:
+                    audio_duration = self._get_audio_duration(audio_file)
                 
                 # 如果字幕和音頻一一對應
                 start_time = 0
@@ -148,13 +159,15 @@ class SyncManager:
         """合併多個音頻文件
         
         參數:
-            audio_files (list): 音頻文件列表 [(文件路徑, 開始時間), ...]
+            audio_files (list): 音頻文件列表 [(文件路徑, 開始時間), ...]，
+                可附加已知時長 [(文件路徑, 開始時間, 時長), ...]，與解碼得到的時長取較大者
             output_file (str, 可選): 輸出文件路徑
             crossfade (float): 交叉淡入淡出時間（秒）
             
         返回:
             str: 合併後的音頻文件路徑
         """
+        from pydub import AudioSegment
         if not audio_files:
             self.logger.warning("沒有音頻文件可合併")
             return None
@@ -168,26 +181,33 @@ class SyncManager:
             # 根據開始時間排序音頻文件
             sorted_audio = sorted(audio_files, key=lambda x: x[1])
             
-            # 計算總時長
+            # 解碼每個音頻一次，同時計算總時長
+            segments = []
             max_end_time = 0
-            for file_path, start_time in sorted_audio:
-                if os.path.exists(file_path):
-                    audio_duration = self._get_audio_duration(file_path)
-                    max_end_time = max(max_end_time, start_time + audio_duration)
+            for item in sorted_audio:
+                file_path, start_time = item[0], item[1]
+                if not os.path.exists(file_path):
+                    continue
+                try:
+                    audio = AudioSegment.from_file(file_path)
+                except Exception as e:
+                    self.logger.error(f"處理音頻文件時出錯: {file_path}, {e}")
+                    continue
+                # 已知時長比解碼結果短時以解碼結果為準，避免疊加時截斷最後一段
+                audio_duration = len(audio) / 1000.0
+                if len(item) > 2 and item[2]:
+                    audio_duration = max(item[2], audio_duration)
+                max_end_time = max(max_end_time, start_time + audio_duration)
+                segments.append((audio, start_time))
             
             # 創建空白背景
             total_duration_ms = int(max_end_time * 1000)  # 轉換為毫秒
             merged_audio = AudioSegment.silent(duration=total_duration_ms)
             
             # 疊加每個音頻
-            for file_path, start_time in sorted_audio:
-                if os.path.exists(file_path):
-                    try:
-                        audio = AudioSegment.from_file(file_path)
-                        position_ms = int(start_time * 1000)
-                        merged_audio = merged_audio.overlay(audio, position=position_ms)
-                    except Exception as e:
-                        self.logger.error(f"處理音頻文件時出錯: {file_path}, {e}")
+            for audio, start_time in segments:
+                position_ms = int(start_time * 1000)
+                merged_audio = merged_audio.overlay(audio, position=position_ms)
             
             # 導出合併後的音頻
             merged_audio.export(output_file, format="mp3")
@@ -532,6 +552,7 @@ class SyncManager:
         返回:
             float: 時長（秒）
         """
+        from pydub import AudioSegment
         try:
             audio = AudioSegment.from_file(file_path)
             return len(audio) / 1000.0  # 轉換為秒
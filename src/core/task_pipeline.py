@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 任務流水線
+"""
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src.utils.cancellation import TaskCancelled
+
+class TaskPipeline:
+    """任務流水線
+
+    以依賴圖描述任務的各個階段，依賴已完成的階段會立即並行執行，
+    使網路密集（語音合成）與 CPU 密集（視頻渲染）的階段能夠重疊。
+    """
+
+    def __init__(self, name, max_workers=4):
+        """初始化任務流水線
+
+        參數:
+            name (str): 流水線名稱（用於日誌）
+            max_workers (int): 同時執行的最大階段數
+        """
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.stages = {}  # 階段名稱 -> (函數, 依賴列表, 權重)
+        self.results = {}
+        self.timings = {}
+
+    def add_stage(self, name, func, depends_on=None, weight=1):
+        """添加階段
+
+        參數:
+            name (str): 階段名稱
+            func (callable): 階段函數，接收已完成階段的結果字典，返回本階段結果
+            depends_on (list, 可選): 依賴的階段名稱
+            weight (int): 進度權重
+        """
+        depends_on = list(depends_on or [])
+        for dep in depends_on:
+            if dep not in self.stages:
+                raise ValueError(f"階段 {name} 依賴未定義的階段: {dep}")
+
+        self.stages[name] = (func, depends_on, weight)
+
+    def run(self, on_stage_start=None, on_stage_done=None, cancel_token=None, checkpoint=None):
+        """執行流水線
+
+        任一階段失敗時不再啟動新的階段，等待執行中的階段結束後拋出第一個錯誤。
+        取消令牌被觸發時同樣停止啟動新的階段（執行中的階段自行檢查令牌），並拋出 TaskCancelled。
+
+        參數:
+            on_stage_start (callable, 可選): 階段開始回調 (階段名稱)
+            on_stage_done (callable, 可選): 階段完成回調 (階段名稱, 已完成權重, 總權重)
+            cancel_token (CancellationToken, 可選): 取消令牌
+            checkpoint (callable, 可選): 階段邊界回調，在沒有執行中的階段、啟動後續階段前調用
+                （可在其中讓出給更緊急的工作）
+
+        返回:
+            dict: 各階段結果
+        """
+        total_weight = sum(weight for _, _, weight in self.stages.values()) or 1
+        done_weight = 0
+        pending = dict(self.stages)
+        running = {}
+        error = None
+        started_at = time.time()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='stage') as executor:
+            while pending or running:
+                if error is None and cancel_token is not None and cancel_token.is_cancelled:
+                    self.logger.info(f"流水線 {self.name} 已取消")
+                    error = TaskCancelled("任務已取消")
+
+                # 提交所有依賴已完成的階段
+                if error is None:
+                    ready = [name for name, (_, depends_on, _) in pending.items()
+                             if all(dep in self.results for dep in depends_on)]
+                    # 只在沒有執行中的階段時讓出（真正的階段邊界），避免讓出的工作與本任務的階段同時執行
+                    if ready and not running and checkpoint is not None and self.results:
+                        checkpoint()
+
+                    for name, (func, depends_on, _) in list(pending.items()):
+                        if all(dep in self.results for dep in depends_on):
+                            del pending[name]
+                            if on_stage_start:
+                                on_stage_start(name)
+                            self.timings[name] = {'start': time.time() - started_at}
+                            running[executor.submit(func, self.results)] = name
+
+                if not running:
+                    if pending and error is None:
+                        raise RuntimeError(f"流水線 {self.name} 存在無法滿足的依賴: {', '.join(pending)}")
+                    break
+
+                # 有取消令牌時定期醒來檢查
+                finished, _ = wait(running, timeout=0.2 if cancel_token is not None else None,
+                                   return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    timing = self.timings[name]
+                    timing['duration'] = time.time() - started_at - timing['start']
+
+                    try:
+                        self.results[name] = future.result()
+                    except TaskCancelled as e:
+                        if error is None or not isinstance(error, TaskCancelled):
+                            error = e
+                        continue
+                    except Exception as e:
+                        self.logger.error(f"流水線 {self.name} 階段失敗: {name}, {e}")
+                        if error is None:
+                            error = e
+                        continue
+
+                    done_weight += self.stages[name][2]
+                    self.logger.debug(f"流水線 {self.name} 階段完成: {name} ({timing['duration']:.2f} 秒)")
+                    if on_stage_done:
+                        on_stage_done(name, done_weight, total_weight)
+
+        self.timings['total'] = {'start': 0.0, 'duration': time.time() - started_at}
+
+        if error is not None:
+            raise error
+
+        return self.results
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 任務執行器
+"""
+
+import os
+import logging
+
+from src.core.subtitle_manager import SubtitleManager
+from src.core.tts_controller import TTSController
+from src.core.sync_manager import SyncManager
+from src.core.task_pipeline import TaskPipeline
+from src.core.task_workspace import TaskWorkspace
+from src.data.stock_collector import StockDataCollector
+from src.data.data_processor import DataProcessor
+from src.media.video_generator import VideoGenerator
+from src.media.digital_human import DigitalHuman
+from src.utils.cancellation import TaskCancelled, LinkedCancellationToken
+
+class StockVideoTaskRunner:
+    """股票視頻任務執行器
+
+    持有執行一個視頻任務所需的全部組件，每個工作者（線程或進程）各自建立一份，
+    使視頻生成器、數據處理器與數位人模板在多個任務之間保持熱啟動狀態。
+    """
+
+    # 各階段的進度消息
+    STAGE_MESSAGES = {
+        'fetch_data': "獲取股票數據",
+        'process_data': "處理股票數據",
+        'subtitles': "生成字幕文件",
+        'tts': "生成語音",
+        'merge_audio': "合併音頻",
+        'digital_human': "生成數位人視頻",
+        'render': "生成股票視頻",
+        'mux': "合成音頻與視頻",
+        'timeline': "完成視頻生成"
+    }
+
+    # 任務結果中屬於最終輸出的字段，成功後從暫存目錄移到輸出目錄
+    OUTPUT_KEYS = ('video_file', 'subtitle_file', 'audio_file', 'timeline_file', 'digital_human_video')
+
+    def __init__(self, config=None):
+        """初始化任務執行器
+
+        參數:
+            config (dict, 可選): 配置設定（與主控制器相同的結構）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.output_dir = self.config.get('output_dir', 'output')
+        self.workspace_config = self.config.get('workspace', {})
+
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self.subtitle_manager = SubtitleManager()
+        self.tts_controller = TTSController(self.config.get('tts', {}))
+        self.sync_manager = SyncManager()
+        self.stock_collector = StockDataCollector(self.config.get('api_keys', {}), self.config.get('data', {}))
+        self.data_processor = DataProcessor()
+        self.video_generator = VideoGenerator(self.config.get('video', {}))
+        self.digital_human = DigitalHuman(self.config.get('digital_human', {}))
+
+        self.templates = {}
+
+    def warm_up(self):
+        """預先載入模板等可重用資源"""
+        try:
+            self.templates = {t['name']: t for t in self.digital_human.list_templates()}
+        except Exception as e:
+            self.logger.warning(f"載入數位人模板失敗: {e}")
+
+    def run(self, task, progress_callback=None, cancel_token=None, checkpoint=None):
+        """執行股票視頻生成任務
+
+        各階段以依賴圖執行：股票數據、字幕文件與語音合成互不依賴，
+        視頻畫面渲染只需要股票數據，只有最後的音視頻合成需要等待合併後的音頻，
+        因此每個視頻的耗時接近 max(語音合成, 渲染) 而非兩者之和。
+
+        中間文件寫在任務專屬的暫存目錄，成功後只有最終輸出移到輸出目錄下的 <任務 ID> 子目錄
+        （同一股票的並行任務不會互相覆寫），無論成功、失敗或取消，暫存目錄都會被刪除。
+        暫存用量在階段執行期間持續監控，超過上限時中止任務並拋出 WorkspaceQuotaExceeded。
+
+        參數:
+            task (dict): 任務信息（id、ticker、subtitles、options）
+            progress_callback (callable, 可選): 進度回調 (進度百分比, 消息)
+            cancel_token (CancellationToken, 可選): 取消令牌，傳給語音合成、幀生成、編碼與 ffmpeg，
+                取消時刪除已產生的部分輸出並拋出 TaskCancelled
+            checkpoint (callable, 可選): 階段邊界回調，用於讓出給更高優先級的任務
+
+        返回:
+            tuple: (結果字典, 各階段耗時字典)，失敗時拋出異常
+        """
+        def report(progress, message):
+            if progress_callback:
+                progress_callback(progress, message)
+
+        workspace = TaskWorkspace(task['id'], self.workspace_config)
+        workspace.create()
+        # 用量監控透過內部令牌中止任務，不改變外部令牌的取消狀態
+        task_token = LinkedCancellationToken(cancel_token)
+        pipeline = self._build_stock_video_pipeline(task, workspace, task_token)
+        last_progress = [5]
+
+        # 進度：5% 起始，各階段按權重推進到 95%
+        def on_stage_start(name):
+            report(last_progress[0], self.STAGE_MESSAGES.get(name, name))
+
+        def on_stage_done(name, done_weight, total_weight):
+            last_progress[0] = 5 + int(90 * done_weight / total_weight)
+            report(last_progress[0], self.STAGE_MESSAGES.get(name, name))
+
+        report(5, "開始處理任務")
+        failed = True
+        try:
+            workspace.start_monitor(task_token)
+            try:
+                results = pipeline.run(on_stage_start, on_stage_done, task_token, checkpoint)
+            finally:
+                workspace.stop_monitor()
+
+            timings = {name: round(t['duration'], 3) for name, t in pipeline.timings.items()}
+            result = {
+                'video_file': results['mux'],
+                'subtitle_file': results['subtitles'],
+                'audio_file': results['merge_audio'],
+                'timeline_file': results['timeline'],
+                'digital_human_video': results.get('digital_human')
+            }
+            output_dir = workspace.output_dir(self.output_dir)
+            for key in self.OUTPUT_KEYS:
+                result[key] = workspace.publish(result[key], output_dir)
+
+            failed = False
+            self.logger.info(f"任務暫存峰值用量: {task['id']}, {workspace.peak_bytes / 1024 / 1024:.1f} MB")
+            return result, timings
+        except TaskCancelled:
+            if workspace.quota_error is not None and not (cancel_token is not None and cancel_token.is_cancelled):
+                raise workspace.quota_error from None
+            self.logger.info(f"任務已取消，清理暫存文件: {task['id']}")
+            raise
+        finally:
+            workspace.cleanup(failed)
+
+    def _build_stock_video_pipeline(self, task, workspace, cancel_token=None):
+        """建立股票視頻任務的階段依賴圖
+
+        預設的依賴圖中畫面渲染只依賴數據處理，與語音合成並行，總耗時約為 max(語音合成, 渲染) 加上合成階段；
+        字幕文件與合成階段的字幕燒入等待語音合成。只有 burn_subtitles_in_render 選項會讓渲染等待語音合成。
+
+        參數:
+            task (dict): 任務信息
+            workspace (TaskWorkspace): 任務暫存工作區（中間文件與最終輸出都先寫在這裡）
+            cancel_token (CancellationToken, 可選): 取消令牌
+
+        返回:
+            TaskPipeline: 任務流水線
+        """
+        ticker = task['ticker']
+        subtitles = task['subtitles'] or []
+        options = task['options'] or {}
+        enable_tts = bool(subtitles) and options.get('enable_tts', True)
+
+        # 預設依合成時量測的音頻時長重排字幕（引擎提供時長時），字幕時間取決於語音合成結果。
+        # 畫面渲染不等待語音合成：渲染不含字幕的畫面，字幕在音視頻合成階段依最終時間燒入（需重新編碼一次）；
+        # burn_subtitles_in_render 為 True 時改為渲染前等待語音合成並直接繪製字幕（不能與語音合成並行）
+        align_option = options.get('align_subtitles_to_audio')
+        align_timing = enable_tts and align_option is not False
+        render_after_tts = align_timing and bool(options.get('burn_subtitles_in_render', False))
+        burn_at_mux = align_timing and not render_after_tts
+
+        pipeline = TaskPipeline(task['id'], max_workers=self.config.get('pipeline_workers', 4))
+
+        def fetch_data(results):
+            stock_data = self.stock_collector.get_stock_data(ticker)
+            if stock_data is None or stock_data.empty:
+                raise ValueError(f"無法獲取股票數據: {ticker}")
+            return stock_data
+
+        def process_data(results):
+            return self.data_processor.process_stock_data(results['fetch_data'])
+
+        def export_subtitles(results):
+            if not subtitles:
+                return None
+            subtitle_format = options.get('subtitle_format', 'srt')
+            subtitle_file = workspace.path(f"{ticker}_subtitles.{subtitle_format}")
+
+            if subtitle_format == 'srt':
+                self.subtitle_manager.export_to_srt(subtitles, subtitle_file)
+            elif subtitle_format == 'vtt':
+                self.subtitle_manager.export_to_vtt(subtitles, subtitle_file)
+            else:
+                self.logger.warning(f"不支援的字幕格式: {subtitle_format}")
+            return subtitle_file
+
+        def synthesize_speech(results):
+            if not enable_tts:
+                return []
+            # 設置 TTS 引擎
+            self.tts_controller.set_engine(options.get('tts_engine', 'azure'))
+            self.tts_controller.set_voice(options.get('tts_voice', 'zh-TW-YunJheNeural'))
+            self.tts_controller.set_speech_rate(float(options.get('tts_rate', 1.0)))
+
+            # 批量生成語音（可選擇依合成時取得的實際時長重排字幕時間）
+            return self.tts_controller.batch_generate_speech(
+                subtitles,
+                os.path.join(workspace.root, 'audio'),
+                f"{ticker}_speech",
+                align_timing=align_option,
+                cancel_token=cancel_token
+            )
+
+        def merge_audio(results):
+            audio_files = results['tts']
+            if not audio_files:
+                return None
+            # 準備音頻文件、時間點與合成時已知的時長
+            audio_with_times = []
+            for subtitle in subtitles:
+                if subtitle.get('audio_file') in audio_files:
+                    audio_with_times.append((
+                        subtitle['audio_file'],
+                        subtitle['startTime'],
+                        subtitle.get('audio_duration')
+                    ))
+            return self.sync_manager.merge_audio_files(
+                audio_with_times,
+                workspace.path(f"{ticker}_merged_audio.mp3")
+            )
+
+        def generate_digital_human(results):
+            merged_audio = results['merge_audio']
+            if not merged_audio:
+                return None
+            return self.digital_human.generate_video(
+                options.get('digital_human_template', 'default_avatar'),
+                merged_audio,
+                workspace.path(f"{ticker}_digital_human.mp4"),
+                cancel_token=cancel_token
+            )
+
+        # 畫面時長取自語音合成前的字幕（估計時間），音頻較長時由合成階段延長最後一幀
+        estimated_duration = self.video_generator.resolve_duration(subtitles)
+
+        def render(results):
+            duration = self.video_generator.resolve_duration(subtitles) if render_after_tts else estimated_duration
+            video_file = self.video_generator.render_video(
+                results['process_data'],
+                None if burn_at_mux else subtitles,
+                duration,
+                workspace.path(f"{ticker}_stock_video.mp4"),
+                cancel_token=cancel_token
+            )
+            if not video_file:
+                raise ValueError("生成股票視頻失敗")
+            return video_file
+
+        def mux(results):
+            video_file = results['render']
+            merged_audio = results['merge_audio']
+            subtitle_file = results['subtitles'] if burn_at_mux else None
+            if not merged_audio and not subtitle_file:
+                return video_file
+            output_with_audio = self.video_generator.mux_audio(
+                video_file,
+                merged_audio,
+                cancel_token=cancel_token,
+                subtitle_file=subtitle_file
+            )
+            return output_with_audio or video_file
+
+        def create_timeline(results):
+            timeline_file = workspace.path(f"{ticker}_timeline.json")
+            sync_manager = SyncManager()
+            sync_manager.create_timeline(subtitles, results['tts'])
+            sync_manager.save_timeline(timeline_file)
+            return timeline_file
+
+        def quota_checked(func):
+            # 監控線程按間隔檢查，階段結束時再檢查一次，避免短階段在兩次檢查之間超限
+            def stage(results):
+                value = func(results)
+                workspace.check_quota()
+                return value
+            return stage
+
+        pipeline.add_stage('fetch_data', fetch_data)
+        pipeline.add_stage('process_data', process_data, ['fetch_data'])
+        pipeline.add_stage('tts', quota_checked(synthesize_speech), weight=3)
+        pipeline.add_stage('subtitles', export_subtitles, ['tts'] if align_timing else None)
+        pipeline.add_stage('merge_audio', quota_checked(merge_audio), ['tts'])
+        if options.get('enable_digital_human', False):
+            pipeline.add_stage('digital_human', quota_checked(generate_digital_human), ['merge_audio'], weight=2)
+        pipeline.add_stage('render', quota_checked(render), ['process_data', 'tts'] if render_after_tts else ['process_data'], weight=4)
+        pipeline.add_stage('mux', quota_checked(mux), ['render', 'merge_audio', 'subtitles'] if burn_at_mux else ['render', 'merge_audio'])
+        pipeline.add_stage('timeline', create_timeline, ['tts'])
+
+        return pipeline
@@ -0,0 +1,799 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 任務存儲
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+# 由獨立欄位保存（可索引、可原子更新）的任務字段，其餘字段以 JSON 保存在 data 欄位
+TASK_COLUMNS = ('id', 'type', 'status', 'progress', 'progress_message', 'created_at',
+                'claimed_by', 'heartbeat_at', 'attempts', 'fingerprint',
+                'priority', 'user_id', 'enqueued_at', 'started_at', 'finished_at', 'payload_file')
+
+# 尚未結束的任務狀態
+ACTIVE_STATUSES = ('waiting', 'processing')
+
+# 已結束的任務狀態
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+# 未指定優先級的任務（數值越小越優先）
+DEFAULT_PRIORITY = 1
+
+def summarize_waits(waits):
+    """彙總排隊等待時間
+
+    參數:
+        waits (list): 等待秒數列表
+
+    返回:
+        dict: 數量、平均、p50、p95 與最大等待秒數
+    """
+    if not waits:
+        return {'count': 0, 'avg_wait': 0.0, 'p50_wait': 0.0, 'p95_wait': 0.0, 'max_wait': 0.0}
+
+    waits = sorted(waits)
+    return {
+        'count': len(waits),
+        'avg_wait': round(sum(waits) / len(waits), 3),
+        'p50_wait': round(waits[int(0.5 * (len(waits) - 1))], 3),
+        'p95_wait': round(waits[int(0.95 * (len(waits) - 1))], 3),
+        'max_wait': round(waits[-1], 3)
+    }
+
+def create_task_store(config=None):
+    """依配置建立任務存儲
+
+    參數:
+        config (dict, 可選): 任務存儲設定 (backend: sqlite/memory, path)
+
+    返回:
+        MemoryTaskStore 或 SQLiteTaskStore: 任務存儲
+    """
+    config = config or {}
+    backend = config.get('backend', 'sqlite')
+
+    if backend == 'memory':
+        return MemoryTaskStore()
+    if backend != 'sqlite':
+        logging.getLogger(__name__).warning(f"不支援的任務存儲: {backend}，使用 SQLite")
+
+    return SQLiteTaskStore(config.get('path', os.path.join(os.getcwd(), 'cache', 'tasks.db')))
+
+class MemoryTaskStore:
+    """記憶體任務存儲
+
+    任務只存在於當前進程，適用於單進程部署與測試。
+    """
+
+    def __init__(self):
+        """初始化記憶體任務存儲"""
+        self.logger = logging.getLogger(__name__)
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    def add(self, task):
+        """新增任務
+
+        參數:
+            task (dict): 任務信息，必須包含 id
+        """
+        with self.lock:
+            self._insert(task)
+
+    def add_unless_active(self, task):
+        """新增任務，除非已有相同指紋且尚未結束的任務
+
+        參數:
+            task (dict): 任務信息，包含 fingerprint
+
+        返回:
+            str: 新任務或已存在任務的 ID
+        """
+        with self.lock:
+            fingerprint = task.get('fingerprint')
+            if fingerprint:
+                for existing in self.tasks.values():
+                    if existing.get('fingerprint') == fingerprint and existing.get('status') in ACTIVE_STATUSES:
+                        return existing['id']
+
+            self._insert(task)
+            return task['id']
+
+    def _insert(self, task):
+        """寫入一個任務（需持有鎖）
+
+        參數:
+            task (dict): 任務信息
+        """
+        task = dict(task)
+        task.setdefault('attempts', 0)
+        task.setdefault('priority', DEFAULT_PRIORITY)
+        task.setdefault('enqueued_at', time.time())
+        task['queued_at'] = time.time()
+        self.tasks[task['id']] = task
+
+    def get(self, task_id):
+        """獲取任務
+
+        參數:
+            task_id (str): 任務 ID
+
+        返回:
+            dict: 任務信息的副本，不存在時返回 None
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            return dict(task) if task else None
+
+    def update(self, task_id, fields, claimed_by=None):
+        """更新任務字段
+
+        參數:
+            task_id (str): 任務 ID
+            fields (dict): 要更新的字段
+            claimed_by (str, 可選): 只在任務仍由此領取者持有時更新
+
+        返回:
+            bool: 任務是否存在（並由指定領取者持有）
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None or (claimed_by is not None and task.get('claimed_by') != claimed_by):
+                return False
+            task.update(fields)
+            return True
+
+    def list_tasks(self, status=None, limit=None):
+        """列出任務（按創建順序）
+
+        參數:
+            status (str, 可選): 只列出指定狀態的任務
+            limit (int, 可選): 最大數量
+
+        返回:
+            list: 任務列表
+        """
+        with self.lock:
+            tasks = [dict(t) for t in self.tasks.values() if status is None or t.get('status') == status]
+        tasks.sort(key=lambda t: t.get('queued_at', 0))
+        return tasks[:limit] if limit else tasks
+
+    def count(self, status=None):
+        """統計任務數量
+
+        參數:
+            status (str, 可選): 只統計指定狀態的任務
+
+        返回:
+            int: 任務數量
+        """
+        with self.lock:
+            return sum(1 for t in self.tasks.values() if status is None or t.get('status') == status)
+
+    def claim(self, worker_id, max_priority=None):
+        """原子地領取下一個等待中任務
+
+        先按優先級，同一優先級內優先選擇正在處理任務最少的用戶（公平分配），最後按提交順序。
+
+        參數:
+            worker_id (str): 領取者標識
+            max_priority (int, 可選): 只領取優先級數值不大於此值的任務
+
+        返回:
+            dict: 已標記為 processing 的任務副本，沒有等待中任務時返回 None
+        """
+        with self.lock:
+            waiting = [t for t in self.tasks.values() if t.get('status') == 'waiting'
+                       and (max_priority is None or t.get('priority', DEFAULT_PRIORITY) <= max_priority)]
+            if not waiting:
+                return None
+
+            running = {}
+            for t in self.tasks.values():
+                if t.get('status') == 'processing':
+                    running[t.get('user_id')] = running.get(t.get('user_id'), 0) + 1
+
+            task = min(waiting, key=lambda t: (t.get('priority', DEFAULT_PRIORITY),
+                                               running.get(t.get('user_id'), 0),
+                                               t.get('queued_at', 0)))
+            now = time.time()
+            task['status'] = 'processing'
+            task['claimed_by'] = worker_id
+            task['heartbeat_at'] = now
+            task['started_at'] = now
+            return dict(task)
+
+    def queue_metrics(self, window=3600):
+        """按優先級統計排隊情況
+
+        參數:
+            window (float): 統計最近多少秒內開始處理的任務
+
+        返回:
+            dict: 優先級 -> {waiting, oldest_wait, count, avg_wait, p50_wait, p95_wait, max_wait}
+        """
+        now = time.time()
+        waits = {}
+        waiting = {}
+
+        with self.lock:
+            for t in self.tasks.values():
+                priority = t.get('priority', DEFAULT_PRIORITY)
+                if t.get('status') == 'waiting':
+                    waiting.setdefault(priority, []).append(now - t.get('enqueued_at', now))
+                if t.get('started_at') and t.get('enqueued_at') and t['started_at'] >= now - window:
+                    waits.setdefault(priority, []).append(t['started_at'] - t['enqueued_at'])
+
+        metrics = {}
+        for priority in set(waits) | set(waiting):
+            metrics[priority] = summarize_waits(waits.get(priority, []))
+            metrics[priority]['waiting'] = len(waiting.get(priority, []))
+            metrics[priority]['oldest_wait'] = round(max(waiting.get(priority, [0])), 3)
+        return metrics
+
+    def requeue(self, task_id, attempts=None, claimed_by=None):
+        """把任務放回等待隊列
+
+        參數:
+            task_id (str): 任務 ID
+            attempts (int, 可選): 已嘗試次數
+            claimed_by (str, 可選): 只在任務仍由此領取者持有時放回
+
+        返回:
+            bool: 是否成功
+        """
+        fields = {'status': 'waiting', 'claimed_by': None, 'heartbeat_at': None}
+        if attempts is not None:
+            fields['attempts'] = attempts
+        return self.update(task_id, fields, claimed_by)
+
+    def heartbeat(self, task_id, claimed_by):
+        """續期處理中任務的租約
+
+        參數:
+            task_id (str): 任務 ID
+            claimed_by (str): 領取者標識
+
+        返回:
+            bool: 任務是否仍在處理中且由此領取者持有（False 表示租約已失去）
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None or task.get('status') != 'processing' or task.get('claimed_by') != claimed_by:
+                return False
+            task['heartbeat_at'] = time.time()
+            return True
+
+    def requeue_stale(self, lease_seconds):
+        """把心跳超時的處理中任務放回等待隊列（領取者已不存在）
+
+        參數:
+            lease_seconds (float): 心跳租約秒數
+
+        返回:
+            int: 重新排隊的任務數量
+        """
+        deadline = time.time() - lease_seconds
+        with self.lock:
+            stale = [t for t in self.tasks.values()
+                     if t.get('status') == 'processing' and (t.get('heartbeat_at') or 0) < deadline]
+            for task in stale:
+                task.update({'status': 'waiting', 'claimed_by': None, 'heartbeat_at': None})
+        return len(stale)
+
+    def delete(self, task_id):
+        """刪除任務
+
+        參數:
+            task_id (str): 任務 ID
+
+        返回:
+            bool: 任務是否存在
+        """
+        with self.lock:
+            return self.tasks.pop(task_id, None) is not None
+
+    def prune_finished(self, ttl_seconds=None, max_finished=None):
+        """刪除已結束的舊任務
+
+        參數:
+            ttl_seconds (float, 可選): 結束超過此秒數的任務會被刪除
+            max_finished (int, 可選): 最多保留的已結束任務數量（保留最近結束的）
+
+        返回:
+            list: 被刪除的任務 [{'id', 'payload_file'}, ...]
+        """
+        now = time.time()
+        with self.lock:
+            finished = sorted(
+                (t for t in self.tasks.values() if t.get('status') in FINISHED_STATUSES),
+                key=lambda t: t.get('finished_at') or 0,
+                reverse=True
+            )
+            removed = []
+            for index, task in enumerate(finished):
+                expired = ttl_seconds is not None and now - (task.get('finished_at') or 0) > ttl_seconds
+                overflow = max_finished is not None and index >= max_finished
+                if expired or overflow:
+                    del self.tasks[task['id']]
+                    removed.append({'id': task['id'], 'payload_file': task.get('payload_file')})
+        return removed
+
+    def usage(self):
+        """估算任務存儲的佔用
+
+        返回:
+            dict: 任務數量（按狀態）與估算位元組數
+        """
+        with self.lock:
+            tasks = list(self.tasks.values())
+
+        counts = {}
+        approx_bytes = 0
+        for task in tasks:
+            counts[task.get('status')] = counts.get(task.get('status'), 0) + 1
+            approx_bytes += len(json.dumps(task, ensure_ascii=False, default=str).encode('utf-8'))
+
+        return {'backend': 'memory', 'tasks': len(tasks), 'by_status': counts, 'approx_bytes': approx_bytes}
+
+class SQLiteTaskStore:
+    """SQLite 任務存儲
+
+    以 WAL 模式的 SQLite 數據庫保存任務狀態、進度與結果，同一台機器上的多個
+    進程（例如 gunicorn 的多個 worker）共享同一份任務，重啟後任務仍然保留。
+    狀態與進度保存在獨立欄位中，按主鍵查詢；領取任務在單個寫事務中完成，
+    同一任務只會被一個工作者領取。
+    """
+
+    def __init__(self, db_path):
+        """初始化 SQLite 任務存儲
+
+        參數:
+            db_path (str): 數據庫文件路徑
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = db_path
+        self.local = threading.local()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                type TEXT,
+                status TEXT NOT NULL,
+                progress INTEGER DEFAULT 0,
+                progress_message TEXT,
+                created_at TEXT,
+                claimed_by TEXT,
+                heartbeat_at REAL,
+                attempts INTEGER DEFAULT 0,
+                fingerprint TEXT,
+                priority INTEGER DEFAULT 1,
+                user_id TEXT,
+                enqueued_at REAL,
+                started_at REAL,
+                finished_at REAL,
+                payload_file TEXT,
+                data TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, seq);
+        """)
+
+        # 舊版數據庫缺少的欄位
+        existing = {row['name'] for row in conn.execute("PRAGMA table_info(tasks)")}
+        for column, definition in (('fingerprint', 'TEXT'), ('priority', 'INTEGER DEFAULT 1'),
+                                   ('user_id', 'TEXT'), ('enqueued_at', 'REAL'), ('started_at', 'REAL'),
+                                   ('finished_at', 'REAL'), ('payload_file', 'TEXT')):
+            if column not in existing:
+                conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {definition}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_fingerprint ON tasks (fingerprint, status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks (status, priority, seq)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user ON tasks (user_id, status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_finished ON tasks (finished_at)")
+
+        self.logger.info(f"任務存儲已開啟: {db_path}")
+
+    def _connect(self):
+        """獲取當前線程的數據庫連接
+
+        返回:
+            sqlite3.Connection: 數據庫連接
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self.local.conn = conn
+        return conn
+
+    @staticmethod
+    def _split(task):
+        """把任務字典拆分為欄位值與 JSON 數據
+
+        參數:
+            task (dict): 任務字段
+
+        返回:
+            tuple: (欄位字典, 其餘字段字典)
+        """
+        columns = {k: v for k, v in task.items() if k in TASK_COLUMNS}
+        extra = {k: v for k, v in task.items() if k not in TASK_COLUMNS}
+        return columns, extra
+
+    @staticmethod
+    def _row_to_task(row):
+        """把數據庫行轉換為任務字典
+
+        參數:
+            row (sqlite3.Row): 數據庫行
+
+        返回:
+            dict: 任務信息
+        """
+        task = json.loads(row['data']) if row['data'] else {}
+        for column in TASK_COLUMNS:
+            task[column] = row[column]
+        return task
+
+    def add(self, task):
+        """新增任務
+
+        參數:
+            task (dict): 任務信息，必須包含 id
+        """
+        self._insert(self._connect(), task)
+
+    def add_unless_active(self, task):
+        """新增任務，除非已有相同指紋且尚未結束的任務
+
+        查找與插入在同一個寫事務中完成，多個進程同時提交相同任務時只會建立一個。
+
+        參數:
+            task (dict): 任務信息，包含 fingerprint
+
+        返回:
+            str: 新任務或已存在任務的 ID
+        """
+        fingerprint = task.get('fingerprint')
+        if not fingerprint:
+            self.add(task)
+            return task['id']
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM tasks WHERE fingerprint = ? AND status IN (?, ?) ORDER BY seq LIMIT 1",
+                (fingerprint,) + ACTIVE_STATUSES
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return row['id']
+
+            self._insert(conn, task)
+            conn.execute("COMMIT")
+            return task['id']
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _insert(self, conn, task):
+        """寫入一個任務（新增或覆蓋）
+
+        參數:
+            conn (sqlite3.Connection): 數據庫連接
+            task (dict): 任務信息
+        """
+        columns, extra = self._split(task)
+        columns.setdefault('attempts', 0)
+        columns.setdefault('priority', DEFAULT_PRIORITY)
+        columns.setdefault('enqueued_at', time.time())
+        columns['data'] = json.dumps(extra, ensure_ascii=False, default=str)
+
+        names = ', '.join(columns)
+        placeholders = ', '.join('?' for _ in columns)
+        conn.execute(
+            f"INSERT OR REPLACE INTO tasks ({names}) VALUES ({placeholders})",
+            list(columns.values())
+        )
+
+    def get(self, task_id):
+        """獲取任務
+
+        參數:
+            task_id (str): 任務 ID
+
+        返回:
+            dict: 任務信息，不存在時返回 None
+        """
+        row = self._connect().execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._row_to_task(row) if row else None
+
+    def update(self, task_id, fields, claimed_by=None):
+        """更新任務字段
+
+        只更新欄位的修改（例如進度）直接寫入對應欄位，其餘字段在事務中合併到 JSON 數據。
+
+        參數:
+            task_id (str): 任務 ID
+            fields (dict): 要更新的字段
+            claimed_by (str, 可選): 只在任務仍由此領取者持有時更新
+
+        返回:
+            bool: 任務是否存在（並由指定領取者持有）
+        """
+        columns, extra = self._split(fields)
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if extra:
+                row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+                if row is None:
+                    conn.execute("ROLLBACK")
+                    return False
+                data = json.loads(row['data']) if row['data'] else {}
+                data.update(extra)
+                columns['data'] = json.dumps(data, ensure_ascii=False, default=str)
+
+            assignments = ', '.join(f"{name} = ?" for name in columns)
+            query = f"UPDATE tasks SET {assignments} WHERE id = ?"
+            params = list(columns.values()) + [task_id]
+            if claimed_by is not None:
+                query += " AND claimed_by = ?"
+                params.append(claimed_by)
+            cursor = conn.execute(query, params)
+            conn.execute("COMMIT")
+            return cursor.rowcount > 0
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def list_tasks(self, status=None, limit=None):
+        """列出任務（按創建順序）
+
+        參數:
+            status (str, 可選): 只列出指定狀態的任務
+            limit (int, 可選): 最大數量
+
+        返回:
+            list: 任務列表
+        """
+        query = "SELECT * FROM tasks"
+        params = []
+        if status is not None:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY seq"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+
+        return [self._row_to_task(row) for row in self._connect().execute(query, params)]
+
+    def count(self, status=None):
+        """統計任務數量
+
+        參數:
+            status (str, 可選): 只統計指定狀態的任務
+
+        返回:
+            int: 任務數量
+        """
+        if status is None:
+            row = self._connect().execute("SELECT COUNT(*) FROM tasks").fetchone()
+        else:
+            row = self._connect().execute("SELECT COUNT(*) FROM tasks WHERE status = ?", (status,)).fetchone()
+        return row[0]
+
+    def claim(self, worker_id, max_priority=None):
+        """原子地領取下一個等待中任務
+
+        先按優先級，同一優先級內優先選擇正在處理任務最少的用戶（公平分配），最後按提交順序。
+        選擇與標記在單個寫事務中完成。
+
+        參數:
+            worker_id (str): 領取者標識
+            max_priority (int, 可選): 只領取優先級數值不大於此值的任務
+
+        返回:
+            dict: 已標記為 processing 的任務，沒有等待中任務時返回 None
+        """
+        query = "SELECT t.seq FROM tasks t WHERE t.status = 'waiting'"
+        params = []
+        if max_priority is not None:
+            query += " AND COALESCE(t.priority, 1) <= ?"
+            params.append(max_priority)
+        query += (" ORDER BY COALESCE(t.priority, 1),"
+                  " (SELECT COUNT(*) FROM tasks r WHERE r.user_id IS t.user_id AND r.status = 'processing'),"
+                  " t.seq LIMIT 1")
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(query, params).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            now = time.time()
+            conn.execute(
+                "UPDATE tasks SET status = 'processing', claimed_by = ?, heartbeat_at = ?, started_at = ? WHERE seq = ?",
+                (worker_id, now, now, row['seq'])
+            )
+            claimed = conn.execute("SELECT * FROM tasks WHERE seq = ?", (row['seq'],)).fetchone()
+            conn.execute("COMMIT")
+            return self._row_to_task(claimed)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def queue_metrics(self, window=3600):
+        """按優先級統計排隊情況
+
+        參數:
+            window (float): 統計最近多少秒內開始處理的任務
+
+        返回:
+            dict: 優先級 -> {waiting, oldest_wait, count, avg_wait, p50_wait, p95_wait, max_wait}
+        """
+        now = time.time()
+        conn = self._connect()
+        waits = {}
+        for row in conn.execute(
+            "SELECT COALESCE(priority, 1), started_at - enqueued_at FROM tasks "
+            "WHERE started_at >= ? AND enqueued_at IS NOT NULL",
+            (now - window,)
+        ):
+            waits.setdefault(row[0], []).append(row[1])
+
+        waiting = {}
+        for row in conn.execute(
+            "SELECT COALESCE(priority, 1), COUNT(*), MIN(enqueued_at) FROM tasks "
+            "WHERE status = 'waiting' GROUP BY 1"
+        ):
+            waiting[row[0]] = (row[1], now - row[2] if row[2] else 0.0)
+
+        metrics = {}
+        for priority in set(waits) | set(waiting):
+            metrics[priority] = summarize_waits(waits.get(priority, []))
+            count, oldest = waiting.get(priority, (0, 0.0))
+            metrics[priority]['waiting'] = count
+            metrics[priority]['oldest_wait'] = round(oldest, 3)
+        return metrics
+
+    def requeue(self, task_id, attempts=None, claimed_by=None):
+        """把任務放回等待隊列
+
+        參數:
+            task_id (str): 任務 ID
+            attempts (int, 可選): 已嘗試次數
+            claimed_by (str, 可選): 只在任務仍由此領取者持有時放回
+
+        返回:
+            bool: 是否成功
+        """
+        fields = {'status': 'waiting', 'claimed_by': None, 'heartbeat_at': None}
+        if attempts is not None:
+            fields['attempts'] = attempts
+        return self.update(task_id, fields, claimed_by)
+
+    def heartbeat(self, task_id, claimed_by):
+        """續期處理中任務的租約
+
+        參數:
+            task_id (str): 任務 ID
+            claimed_by (str): 領取者標識
+
+        返回:
+            bool: 任務是否仍在處理中且由此領取者持有（False 表示租約已失去）
+        """
+        cursor = self._connect().execute(
+            "UPDATE tasks SET heartbeat_at = ? WHERE id = ? AND status = 'processing' AND claimed_by = ?",
+            (time.time(), task_id, claimed_by)
+        )
+        return cursor.rowcount > 0
+
+    def requeue_stale(self, lease_seconds):
+        """把心跳超時的處理中任務放回等待隊列（領取者已不存在）
+
+        參數:
+            lease_seconds (float): 心跳租約秒數
+
+        返回:
+            int: 重新排隊的任務數量
+        """
+        cursor = self._connect().execute(
+            "UPDATE tasks SET status = 'waiting', claimed_by = NULL, heartbeat_at = NULL "
+            "WHERE status = 'processing' AND COALESCE(heartbeat_at, 0) < ?",
+            (time.time() - lease_seconds,)
+        )
+        if cursor.rowcount:
+            self.logger.warning(f"已重新排隊 {cursor.rowcount} 個心跳超時的任務")
+        return cursor.rowcount
+
+    def delete(self, task_id):
+        """刪除任務
+
+        參數:
+            task_id (str): 任務 ID
+
+        返回:
+            bool: 任務是否存在
+        """
+        cursor = self._connect().execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+        return cursor.rowcount > 0
+
+    def prune_finished(self, ttl_seconds=None, max_finished=None):
+        """刪除已結束的舊任務
+
+        參數:
+            ttl_seconds (float, 可選): 結束超過此秒數的任務會被刪除
+            max_finished (int, 可選): 最多保留的已結束任務數量（保留最近結束的）
+
+        返回:
+            list: 被刪除的任務 [{'id', 'payload_file'}, ...]
+        """
+        conditions = []
+        params = list(FINISHED_STATUSES)
+        if ttl_seconds is not None:
+            conditions.append("COALESCE(finished_at, 0) < ?")
+            params.append(time.time() - ttl_seconds)
+        if max_finished is not None:
+            conditions.append(
+                "seq NOT IN (SELECT seq FROM tasks WHERE status IN (?, ?, ?) "
+                "ORDER BY COALESCE(finished_at, 0) DESC LIMIT ?)"
+            )
+            params.extend(FINISHED_STATUSES)
+            params.append(int(max_finished))
+        if not conditions:
+            return []
+
+        query = (f"SELECT seq, id, payload_file FROM tasks WHERE status IN (?, ?, ?) "
+                 f"AND ({' OR '.join(conditions)})")
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(query, params).fetchall()
+            conn.executemany("DELETE FROM tasks WHERE seq = ?", [(row['seq'],) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return [{'id': row['id'], 'payload_file': row['payload_file']} for row in rows]
+
+    def usage(self):
+        """估算任務存儲的佔用
+
+        返回:
+            dict: 任務數量（按狀態）、任務數據位元組數與數據庫文件大小
+        """
+        conn = self._connect()
+        counts = {row[0]: row[1] for row in conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")}
+        approx_bytes = conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM tasks").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+
+        return {
+            'backend': 'sqlite',
+            'tasks': sum(counts.values()),
+            'by_status': counts,
+            'approx_bytes': approx_bytes,
+            'file_bytes': page_count * page_size
+        }
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 任務暫存工作區
+"""
+
+import os
+import re
+import shutil
+import logging
+import threading
+
+from src.data.cache_manager import get_cache_manager
+
+def default_scratch_dir(config=None):
+    """獲取磁碟上的暫存根目錄
+
+    參數:
+        config (dict, 可選): 工作區設定
+
+    返回:
+        str: 暫存根目錄
+    """
+    return (config or {}).get('scratch_dir', os.path.join(os.getcwd(), 'cache', 'scratch'))
+
+def register_scratch_namespace(config=None):
+    """把磁碟暫存目錄註冊為緩存命名空間
+
+    暫存目錄由任務自行刪除，緩存管理只統計用量並清理崩潰或保留的失敗任務留下的文件（預設 1 天）。
+
+    參數:
+        config (dict, 可選): 工作區設定 (scratch_dir, scratch_expire_days)
+    """
+    config = config or {}
+    scratch_dir = default_scratch_dir(config)
+    os.makedirs(scratch_dir, exist_ok=True)
+    get_cache_manager().register('scratch', scratch_dir, owner='task_workspace',
+                                 expire_days=config.get('scratch_expire_days', 1), evictable=False)
+
+class WorkspaceQuotaExceeded(Exception):
+    """任務暫存工作區超過磁碟用量上限"""
+
+class TaskWorkspace:
+    """任務暫存工作區
+
+    每個任務在獨立的暫存目錄中產生中間文件（逐句語音、無聲視頻、合併音頻等），
+    同一股票的並行任務不會互相覆寫。暫存目錄可設定在 tmpfs（例如 /dev/shm）上，
+    剩餘空間不足以容納一個任務的用量上限時退回磁碟上的暫存目錄。
+    任務執行期間由監控線程定期檢查用量，超過上限時立即中止任務，而不是等到階段結束。
+    任務成功後只有最終輸出以原子方式移到輸出目錄中該任務專屬的子目錄，其餘文件連同暫存目錄一併刪除。
+    """
+
+    def __init__(self, task_id, config=None):
+        """初始化任務暫存工作區
+
+        參數:
+            task_id (str): 任務 ID
+            config (dict, 可選): 工作區設定 (scratch_dir, tmpfs_dir, tmpfs_min_free_mb, max_task_disk_mb,
+                quota_check_seconds, keep_on_failure)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.task_id = task_id
+        self.max_bytes = float(self.config.get('max_task_disk_mb', 2048)) * 1024 * 1024
+        self.quota_check_seconds = float(self.config.get('quota_check_seconds', 2.0))
+        self.keep_on_failure = self.config.get('keep_on_failure', False)
+        self.peak_bytes = 0
+        self.quota_error = None
+        self.monitor_stop = None
+        self.monitor_thread = None
+
+        self.dir_name = re.sub(r'[^A-Za-z0-9_.-]', '_', str(task_id))
+        base_dir = self._select_base_dir()
+        self.root = os.path.join(base_dir, self.dir_name)
+
+    def _select_base_dir(self):
+        """選擇暫存目錄的位置（優先使用 tmpfs）
+
+        返回:
+            str: 暫存根目錄
+        """
+        scratch_dir = default_scratch_dir(self.config)
+        tmpfs_dir = self.config.get('tmpfs_dir')
+        if not tmpfs_dir:
+            return scratch_dir
+
+        try:
+            os.makedirs(tmpfs_dir, exist_ok=True)
+            usage = shutil.disk_usage(tmpfs_dir)
+            # 剩餘空間至少要容納一個任務的用量上限，否則任務在 tmpfs 上會先於配額檢查耗盡記憶體
+            min_free = max(float(self.config.get('tmpfs_min_free_mb', 512)) * 1024 * 1024, self.max_bytes)
+            if usage.free >= min_free:
+                return tmpfs_dir
+            self.logger.warning(f"tmpfs 剩餘空間不足 ({usage.free / 1024 / 1024:.0f} MB)，使用磁碟暫存目錄")
+        except OSError as e:
+            self.logger.warning(f"無法使用 tmpfs 暫存目錄 {tmpfs_dir}: {e}")
+
+        return scratch_dir
+
+    def create(self):
+        """建立暫存目錄
+
+        返回:
+            str: 暫存目錄路徑
+        """
+        os.makedirs(self.root, exist_ok=True)
+        return self.root
+
+    def path(self, *parts):
+        """獲取暫存目錄中的文件路徑（自動建立上層目錄）
+
+        參數:
+            *parts: 相對路徑片段
+
+        返回:
+            str: 文件路徑
+        """
+        file_path = os.path.join(self.root, *parts)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        return file_path
+
+    def usage(self):
+        """計算暫存目錄目前的磁碟用量
+
+        返回:
+            int: 位元組數
+        """
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, filename))
+                except OSError:
+                    pass
+        self.peak_bytes = max(self.peak_bytes, total)
+        return total
+
+    def check_quota(self):
+        """檢查磁碟用量，超過上限時拋出 WorkspaceQuotaExceeded"""
+        used = self.usage()
+        if used > self.max_bytes:
+            raise WorkspaceQuotaExceeded(
+                f"任務暫存空間超過上限: {used / 1024 / 1024:.1f} MB > {self.max_bytes / 1024 / 1024:.0f} MB"
+            )
+
+    def start_monitor(self, cancel_token):
+        """啟動用量監控線程
+
+        每隔 quota_check_seconds 檢查一次用量，超過上限時記錄 quota_error 並取消令牌，
+        使正在執行的階段（語音合成、幀生成、ffmpeg）立即中止。
+
+        參數:
+            cancel_token (CancellationToken): 任務內部的取消令牌（不應是外部共用的令牌）
+        """
+        if self.monitor_thread is not None or self.quota_check_seconds <= 0:
+            return
+
+        self.monitor_stop = threading.Event()
+
+        def monitor():
+            while not self.monitor_stop.wait(self.quota_check_seconds):
+                try:
+                    self.check_quota()
+                except WorkspaceQuotaExceeded as e:
+                    self.quota_error = e
+                    self.logger.warning(f"{e}，中止任務: {self.task_id}")
+                    cancel_token.cancel()
+                    return
+
+        self.monitor_thread = threading.Thread(target=monitor, name=f"workspace-quota-{self.dir_name}", daemon=True)
+        self.monitor_thread.start()
+
+    def stop_monitor(self):
+        """停止用量監控線程"""
+        if self.monitor_thread is None:
+            return
+        self.monitor_stop.set()
+        self.monitor_thread.join()
+        self.monitor_thread = None
+
+    def output_dir(self, output_root):
+        """獲取任務專屬的輸出目錄（output_root/<task_id>）
+
+        參數:
+            output_root (str): 輸出根目錄
+
+        返回:
+            str: 輸出目錄路徑
+        """
+        return os.path.join(output_root, self.dir_name)
+
+    def publish(self, file_path, output_dir, name=None):
+        """把最終輸出以原子方式移到輸出目錄
+
+        同一文件系統上直接改名；跨文件系統（例如 tmpfs 到磁碟）時先複製到輸出目錄中的臨時文件再改名，
+        讀取輸出目錄的程序不會看到寫到一半的文件。
+
+        參數:
+            file_path (str): 暫存目錄中的文件路徑
+            output_dir (str): 輸出目錄
+            name (str, 可選): 輸出文件名，預設與原文件名相同
+
+        返回:
+            str: 輸出文件路徑，文件不存在時返回 None
+        """
+        if not file_path or not os.path.isfile(file_path):
+            return None
+
+        os.makedirs(output_dir, exist_ok=True)
+        destination = os.path.join(output_dir, name or os.path.basename(file_path))
+
+        try:
+            os.replace(file_path, destination)
+        except OSError:
+            temp_path = os.path.join(output_dir, f".{os.path.basename(destination)}.{os.getpid()}.tmp")
+            try:
+                shutil.copy2(file_path, temp_path)
+                os.replace(temp_path, destination)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            os.remove(file_path)
+
+        return destination
+
+    def cleanup(self, failed=False):
+        """刪除暫存目錄
+
+        參數:
+            failed (bool): 任務是否失敗（設定 keep_on_failure 時保留失敗任務的暫存文件以便排查）
+        """
+        self.stop_monitor()
+        if failed and self.keep_on_failure:
+            self.logger.info(f"保留失敗任務的暫存目錄: {self.root}")
+            return
+
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.logger.debug(f"已刪除任務暫存目錄: {self.root} (峰值用量 {self.peak_bytes / 1024 / 1024:.1f} MB)")
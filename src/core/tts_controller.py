@@ -6,11 +6,32 @@
 """
 
 import os
+import io
+import json
+import re
+import time
+import shutil
+import hashlib
+import wave
+import zlib
+import asyncio
 import logging
 import tempfile
+import threading
 import requests
+import numpy as np
 from datetime import datetime
-import azure.cognitiveservices.speech as speechsdk
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from xml.sax.saxutils import escape
+
+from src.data.cache_manager import get_cache_manager
+from src.utils.cancellation import TaskCancelled, raise_if_cancelled, remove_files
+
+# Azure 語音 SDK 為可選依賴，僅在使用 Azure 引擎時需要
+try:
+    import azure.cognitiveservices.speech as speechsdk
+except ImportError:
+    speechsdk = None
 
 class TTSController:
     """文本到語音控制器
@@ -33,15 +54,42 @@ class TTSController:
         
         # 確保緩存目錄存在
         os.makedirs(self.cache_dir, exist_ok=True)
+        self.cache_manager = get_cache_manager()
+        self.cache_manager.register('audio', self.cache_dir, owner='tts_controller')
         
         # 獲取 API 密鑰
         self.api_keys = self.config.get('api_keys', {})
         
+        # 批量合成設定（並行數、單次請求逾時、重試次數與退避秒數）
+        self.max_concurrency = int(self.config.get('max_concurrency', 4))
+        self.request_timeout = float(self.config.get('request_timeout', 30.0))
+        self.max_retries = int(self.config.get('max_retries', 2))
+        self.retry_backoff = float(self.config.get('retry_backoff', 1.0))
+        
+        # Azure 書籤批量合成設定（每個 SSML 請求包含的字幕數）
+        self.azure_bookmark_batch = self.config.get('azure_bookmark_batch', True)
+        self.azure_batch_size = int(self.config.get('azure_batch_size', 40))
+        self._azure_synthesizers = []  # 閒置的合成器 [(語音, 合成器), ...]，每個請求獨佔一個
+        self._azure_lock = threading.Lock()
+        
+        # 依實際音頻時長重排字幕時，字幕之間的間隔（秒）
+        self.subtitle_gap = float(self.config.get('subtitle_gap', 0.2))
+        
+        # 本地合成引擎設定（每秒字符數與採樣率）
+        self.local_chars_per_second = float(self.config.get('local_chars_per_second', 5.0))
+        self.local_sample_rate = int(self.config.get('local_sample_rate', 24000))
+        
+        # 語句緩存：相同引擎、語音、語速與文本的合成結果直接複製，不再送出請求
+        self.phrase_cache = self.config.get('phrase_cache', True)
+        self.phrase_cache_dir = self.config.get('phrase_cache_dir', os.path.join(self.cache_dir, 'phrases'))
+        if self.phrase_cache:
+            os.makedirs(self.phrase_cache_dir, exist_ok=True)
+        
     def set_engine(self, engine):
         """設置 TTS 引擎
         
         參數:
-            engine (str): TTS 引擎名稱 ('azure', 'google', 'edge')
+            engine (str): TTS 引擎名稱 ('azure', 'google', 'edge', 'local'/'synthetic')
         """
         self.engine = engine
         self.logger.info(f"已設置 TTS 引擎: {engine}")
@@ -64,13 +112,17 @@ class TTSController:
         self.speech_rate = float(rate)
         self.logger.info(f"已設置語速: {rate}")
         
-    def generate_speech(self, text, output_file=None, rate=None):
+    def generate_speech(self, text, output_file=None, rate=None, timing=None):
         """生成語音
         
         參數:
             text (str): 文本
             output_file (str, 可選): 輸出文件路徑
             rate (float, 可選): 語速倍率
+            timing (dict, 可選): 傳入時由引擎填入合成期間取得的時間資訊：
+                duration（音頻時長，秒）與 words（逐詞邊界列表，
+                每項包含 text, offset, duration，單位為秒）。
+                Edge、Azure 與本地引擎支援，Google 引擎不提供。
             
         返回:
             bool: 是否成功
@@ -89,26 +141,33 @@ class TTSController:
         
         # 根據不同的引擎生成語音
         if self.engine == 'azure':
-            return self._generate_azure_speech(text, output_file, speech_rate)
+            return self._generate_azure_speech(text, output_file, speech_rate, timing)
         elif self.engine == 'google':
             return self._generate_google_speech(text, output_file, speech_rate)
         elif self.engine == 'edge':
-            return self._generate_edge_speech(text, output_file, speech_rate)
+            return self._generate_edge_speech(text, output_file, speech_rate, timing)
+        elif self.engine in ('local', 'synthetic'):
+            return self._generate_local_speech(text, output_file, speech_rate, timing)
         else:
             self.logger.error(f"不支援的 TTS 引擎: {self.engine}")
             return False
             
-    def _generate_azure_speech(self, text, output_file, rate=1.0):
+    def _generate_azure_speech(self, text, output_file, rate=1.0, timing=None):
         """使用 Azure TTS 生成語音
         
         參數:
             text (str): 文本
             output_file (str): 輸出文件路徑
             rate (float): 語速倍率
+            timing (dict, 可選): 填入音頻時長與 synthesis_word_boundary 逐詞邊界
             
         返回:
             bool: 是否成功
         """
+        if speechsdk is None:
+            self.logger.error("無法使用 Azure TTS: 未安裝 azure-cognitiveservices-speech")
+            return False
+            
         # 檢查是否配置了 Azure API 密鑰
         subscription_key = self.api_keys.get('azure_tts')
         if not subscription_key:
@@ -131,7 +190,7 @@ class TTSController:
             
             # 創建 SSML 文本（支持調整語速）
             ssml_text = f"""
-            <speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang="zh-TW">
+            <speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang="{self._voice_locale()}">
                 <voice name="{self.voice}">
                     <prosody rate="{rate}">
                         {text}
@@ -140,11 +199,21 @@ class TTSController:
             </speak>
             """
             
-            # 合成語音
-            result = synthesizer.speak_ssml_async(ssml_text).get()
+            # 收集逐詞邊界事件
+            words = []
+            if timing is not None:
+                synthesizer.synthesis_word_boundary.connect(
+                    lambda evt: words.append(self._azure_word_boundary(evt))
+                )
+            
+            # 合成語音（等待結果的時間以單次請求逾時為上限，逾時時停止合成並由重試重新建立合成器）
+            result = self._wait_azure_result(synthesizer, synthesizer.speak_ssml_async(ssml_text))
             
             # 檢查結果
             if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+                if timing is not None:
+                    timing['words'] = words
+                    timing['duration'] = result.audio_duration.total_seconds()
                 self.logger.info(f"語音合成成功: {output_file}")
                 return True
             elif result.reason == speechsdk.ResultReason.Canceled:
@@ -183,8 +252,8 @@ class TTSController:
             elif self.voice.startswith('ja-'):
                 language = 'ja'
                 
-            # 生成語音
-            tts = gTTS(text=text, lang=language, slow=False)
+            # 生成語音（每個 HTTP 請求以單次請求逾時為上限）
+            tts = gTTS(text=text, lang=language, slow=False, timeout=self.request_timeout)
             tts.save(output_file)
             
             # 處理語速（Google TTS API 不直接支持調整語速，需要使用外部工具）
@@ -211,38 +280,22 @@ class TTSController:
             self.logger.error(f"Google TTS 生成失敗: {str(e)}")
             return False
             
-    def _generate_edge_speech(self, text, output_file, rate=1.0):
+    def _generate_edge_speech(self, text, output_file, rate=1.0, timing=None):
         """使用 Microsoft Edge TTS 生成語音
         
         參數:
             text (str): 文本
             output_file (str): 輸出文件路徑
             rate (float): 語速倍率
+            timing (dict, 可選): 填入音頻時長與 WordBoundary 逐詞邊界
             
         返回:
             bool: 是否成功
         """
         try:
-            # Edge TTS 相關依賴
-            import edge_tts
-            import asyncio
-            
-            async def synthesize_speech():
-                # 創建 TTS 通信對象
-                communicate = edge_tts.Communicate(text, self.voice)
-                
-                # 調整語速
-                if rate != 1.0:
-                    options = {
-                        "rate": f"+{int((rate-1)*50)}%" if rate > 1 else f"{int((rate-1)*50)}%"
-                    }
-                    communicate = edge_tts.Communicate(text, self.voice, options=options)
-                
-                # 合成語音
-                await communicate.save(output_file)
-            
-            # 運行異步任務
-            asyncio.run(synthesize_speech())
+            # 運行異步任務（以單次請求逾時為上限）
+            asyncio.run(asyncio.wait_for(self._edge_synthesize(text, output_file, rate, timing),
+                                         timeout=self.request_timeout))
             
             self.logger.info(f"Edge TTS 語音合成成功: {output_file}")
             return True
@@ -251,6 +304,167 @@ class TTSController:
             self.logger.error(f"Edge TTS 生成失敗: {str(e)}")
             return False
             
+    async def _edge_synthesize(self, text, output_file, rate=1.0, timing=None):
+        """Edge TTS 異步合成（單次請求）
+        
+        以串流方式接收音頻，同時收集 WordBoundary 事件，
+        不需要事後再解碼音頻來量測時長。
+        
+        參數:
+            text (str): 文本
+            output_file (str): 輸出文件路徑
+            rate (float): 語速倍率
+            timing (dict, 可選): 填入音頻時長與逐詞邊界
+        """
+        # Edge TTS 相關依賴
+        import edge_tts
+        
+        # 創建 TTS 通信對象（語速以百分比表示；edge-tts 7.2 起預設只回傳 SentenceBoundary，需指定逐詞邊界）
+        communicate = edge_tts.Communicate(text, self.voice, rate=self._edge_rate_string(rate),
+                                           boundary="WordBoundary")
+        
+        # 合成語音
+        words = []
+        audio_bytes = 0
+        with open(output_file, 'wb') as f:
+            async for chunk in communicate.stream():
+                if chunk['type'] == 'audio':
+                    f.write(chunk['data'])
+                    audio_bytes += len(chunk['data'])
+                elif chunk['type'] == 'WordBoundary':
+                    words.append({
+                        'text': chunk['text'],
+                        'offset': chunk['offset'] / 10_000_000.0,
+                        'duration': chunk['duration'] / 10_000_000.0
+                    })
+                    
+        if timing is not None:
+            # Edge 輸出固定為 48 kbps CBR MP3，時長可由位元組數直接換算
+            duration = audio_bytes * 8 / 48000.0
+            if words:
+                duration = max(duration, words[-1]['offset'] + words[-1]['duration'])
+            timing['words'] = words
+            timing['duration'] = duration
+        
+    def _edge_rate_string(self, rate):
+        """將語速倍率轉換為 Edge TTS 的百分比字串
+        
+        參數:
+            rate (float): 語速倍率
+            
+        返回:
+            str: 例如 '+25%' 或 '-10%'
+        """
+        percent = int((rate - 1) * 50)
+        return f"+{percent}%" if percent >= 0 else f"{percent}%"
+        
+    def _generate_local_speech(self, text, output_file, rate=1.0, timing=None):
+        """使用本地合成引擎生成語音（離線、可重現）
+        
+        不需要網路，輸出與文本及語音一一對應的類語音音頻，
+        時長由字符數與語速決定，用於壓力測試與效能基準。
+        
+        參數:
+            text (str): 文本
+            output_file (str): 輸出文件路徑
+            rate (float): 語速倍率
+            timing (dict, 可選): 填入音頻時長與逐字邊界
+            
+        返回:
+            bool: 是否成功
+        """
+        try:
+            samples = self._synthesize_local_samples(text, rate)
+            self._write_pcm_file(samples, output_file)
+            
+            if timing is not None:
+                chars = [c for c in text if not c.isspace()]
+                syllable = len(samples) / float(self.local_sample_rate) / max(1, len(chars))
+                timing['words'] = [
+                    {'text': c, 'offset': i * syllable, 'duration': syllable}
+                    for i, c in enumerate(chars)
+                ]
+                timing['duration'] = len(samples) / float(self.local_sample_rate)
+            
+            self.logger.info(f"本地 TTS 語音合成成功: {output_file}")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"本地 TTS 生成失敗: {str(e)}")
+            return False
+            
+    def _synthesize_local_samples(self, text, rate=1.0):
+        """生成確定性的類語音 PCM 樣本
+        
+        每個字符對應一個音節（諧波疊加並加上包絡），標點符號對應停頓。
+        亂數種子由語音與文本決定，相同輸入總是得到相同輸出。
+        
+        參數:
+            text (str): 文本
+            rate (float): 語速倍率
+            
+        返回:
+            numpy.ndarray: 16 位元單聲道樣本
+        """
+        rate = rate if rate and rate > 0 else 1.0
+        sample_rate = self.local_sample_rate
+        chars = [c for c in text if not c.isspace()] or [' ']
+        
+        syllable_samples = max(1, int(sample_rate / (self.local_chars_per_second * rate)))
+        rng = np.random.default_rng(zlib.crc32(f"{self.voice}|{text}".encode('utf-8')))
+        
+        # 基頻由語音名稱決定，模擬不同聲線
+        base_pitch = 110 + zlib.crc32(self.voice.encode('utf-8')) % 110
+        
+        t = np.arange(syllable_samples) / sample_rate
+        envelope = np.hanning(syllable_samples)
+        pauses = set('，。！？、；：,.!?;:…')
+        
+        output = np.zeros(len(chars) * syllable_samples, dtype=np.float32)
+        for i, char in enumerate(chars):
+            if char in pauses:
+                continue
+            pitch = base_pitch * (1 + rng.uniform(-0.15, 0.15))
+            wave_form = (
+                np.sin(2 * np.pi * pitch * t)
+                + 0.5 * np.sin(2 * np.pi * 2 * pitch * t)
+                + 0.25 * np.sin(2 * np.pi * 3 * pitch * t)
+            )
+            start = i * syllable_samples
+            output[start:start + syllable_samples] = wave_form * envelope * rng.uniform(0.6, 1.0)
+            
+        output *= 0.3 * 32767 / 1.75
+        return output.astype(np.int16)
+        
+    def _write_pcm_file(self, samples, output_file):
+        """將 16 位元單聲道樣本寫入音頻文件
+        
+        WAV 直接寫入，其他格式（如 mp3）經由 pydub 編碼。
+        
+        參數:
+            samples (numpy.ndarray): 16 位元樣本
+            output_file (str): 輸出文件路徑
+        """
+        audio_format = os.path.splitext(output_file)[1].lstrip('.').lower() or 'mp3'
+        
+        if audio_format == 'wav':
+            with wave.open(output_file, 'wb') as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(self.local_sample_rate)
+                wav.writeframes(samples.tobytes())
+            return
+            
+        from pydub import AudioSegment
+        
+        segment = AudioSegment(
+            data=samples.tobytes(),
+            sample_width=2,
+            frame_rate=self.local_sample_rate,
+            channels=1
+        )
+        segment.export(output_file, format=audio_format)
+        
     def generate_subtitles_with_timing(self, text, character_rate=5.0):
         """生成帶時間的字幕
         
@@ -313,38 +527,694 @@ class TTSController:
         
         return subtitles
     
-    def batch_generate_speech(self, subtitles, output_dir=None, prefix="speech"):
+    def batch_generate_speech(self, subtitles, output_dir=None, prefix="speech", concurrency=None,
+                              align_timing=None, cancel_token=None):
         """批量生成語音文件
         
+        所有請求並行送出：Edge 引擎共用同一個事件循環並以信號量限制並行數，
+        Azure / Google 引擎使用線程池。每個請求都有逾時與退避重試，
+        返回結果保持字幕順序。
+        
+        引擎在合成期間提供的時長與逐詞邊界會寫入字幕的
+        audio_duration 與 word_boundaries。
+        
         參數:
             subtitles (list): 字幕列表
             output_dir (str, 可選): 輸出目錄
             prefix (str): 輸出文件前綴
+            concurrency (int, 可選): 最大並行數，默認使用配置值
+            align_timing (bool, 可選): 是否依實際音頻時長重排字幕的開始與結束時間，
+                預設在引擎提供了音頻時長時重排
+            cancel_token (CancellationToken, 可選): 取消令牌，取消時停止送出請求、
+                刪除已生成的文件並拋出 TaskCancelled
             
         返回:
             list: 生成的音頻文件列表
         """
+        raise_if_cancelled(cancel_token)
+        
         if output_dir is None:
             output_dir = self.cache_dir
             
         os.makedirs(output_dir, exist_ok=True)
         
-        audio_files = []
+        if concurrency is None:
+            concurrency = self.max_concurrency
+        concurrency = max(1, int(concurrency))
         
+        # 準備合成作業（跳過沒有文本的字幕，但保留原始編號）
+        jobs = []
         for i, subtitle in enumerate(subtitles):
-            # 檢查字幕是否有文本
             if not subtitle.get('text'):
                 continue
-                
-            # 生成輸出文件路徑
             output_file = os.path.join(output_dir, f"{prefix}_{i+1:03d}.mp3")
+            jobs.append((subtitle, output_file))
             
-            # 生成語音
-            success = self.generate_speech(subtitle['text'], output_file)
+        if not jobs:
+            return []
             
+        start = time.time()
+        
+        # 先從語句緩存取得已合成過的字幕，只有未命中的送出請求
+        cached = [self._load_cached_phrase(subtitle, output_file) for subtitle, output_file in jobs]
+        pending = [job for job, hit in zip(jobs, cached) if not hit]
+        
+        # 根據引擎選擇並行方式
+        try:
+            if not pending:
+                pending_results = []
+            elif self.engine == 'edge':
+                pending_results = asyncio.run(self._batch_edge_speech(pending, concurrency, cancel_token))
+            elif self.engine == 'azure' and self.azure_bookmark_batch:
+                pending_results = self._batch_azure_bookmark_speech(pending, concurrency, cancel_token)
+            else:
+                pending_results = self._batch_threaded_speech(pending, concurrency, cancel_token)
+            raise_if_cancelled(cancel_token)
+        except TaskCancelled:
+            self.logger.info(f"批量語音合成已取消: {prefix}")
+            remove_files(output_file for _, output_file in jobs)
+            raise
+            
+        for (subtitle, output_file), success in zip(pending, pending_results):
+            if success:
+                self._store_cached_phrase(subtitle, output_file)
+                
+        pending_iter = iter(pending_results)
+        results = [True if hit else next(pending_iter) for hit in cached]
+        
+        audio_files = []
+        
+        for (subtitle, output_file), success in zip(jobs, results):
             if success:
                 # 添加音頻文件路徑到字幕數據
                 subtitle['audio_file'] = output_file
                 audio_files.append(output_file)
+                
+        if align_timing is None:
+            align_timing = any(subtitle.get('audio_duration') for subtitle in subtitles)
+        if align_timing:
+            self.align_subtitles_to_audio(subtitles)
+                
+        self.logger.info(f"批量語音合成完成: {len(audio_files)}/{len(jobs)} 成功 "
+                         f"(緩存命中 {len(jobs) - len(pending)}), 並行數 {concurrency}, "
+                         f"耗時 {time.time() - start:.2f} 秒")
+        return audio_files
+        
+    def warm_phrase_cache(self, phrases, cancel_token=None):
+        """預先合成常用語句並寫入語句緩存
+        
+        參數:
+            phrases (list): 語句列表
+            cancel_token (CancellationToken, 可選): 取消令牌
+            
+        返回:
+            int: 可從緩存取得的語句數量
+        """
+        if not self.phrase_cache or not phrases:
+            return 0
+            
+        temp_dir = tempfile.mkdtemp(prefix='tts_warmup_')
+        try:
+            subtitles = [{'text': phrase} for phrase in phrases if phrase]
+            audio_files = self.batch_generate_speech(subtitles, temp_dir, 'phrase', cancel_token=cancel_token)
+            return len(audio_files)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        
+    def _phrase_cache_key(self, text):
+        """計算語句緩存鍵（引擎、語音、語速與文本）
+        
+        參數:
+            text (str): 文本
+            
+        返回:
+            str: 緩存鍵
+        """
+        raw = f"{self.engine}|{self.voice}|{float(self.speech_rate):.3f}|{text}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        
+    def _load_cached_phrase(self, subtitle, output_file):
+        """從語句緩存複製音頻與時間資訊
+        
+        參數:
+            subtitle (dict): 字幕
+            output_file (str): 輸出文件路徑
+            
+        返回:
+            bool: 是否命中
+        """
+        if not self.phrase_cache:
+            return False
+            
+        key = self._phrase_cache_key(subtitle['text'])
+        audio_path = os.path.join(self.phrase_cache_dir, f"{key}.mp3")
+        timing_path = os.path.join(self.phrase_cache_dir, f"{key}.json")
+        if not os.path.exists(audio_path) or not os.path.exists(timing_path):
+            return False
+            
+        try:
+            with open(timing_path, 'r', encoding='utf-8') as f:
+                timing = json.load(f)
+            shutil.copyfile(audio_path, output_file)
+        except Exception as e:
+            self.logger.warning(f"讀取語句緩存失敗: {key}, {e}")
+            return False
+            
+        self.cache_manager.touch(audio_path)
+        self.cache_manager.touch(timing_path)
+        self._apply_timing(subtitle, timing)
+        return True
+        
+    def _store_cached_phrase(self, subtitle, output_file):
+        """把合成結果寫入語句緩存
+        
+        參數:
+            subtitle (dict): 字幕（合成後帶有 audio_duration 與 word_boundaries）
+            output_file (str): 合成的音頻文件
+        """
+        if not self.phrase_cache or not os.path.exists(output_file):
+            return
+            
+        key = self._phrase_cache_key(subtitle['text'])
+        timing = {
+            'duration': subtitle.get('audio_duration'),
+            'words': [
+                {k: word[k] for k in ('text', 'offset', 'duration') if k in word}
+                for word in subtitle.get('word_boundaries', [])
+            ]
+        }
+        
+        try:
+            # 先寫臨時文件再改名，並行任務不會讀到寫到一半的緩存
+            suffix = f".{os.getpid()}_{threading.get_ident()}.tmp"
+            audio_path = os.path.join(self.phrase_cache_dir, f"{key}.mp3")
+            timing_path = os.path.join(self.phrase_cache_dir, f"{key}.json")
+            shutil.copyfile(output_file, audio_path + suffix)
+            os.replace(audio_path + suffix, audio_path)
+            with open(timing_path + suffix, 'w', encoding='utf-8') as f:
+                json.dump(timing, f, ensure_ascii=False)
+            os.replace(timing_path + suffix, timing_path)
+            self.cache_manager.record(audio_path)
+            self.cache_manager.record(timing_path)
+        except Exception as e:
+            self.logger.warning(f"寫入語句緩存失敗: {key}, {e}")
+        
+    def align_subtitles_to_audio(self, subtitles, gap=None):
+        """依合成得到的實際音頻時長重排字幕時間
+        
+        每條字幕的時長改為其音頻時長，下一條字幕緊接在前一條結束後
+        （加上間隔）開始，消除以字符速率估算造成的漂移與重疊。
+        逐詞邊界同時換算為絕對時間 start / end。
+        沒有音頻時長的字幕保留原本的持續時間。
+        
+        參數:
+            subtitles (list): 字幕列表
+            gap (float, 可選): 字幕之間的間隔（秒），默認使用配置值
+            
+        返回:
+            list: 調整後的字幕列表（原地修改）
+        """
+        if not subtitles:
+            return subtitles
+            
+        gap = self.subtitle_gap if gap is None else float(gap)
+        current_time = float(subtitles[0].get('startTime', 0.0))
+        
+        for subtitle in subtitles:
+            duration = subtitle.get('audio_duration')
+            if duration is None:
+                duration = subtitle.get('duration', subtitle.get('endTime', 0) - subtitle.get('startTime', 0))
+                
+            subtitle['startTime'] = current_time
+            subtitle['duration'] = duration
+            subtitle['endTime'] = current_time + duration
+            
+            for word in subtitle.get('word_boundaries', []):
+                word['start'] = current_time + word['offset']
+                word['end'] = word['start'] + word['duration']
+                
+            current_time = subtitle['endTime'] + gap
+            
+        self.logger.info(f"已依音頻時長重排 {len(subtitles)} 條字幕，總時長 {subtitles[-1]['endTime']:.2f} 秒")
+        return subtitles
+        
+    def _apply_timing(self, subtitle, timing):
+        """將合成期間取得的時間資訊寫入字幕
+        
+        參數:
+            subtitle (dict): 字幕
+            timing (dict): 引擎填入的時間資訊
+        """
+        if timing.get('duration'):
+            subtitle['audio_duration'] = timing['duration']
+        if timing.get('words'):
+            subtitle['word_boundaries'] = timing['words']
+        
+    async def _batch_edge_speech(self, jobs, concurrency, cancel_token=None):
+        """在單一事件循環中並行合成 Edge TTS 語音
+        
+        參數:
+            jobs (list): 作業列表 [(字幕, 輸出文件路徑), ...]
+            concurrency (int): 最大並行數
+            cancel_token (CancellationToken, 可選): 取消令牌，取消時中止所有進行中的請求
+            
+        返回:
+            list: 每個作業是否成功（與 jobs 順序一致）
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def synthesize(subtitle, output_file):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    timing = {}
+                    async with semaphore:
+                        await asyncio.wait_for(
+                            self._edge_synthesize(subtitle['text'], output_file, self.speech_rate, timing),
+                            timeout=self.request_timeout
+                        )
+                    self._apply_timing(subtitle, timing)
+                    return True
+                except Exception as e:
+                    self._remove_partial_file(output_file)
+                    if attempt >= self.max_retries:
+                        self.logger.error(f"Edge TTS 生成失敗 ({output_file}): {e!r}")
+                        return False
+                    delay = self.retry_backoff * (2 ** attempt)
+                    self.logger.warning(f"Edge TTS 請求失敗，{delay:.1f} 秒後重試 ({attempt + 1}/{self.max_retries}): {e!r}")
+                    await asyncio.sleep(delay)
+            return False
+            
+        gathered = asyncio.gather(*(synthesize(subtitle, output_file) for subtitle, output_file in jobs))
+        if cancel_token is None:
+            return await gathered
+            
+        async def watch_cancel():
+            while not gathered.done():
+                if cancel_token.is_cancelled:
+                    gathered.cancel()
+                    return
+                await asyncio.sleep(0.2)
+                
+        watcher = asyncio.ensure_future(watch_cancel())
+        try:
+            return await gathered
+        except asyncio.CancelledError:
+            raise TaskCancelled("任務已取消")
+        finally:
+            watcher.cancel()
+        
+    def _batch_azure_bookmark_speech(self, jobs, concurrency, cancel_token=None):
+        """以書籤分段的 SSML 批量合成 Azure 語音
+        
+        每個 SSML 請求包含多條字幕，並在每條字幕前插入 <bookmark>。
+        合成結果依書籤的音頻偏移切分為逐條字幕的音頻文件，
+        切分得到的時長直接寫入字幕的 audio_duration，省去後續的時長探測。
+        
+        參數:
+            jobs (list): 作業列表 [(字幕, 輸出文件路徑), ...]
+            concurrency (int): 請求失敗時逐條重試所用的並行數
+            cancel_token (CancellationToken, 可選): 取消令牌，在每個請求之間檢查
+            
+        返回:
+            list: 每個作業是否成功（與 jobs 順序一致）
+        """
+        results = []
+        
+        for start in range(0, len(jobs), max(1, self.azure_batch_size)):
+            chunk = jobs[start:start + self.azure_batch_size]
+            
+            chunk_results = None
+            for attempt in range(self.max_retries + 1):
+                raise_if_cancelled(cancel_token)
+                try:
+                    chunk_results = self._synthesize_azure_bookmark_chunk(chunk)
+                    break
+                except Exception as e:
+                    if attempt >= self.max_retries:
+                        self.logger.error(f"Azure 書籤批量合成失敗: {e!r}")
+                        break
+                    delay = self.retry_backoff * (2 ** attempt)
+                    self.logger.warning(f"Azure 書籤批量合成失敗，{delay:.1f} 秒後重試: {e!r}")
+                    self._sleep(delay, cancel_token)
+            
+            # 批量請求失敗時退回逐條合成
+            if chunk_results is None:
+                chunk_results = self._batch_threaded_speech(chunk, concurrency, cancel_token)
+                
+            # 缺少書籤偏移而無法切分的字幕逐條重新合成
+            missing = [i for i, success in enumerate(chunk_results) if success is None]
+            if missing:
+                retried = self._batch_threaded_speech([chunk[i] for i in missing], concurrency, cancel_token)
+                for i, success in zip(missing, retried):
+                    chunk_results[i] = success
+                
+            results.extend(chunk_results)
+            
+        return results
+        
+    def _synthesize_azure_bookmark_chunk(self, chunk):
+        """合成一個書籤 SSML 請求並切分音頻
+        
+        書籤偏移同時給出每條字幕在這段語音中的精確開始與結束時間，
+        以第一條字幕的開始時間為基準寫入 startTime / endTime。
+        每次請求的等待以 request_timeout 為上限，請求失敗或逾時時丟棄合成器，下一次請求重新建立連線。
+        
+        參數:
+            chunk (list): 作業列表 [(字幕, 輸出文件路徑), ...]
+            
+        返回:
+            list: 每個作業是否成功，缺少書籤偏移而需要逐條重試的作業為 None
+        """
+        from pydub import AudioSegment
+        
+        # 組合 SSML，每條字幕前插入書籤，最後以結束書籤標記總長度
+        parts = []
+        for i, (subtitle, _) in enumerate(chunk):
+            parts.append(f'<bookmark mark="s{i}"/>{escape(subtitle["text"])}')
+        parts.append('<bookmark mark="end"/>')
+        
+        ssml_text = (
+            f'<speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang="{self._voice_locale()}">'
+            f'<voice name="{self.voice}"><prosody rate="{self.speech_rate}">'
+            + ' '.join(parts) +
+            '</prosody></voice></speak>'
+        )
+        
+        # 每個請求獨佔一個合成器，等待網絡結果時不持有鎖，其他請求可同時進行
+        synthesizer, voice = self._acquire_azure_synthesizer()
+        
+        # 收集書籤偏移（單位為 100 納秒）與逐詞邊界
+        offsets = {}
+        words = []
+        
+        def on_bookmark(evt):
+            offsets[evt.text] = evt.audio_offset / 10_000_000.0
+            
+        synthesizer.bookmark_reached.connect(on_bookmark)
+        synthesizer.synthesis_word_boundary.connect(
+            lambda evt: words.append(self._azure_word_boundary(evt))
+        )
+        try:
+            result = self._wait_azure_result(synthesizer, synthesizer.speak_ssml_async(ssml_text))
+        except Exception:
+            # 逾時或連線錯誤：丟棄這個合成器與閒置的合成器
+            self._reset_azure_synthesizer()
+            raise
+        finally:
+            synthesizer.bookmark_reached.disconnect_all()
+            synthesizer.synthesis_word_boundary.disconnect_all()
+            
+        if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+            self._reset_azure_synthesizer()
+            details = getattr(result, 'cancellation_details', None)
+            raise RuntimeError(f"語音合成失敗: {result.reason} {getattr(details, 'error_details', '')}")
+        self._release_azure_synthesizer(synthesizer, voice)
+            
+        # 解析 PCM 音頻
+        with wave.open(io.BytesIO(result.audio_data), 'rb') as wav:
+            channels = wav.getnchannels()
+            sample_width = wav.getsampwidth()
+            frame_rate = wav.getframerate()
+            total_frames = wav.getnframes()
+            pcm = wav.readframes(total_frames)
+            
+        total_duration = total_frames / float(frame_rate)
+        bytes_per_frame = channels * sample_width
+        
+        base_time = float(chunk[0][0].get('startTime', 0.0))
+        results = []
+        for i, (subtitle, output_file) in enumerate(chunk):
+            start = offsets.get(f"s{i}")
+            next_mark = f"s{i+1}" if i + 1 < len(chunk) else "end"
+            end = offsets.get(next_mark, total_duration)
+            
+            if start is None or end is None or end <= start:
+                self.logger.warning(f"缺少書籤偏移，改為逐條合成: {output_file}")
+                results.append(None)
+                continue
+                
+            start_frame = int(round(start * frame_rate))
+            end_frame = min(total_frames, int(round(end * frame_rate)))
+            clip = AudioSegment(
+                data=pcm[start_frame * bytes_per_frame:end_frame * bytes_per_frame],
+                sample_width=sample_width,
+                frame_rate=frame_rate,
+                channels=channels
+            )
+            clip.export(output_file, format=os.path.splitext(output_file)[1].lstrip('.') or 'mp3')
+            
+            # 由書籤偏移得到的精確時間與時長，逐詞邊界換算為片段內的相對偏移
+            clip_start = start_frame / float(frame_rate)
+            clip_duration = (end_frame - start_frame) / float(frame_rate)
+            subtitle['startTime'] = base_time + clip_start
+            subtitle['duration'] = clip_duration
+            subtitle['endTime'] = base_time + clip_start + clip_duration
+            self._apply_timing(subtitle, {
+                'duration': clip_duration,
+                'words': [
+                    {**word, 'offset': word['offset'] - clip_start}
+                    for word in words if start <= word['offset'] < end
+                ]
+            })
+            results.append(True)
+            
+        self.logger.info(f"Azure 書籤批量合成完成: {len(chunk)} 條字幕, 總時長 {total_duration:.2f} 秒")
+        return results
+        
+    def _wait_azure_result(self, synthesizer, future):
+        """等待 Azure 合成結果，以單次請求逾時為上限
+        
+        ResultFuture.get() 不支援逾時，改在背景線程中等待；
+        逾時時停止合成器上進行中的合成並拋出 TimeoutError，呼叫端丟棄該合成器後重試。
+        
+        參數:
+            synthesizer (speechsdk.SpeechSynthesizer): 語音合成器
+            future (speechsdk.ResultFuture): speak_ssml_async 返回的結果
+            
+        返回:
+            speechsdk.SpeechSynthesisResult: 合成結果
+        """
+        outcome = {}
+        done = threading.Event()
+        
+        def wait():
+            try:
+                outcome['result'] = future.get()
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                done.set()
+                
+        threading.Thread(target=wait, name='azure-tts-wait', daemon=True).start()
+        if not done.wait(self.request_timeout):
+            try:
+                synthesizer.stop_speaking_async()
+            except Exception as e:
+                self.logger.debug(f"停止 Azure 語音合成失敗: {e!r}")
+            raise TimeoutError(f"Azure 語音合成逾時 ({self.request_timeout:.1f} 秒)")
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+        
+    def _voice_locale(self):
+        """從語音名稱取得語言地區（例如 zh-TW-YunJheNeural -> zh-TW）
+        
+        返回:
+            str: 語言地區代碼，無法解析時返回 zh-TW
+        """
+        match = re.match(r'^([a-z]{2,3}-[A-Za-z]{2,4})-', self.voice or '')
+        return match.group(1) if match else 'zh-TW'
+        
+    def _reset_azure_synthesizer(self):
+        """丟棄閒置的 Azure 語音合成器（連線中斷、逾時或認證失效後重新建立）"""
+        with self._azure_lock:
+            self._azure_synthesizers.clear()
+            
+    def _acquire_azure_synthesizer(self):
+        """取得一個由呼叫端獨佔的 Azure 語音合成器
+        
+        優先重用目前語音的閒置合成器，沒有時新建。
+        合成器輸出到記憶體（RIFF PCM），以便依書籤偏移切分。
+        用完後以 _release_azure_synthesizer 歸還；請求失敗時不歸還。
+        
+        返回:
+            tuple: (speechsdk.SpeechSynthesizer, 語音名稱)
+        """
+        voice = self.voice
+        with self._azure_lock:
+            for i, (idle_voice, synthesizer) in enumerate(self._azure_synthesizers):
+                if idle_voice == voice:
+                    del self._azure_synthesizers[i]
+                    return synthesizer, voice
             
-        return audio_files
\ No newline at end of file
+        if speechsdk is None:
+            raise RuntimeError("無法使用 Azure TTS: 未安裝 azure-cognitiveservices-speech")
+            
+        subscription_key = self.api_keys.get('azure_tts')
+        if not subscription_key:
+            raise RuntimeError("無法使用 Azure TTS: 缺少 API 密鑰")
+            
+        region = self.config.get('azure_region', 'eastasia')
+        speech_config = speechsdk.SpeechConfig(subscription=subscription_key, region=region)
+        speech_config.speech_synthesis_voice_name = voice
+        speech_config.set_speech_synthesis_output_format(
+            speechsdk.SpeechSynthesisOutputFormat.Riff24Khz16BitMonoPcm
+        )
+        
+        synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        self.logger.info(f"已創建 Azure 語音合成器: {voice}")
+        return synthesizer, voice
+        
+    def _release_azure_synthesizer(self, synthesizer, voice):
+        """歸還成功完成請求的 Azure 語音合成器以便重用
+        
+        參數:
+            synthesizer (speechsdk.SpeechSynthesizer): 語音合成器
+            voice (str): 合成器的語音名稱
+        """
+        with self._azure_lock:
+            self._azure_synthesizers.append((voice, synthesizer))
+        
+    def _azure_word_boundary(self, evt):
+        """轉換 Azure synthesis_word_boundary 事件
+        
+        參數:
+            evt: SpeechSynthesisWordBoundaryEventArgs
+            
+        返回:
+            dict: 逐詞邊界 {text, offset, duration}（秒）
+        """
+        duration = evt.duration
+        return {
+            'text': evt.text,
+            'offset': evt.audio_offset / 10_000_000.0,
+            'duration': duration.total_seconds() if hasattr(duration, 'total_seconds') else duration / 10_000_000.0
+        }
+        
+    def _batch_threaded_speech(self, jobs, concurrency, cancel_token=None):
+        """使用線程池並行合成語音（Azure / Google 等同步引擎）
+        
+        參數:
+            jobs (list): 作業列表 [(字幕, 輸出文件路徑), ...]
+            concurrency (int): 最大並行數
+            cancel_token (CancellationToken, 可選): 取消令牌，取消時丟棄尚未開始的請求
+            
+        返回:
+            list: 每個作業是否成功（與 jobs 順序一致）
+        """
+        # 每次嘗試由引擎以 request_timeout 為上限，以含重試的總時限乘以排隊的輪數作為整批的等待上限，
+        # 每個結果只等待到整批截止時間為止，逾時的請求不會讓總等待時間逐個累加
+        request_deadline = self.request_timeout * (self.max_retries + 1) + self.retry_backoff * (2 ** self.max_retries)
+        rounds = -(-len(jobs) // max(1, concurrency))
+        deadline = time.monotonic() + request_deadline * rounds
+        
+        timings = [{} for _ in jobs]
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='tts')
+        try:
+            futures = [
+                executor.submit(self._generate_speech_with_retry, subtitle['text'], output_file, timing, cancel_token)
+                for (subtitle, output_file), timing in zip(jobs, timings)
+            ]
+            
+            results = []
+            for future, (subtitle, output_file), timing in zip(futures, jobs, timings):
+                try:
+                    success = self._wait_future(future, max(0.0, deadline - time.monotonic()), cancel_token)
+                except TaskCancelled:
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+                except Exception as e:
+                    self.logger.error(f"語音合成逾時或失敗 ({output_file}): {e!r}")
+                    success = False
+                if success:
+                    self._apply_timing(subtitle, timing)
+                results.append(success)
+        finally:
+            # 不等待逾時的請求結束
+            executor.shutdown(wait=False)
+                    
+        return results
+        
+    def _wait_future(self, future, timeout, cancel_token=None):
+        """等待線程池結果，等待期間定期檢查取消令牌
+        
+        參數:
+            future (concurrent.futures.Future): 待等待的結果
+            timeout (float): 最長等待秒數（為 0 時只取已完成的結果）
+            cancel_token (CancellationToken, 可選): 取消令牌
+            
+        返回:
+            結果值，逾時時拋出 TimeoutError，取消時拋出 TaskCancelled
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            raise_if_cancelled(cancel_token)
+            if future.done():
+                return future.result()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise FutureTimeoutError()
+            try:
+                return future.result(timeout=min(remaining, 0.2))
+            except FutureTimeoutError:
+                continue
+                
+    def _sleep(self, seconds, cancel_token=None):
+        """退避等待，取消時立即拋出 TaskCancelled
+        
+        參數:
+            seconds (float): 等待秒數
+            cancel_token (CancellationToken, 可選): 取消令牌
+        """
+        if cancel_token is None:
+            time.sleep(seconds)
+        elif cancel_token.wait(seconds):
+            raise TaskCancelled("任務已取消")
+        
+    def _generate_speech_with_retry(self, text, output_file, timing=None, cancel_token=None):
+        """帶退避重試的單次語音合成
+        
+        每次嘗試的等待時間以 request_timeout 為上限（Azure 等待 ResultFuture、Edge 以 asyncio.wait_for、
+        Google 以 HTTP 逾時），逾時視為失敗並按退避時間重試。
+        
+        參數:
+            text (str): 文本
+            output_file (str): 輸出文件路徑
+            timing (dict, 可選): 由引擎填入的時間資訊
+            cancel_token (CancellationToken, 可選): 取消令牌，取消後不再重試
+            
+        返回:
+            bool: 是否成功
+        """
+        for attempt in range(self.max_retries + 1):
+            if cancel_token is not None and cancel_token.is_cancelled:
+                return False
+            try:
+                if self.generate_speech(text, output_file, timing=timing):
+                    return True
+            except Exception as e:
+                self.logger.warning(f"語音合成出錯: {e!r}")
+                
+            self._remove_partial_file(output_file)
+            if attempt < self.max_retries:
+                delay = self.retry_backoff * (2 ** attempt)
+                self.logger.warning(f"語音合成失敗，{delay:.1f} 秒後重試 ({attempt + 1}/{self.max_retries})")
+                if cancel_token is None:
+                    time.sleep(delay)
+                elif cancel_token.wait(delay):
+                    return False
+                
+        return False
+        
+    def _remove_partial_file(self, file_path):
+        """刪除失敗請求留下的不完整文件
+        
+        參數:
+            file_path (str): 文件路徑
+        """
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except OSError:
+            pass
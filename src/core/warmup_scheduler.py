@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 預熱排程
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from src.core.batch_planner import BatchPlanner
+
+# 工作進程收到此消息時執行進程內預熱
+WARMUP_MESSAGE = 'warmup'
+
+def _timed_step(steps, name, func, logger):
+    """執行一個預熱步驟並記錄結果與耗時（單一步驟失敗不影響其他步驟）
+
+    參數:
+        steps (dict): 步驟名稱 -> 結果
+        name (str): 步驟名稱
+        func (callable): 步驟函數
+        logger (logging.Logger): 日誌記錄器
+    """
+    step_start = time.time()
+    try:
+        result = func()
+        steps[name] = {'ok': True, 'result': result}
+    except Exception as e:
+        logger.warning(f"預熱步驟失敗: {name}, {e}")
+        steps[name] = {'ok': False, 'error': str(e)}
+    steps[name]['duration'] = round(time.time() - step_start, 3)
+
+def _warm_jieba():
+    """載入 jieba 詞典"""
+    import jieba
+    jieba.initialize()
+    return True
+
+def warm_process(runner, warmup_config):
+    """預熱當前進程內的狀態
+
+    jieba 詞典、解碼後的數位人模板（模組級字典）與行情記憶體緩存只存在於單一進程，
+    排程器在主進程的預熱不會帶到工作進程；工作進程在啟動時與每次排程預熱之後各執行一次，
+    行情數據從主進程已填充的磁碟緩存讀入記憶體。
+
+    參數:
+        runner (StockVideoTaskRunner): 當前進程的任務執行器
+        warmup_config (dict): 預熱設定 (watchlist, templates)
+
+    返回:
+        dict: 各步驟的結果與耗時
+    """
+    logger = logging.getLogger(__name__)
+    watchlist = [t.strip().upper() for t in warmup_config.get('watchlist', []) if t and t.strip()]
+    steps = {}
+
+    def warm_memory_cache():
+        return sum(1 for ticker in watchlist if runner.stock_collector.get_stock_data(ticker) is not None)
+
+    _timed_step(steps, 'jieba', _warm_jieba, logger)
+    _timed_step(steps, 'templates', lambda: runner.digital_human.preload_templates(warmup_config.get('templates')), logger)
+    _timed_step(steps, 'memory_cache', warm_memory_cache, logger)
+    return steps
+
+class WarmupScheduler:
+    """預熱排程器
+
+    在設定的時間（例如收盤後的渲染高峰之前）預先填充各項緩存：
+    自選股與市場指數數據（批量下載並計算技術指標）、完整圖表圖層、
+    數位人模板解碼、常用語句的語音緩存與 jieba 詞典，
+    使高峰期間的任務全部命中熱緩存。
+
+    磁碟緩存（行情數據、圖表圖層、語音）由所有進程共用；jieba、模板與記憶體緩存只在執行預熱的進程內有效，
+    工作進程透過 warm_process() 各自預熱，每次預熱完成後調用 on_complete 通知工作進程。
+    """
+
+    def __init__(self, config=None, on_complete=None):
+        """初始化預熱排程器
+
+        參數:
+            config (dict, 可選): 主控制器配置（讀取其中的 warmup 設定）
+            on_complete (callable, 可選): 每次預熱完成後的回調（例如通知工作進程預熱進程內狀態）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.warmup_config = self.config.get('warmup', {})
+
+        self.times = self._parse_times(self.warmup_config.get('times', []))
+        self.weekdays_only = self.warmup_config.get('weekdays_only', True)
+        self.watchlist = [t.strip().upper() for t in self.warmup_config.get('watchlist', []) if t and t.strip()]
+        self.phrases = list(self.warmup_config.get('phrases', []))
+        self.templates = self.warmup_config.get('templates')
+        self.on_complete = on_complete
+
+        self.runner = None
+        self.stop_event = threading.Event()
+        self.run_lock = threading.Lock()
+        self.thread = None
+        self.last_run = None
+        self.next_run = None
+
+    def _parse_times(self, times):
+        """解析 HH:MM 時間列表
+
+        參數:
+            times (list): 時間字串列表
+
+        返回:
+            list: (時, 分) 列表（已排序）
+        """
+        parsed = []
+        for value in times:
+            try:
+                hour, minute = str(value).split(':')
+                parsed.append((int(hour), int(minute)))
+            except ValueError:
+                self.logger.warning(f"無效的預熱時間: {value}")
+        return sorted(parsed)
+
+    def start(self):
+        """啟動排程線程（沒有設定時間時不啟動）"""
+        if self.thread is not None or not self.times:
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._schedule_loop, name='warmup-scheduler')
+        self.thread.daemon = True
+        self.thread.start()
+        self.logger.info(f"預熱排程已啟動: {', '.join(f'{h:02d}:{m:02d}' for h, m in self.times)}")
+
+    def stop(self):
+        """停止排程線程"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def run_in_background(self):
+        """在背景線程立即執行一次預熱
+
+        返回:
+            bool: 是否已啟動（已有預熱在執行時返回 False）
+        """
+        if self.run_lock.locked():
+            return False
+        thread = threading.Thread(target=self.run_once, name='warmup-run')
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def status(self):
+        """獲取排程狀態
+
+        返回:
+            dict: 狀態（設定的時間、下次執行時間、上次執行結果）
+        """
+        return {
+            'times': [f"{h:02d}:{m:02d}" for h, m in self.times],
+            'watchlist': len(self.watchlist),
+            'running': self.run_lock.locked(),
+            'next_run': self.next_run.strftime('%Y-%m-%d %H:%M:%S') if self.next_run else None,
+            'last_run': self.last_run
+        }
+
+    def _next_run_time(self, now):
+        """計算下次執行時間
+
+        參數:
+            now (datetime): 當前時間
+
+        返回:
+            datetime: 下次執行時間
+        """
+        for day_offset in range(8):
+            day = now + timedelta(days=day_offset)
+            if self.weekdays_only and day.weekday() >= 5:
+                continue
+            for hour, minute in self.times:
+                candidate = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                if candidate > now:
+                    return candidate
+        return None
+
+    def _schedule_loop(self):
+        """排程迴圈"""
+        while not self.stop_event.is_set():
+            self.next_run = self._next_run_time(datetime.now())
+            if self.next_run is None:
+                return
+
+            delay = (self.next_run - datetime.now()).total_seconds()
+            if self.stop_event.wait(max(0.0, delay)):
+                return
+
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error(f"預熱執行失敗: {e}")
+
+    def _get_runner(self):
+        """獲取預熱使用的任務執行器（延遲建立）
+
+        返回:
+            StockVideoTaskRunner: 任務執行器
+        """
+        if self.runner is None:
+            from src.core.task_runner import StockVideoTaskRunner
+            self.runner = StockVideoTaskRunner(self.config)
+        return self.runner
+
+    def run_once(self):
+        """執行一次預熱
+
+        每個步驟獨立計時，單一步驟失敗不影響其他步驟。
+
+        返回:
+            dict: 各步驟的結果與耗時
+        """
+        with self.run_lock:
+            start_time = time.time()
+            self.logger.info(f"開始預熱: {len(self.watchlist)} 檔股票, {len(self.phrases)} 條語句")
+
+            runner = self._get_runner()
+            steps = {}
+
+            def step(name, func):
+                _timed_step(steps, name, func, self.logger)
+
+            step('jieba', _warm_jieba)
+            step('market_data', lambda: self._warm_market_data(runner))
+            step('charts', lambda: self._warm_charts(runner))
+            step('templates', lambda: runner.digital_human.preload_templates(self.templates))
+            step('tts_phrases', lambda: self._warm_phrases(runner))
+
+            self.last_run = {
+                'started_at': datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S'),
+                'duration': round(time.time() - start_time, 3),
+                'steps': steps
+            }
+            self.logger.info(f"預熱完成，耗時 {self.last_run['duration']:.2f} 秒")
+
+            if self.on_complete is not None:
+                try:
+                    self.on_complete()
+                except Exception as e:
+                    self.logger.warning(f"預熱完成回調失敗: {e}")
+            return self.last_run
+
+    def _warm_market_data(self, runner):
+        """批量下載自選股與市場指數數據並寫入緩存
+
+        參數:
+            runner (StockVideoTaskRunner): 任務執行器
+
+        返回:
+            dict: 預取統計
+        """
+        planner = BatchPlanner(runner.stock_collector, self.config.get('batch_planner', {}))
+        symbols = planner.plan([{'type': 'stock_video', 'ticker': t} for t in self.watchlist])
+        return planner.prefetch(symbols)
+
+    def _warm_charts(self, runner):
+        """計算技術指標並預先渲染完整圖表圖層
+
+        參數:
+            runner (StockVideoTaskRunner): 任務執行器
+
+        返回:
+            int: 已渲染的圖表數量
+        """
+        rendered = 0
+        for ticker in self.watchlist:
+            if self.stop_event.is_set():
+                break
+            stock_data = runner.stock_collector.get_stock_data(ticker)
+            processed = runner.data_processor.process_stock_data(stock_data)
+            if processed is not None and runner.video_generator.get_chart_layer(processed) is not None:
+                rendered += 1
+        return rendered
+
+    def _warm_phrases(self, runner):
+        """以任務預設的語音設定預先合成常用語句
+
+        參數:
+            runner (StockVideoTaskRunner): 任務執行器
+
+        返回:
+            int: 可從緩存取得的語句數量
+        """
+        if not self.phrases:
+            return 0
+        tts = runner.tts_controller
+        tts.set_engine(self.warmup_config.get('tts_engine', 'azure'))
+        tts.set_voice(self.warmup_config.get('tts_voice', 'zh-TW-YunJheNeural'))
+        tts.set_speech_rate(float(self.warmup_config.get('tts_rate', 1.0)))
+        return tts.warm_phrase_cache(self.phrases)
@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 工作進程池
+"""
+
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+
+def _worker_main(worker_id, config, inbox, events, cancel_event, log_level):
+    """工作進程主函數
+
+    每個進程建立自己的任務執行器並保持熱啟動，逐個處理主進程派發的任務。
+    啟用預熱時，進程在回報就緒前預熱進程內狀態，收到 WARMUP_MESSAGE 時再預熱一次。
+
+    參數:
+        worker_id (int): 工作者編號
+        config (dict): 配置設定
+        inbox (multiprocessing.Queue): 任務輸入隊列，收到 None 時退出，收到 WARMUP_MESSAGE 時執行預熱
+        events (multiprocessing.Queue): 事件輸出隊列
+        cancel_event (multiprocessing.Event): 主進程設置時取消當前任務
+        log_level (int): 日誌級別
+    """
+    logging.basicConfig(level=log_level)
+    logger = logging.getLogger(__name__)
+
+    # 延遲導入，避免主進程在不使用進程池時載入渲染依賴
+    from src.core.task_runner import StockVideoTaskRunner
+    from src.core.warmup_scheduler import WARMUP_MESSAGE, warm_process
+    from src.utils.cancellation import CancellationToken, TaskCancelled
+
+    warmup_config = config.get('warmup', {})
+    runner = StockVideoTaskRunner(config)
+    runner.warm_up()
+    if warmup_config.get('enabled', False):
+        warm_process(runner, warmup_config)
+    events.put(('ready', worker_id, None, None))
+
+    while True:
+        job = inbox.get()
+        if job is None:
+            break
+        if job == WARMUP_MESSAGE:
+            steps = warm_process(runner, warmup_config)
+            durations = ', '.join(f"{name} {step['duration']:.2f}s" for name, step in steps.items())
+            logger.info(f"工作進程 {worker_id} 預熱完成: {durations}")
+            continue
+
+        task_id = job['id']
+
+        def report(progress, message):
+            events.put(('progress', worker_id, task_id, (progress, message)))
+
+        try:
+            result, timings = runner.run(job, report, CancellationToken(cancel_event))
+            events.put(('completed', worker_id, task_id, {
+                'result': result,
+                'timings': timings,
+                'subtitles': job['subtitles']
+            }))
+        except TaskCancelled:
+            events.put(('failed', worker_id, task_id, "任務已取消"))
+        except Exception as e:
+            logger.error(f"工作進程 {worker_id} 處理任務失敗: {task_id}, {e}")
+            events.put(('failed', worker_id, task_id, str(e)))
+
+class WorkerPool:
+    """工作進程池
+
+    以多個獨立進程並行渲染視頻任務。主進程中的派發線程從任務來源取出任務並交給空閒的進程，
+    收集線程接收進度與結果，並定期檢查進程存活狀態，異常退出的進程會被重啟，
+    其未完成的任務會重新排隊或標記失敗。
+    """
+
+    def __init__(self, config, num_workers, task_source, on_progress, on_finished, on_requeue=None,
+                 max_attempts=2, start_method='spawn', reserved_workers=0, reserved_priority=0):
+        """初始化工作進程池
+
+        參數:
+            config (dict): 傳給工作進程的配置設定（必須可序列化）
+            num_workers (int): 工作進程數量
+            task_source (callable): 取得下一個任務 (timeout, max_priority) -> dict 或 None
+            on_progress (callable): 進度回調 (任務 ID, 進度百分比, 消息, 領取者標識)
+            on_finished (callable): 完成回調 (任務, 結果字典 或 None, 錯誤消息 或 None)
+            on_requeue (callable, 可選): 工作進程崩潰後重新排隊任務的回調 (任務)
+            max_attempts (int): 任務因進程崩潰可嘗試的最大次數
+            start_method (str): 進程啟動方式 (spawn, forkserver, fork)
+            reserved_workers (int): 保留給高優先級任務的空閒進程數，
+                空閒進程不多於此數時只派發優先級數值不大於 reserved_priority 的任務
+            reserved_priority (int): 可使用保留進程的最低優先級
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config
+        self.num_workers = max(1, int(num_workers))
+        self.task_source = task_source
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.on_requeue = on_requeue
+        self.max_attempts = max(1, int(max_attempts))
+        self.reserved_workers = max(0, min(int(reserved_workers), self.num_workers - 1))
+        self.reserved_priority = reserved_priority
+
+        self.context = multiprocessing.get_context(start_method)
+        self.events = self.context.Queue()
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.idle_event = threading.Event()
+        self.is_running = False
+        self.dispatcher_thread = None
+        self.collector_thread = None
+        self.check_interval = 1.0
+
+    def start(self):
+        """啟動所有工作進程與派發、收集線程"""
+        if self.is_running:
+            return
+
+        self.is_running = True
+        for worker_id in range(self.num_workers):
+            self.workers[worker_id] = {
+                'id': worker_id,
+                'process': None,
+                'inbox': None,
+                'cancel_event': None,
+                'ready': False,
+                'task': None,
+                'busy_since': None,
+                'busy_time': 0.0,
+                'started_at': time.time(),
+                'tasks_completed': 0,
+                'tasks_failed': 0,
+                'restarts': 0,
+                'restart_delay': 0.0,
+                'restart_at': None
+            }
+            self._spawn_worker(worker_id)
+
+        self.dispatcher_thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self.collector_thread = threading.Thread(target=self._collect_loop, daemon=True)
+        self.dispatcher_thread.start()
+        self.collector_thread.start()
+
+        self.logger.info(f"工作進程池已啟動: {self.num_workers} 個進程")
+
+    def stop(self, timeout=5.0):
+        """停止工作進程池
+
+        參數:
+            timeout (float): 等待每個進程退出的秒數，超時後強制終止
+        """
+        if not self.is_running:
+            return
+
+        self.is_running = False
+        self.idle_event.set()
+
+        for worker in self.workers.values():
+            try:
+                worker['inbox'].put(None)
+            except Exception:
+                pass
+
+        for worker in self.workers.values():
+            process = worker['process']
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join(1.0)
+
+        for thread in (self.dispatcher_thread, self.collector_thread):
+            if thread:
+                thread.join(timeout=2.0)
+
+        self.logger.info("工作進程池已停止")
+
+    def get_stats(self):
+        """獲取各工作進程的使用率統計
+
+        返回:
+            list: 每個工作進程的狀態、處理數量與使用率（忙碌時間 / 運行時間）
+        """
+        now = time.time()
+        stats = []
+
+        with self.lock:
+            for worker in self.workers.values():
+                busy_time = worker['busy_time']
+                if worker['busy_since'] is not None:
+                    busy_time += now - worker['busy_since']
+                uptime = max(now - worker['started_at'], 1e-6)
+
+                stats.append({
+                    'id': worker['id'],
+                    'pid': worker['process'].pid if worker['process'] else None,
+                    'alive': bool(worker['process'] and worker['process'].is_alive()),
+                    'current_task': worker['task']['id'] if worker['task'] else None,
+                    'tasks_completed': worker['tasks_completed'],
+                    'tasks_failed': worker['tasks_failed'],
+                    'restarts': worker['restarts'],
+                    'busy_seconds': round(busy_time, 2),
+                    'uptime_seconds': round(uptime, 2),
+                    'utilization': round(min(busy_time / uptime, 1.0), 4)
+                })
+
+        return stats
+
+    def _spawn_worker(self, worker_id):
+        """啟動（或重啟）指定的工作進程
+
+        參數:
+            worker_id (int): 工作者編號
+        """
+        worker = self.workers[worker_id]
+        inbox = self.context.Queue()
+        cancel_event = self.context.Event()
+        process = self.context.Process(
+            target=_worker_main,
+            args=(worker_id, self.config, inbox, self.events, cancel_event,
+                  logging.getLogger().getEffectiveLevel()),
+            name=f"render-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+
+        worker['process'] = process
+        worker['inbox'] = inbox
+        worker['cancel_event'] = cancel_event
+        worker['ready'] = False
+
+    def cancel_task(self, task_id):
+        """通知正在處理指定任務的工作進程取消它
+
+        參數:
+            task_id (str): 任務 ID
+
+        返回:
+            bool: 任務是否正在某個工作進程中處理
+        """
+        with self.lock:
+            for worker in self.workers.values():
+                if worker['task'] is not None and worker['task']['id'] == task_id:
+                    worker['cancel_event'].set()
+                    return True
+        return False
+
+    def warm_workers(self):
+        """通知所有工作進程預熱進程內狀態（在當前任務完成後、下一個任務之前執行）
+
+        返回:
+            int: 已通知的進程數
+        """
+        from src.core.warmup_scheduler import WARMUP_MESSAGE
+
+        notified = 0
+        with self.lock:
+            for worker in self.workers.values():
+                if worker['inbox'] is not None and worker['process'] is not None and worker['process'].is_alive():
+                    worker['inbox'].put(WARMUP_MESSAGE)
+                    notified += 1
+        return notified
+
+    def running_task_ids(self):
+        """獲取正在處理中的任務 ID
+
+        返回:
+            list: 任務 ID 列表
+        """
+        with self.lock:
+            return [worker['task']['id'] for worker in self.workers.values() if worker['task'] is not None]
+
+    def _acquire_idle_worker(self):
+        """取得一個空閒的工作進程
+
+        返回:
+            tuple: (工作進程狀態, 空閒進程數)，沒有空閒進程時返回 (None, 0)
+        """
+        with self.lock:
+            idle = [worker for worker in self.workers.values() if worker['ready'] and worker['task'] is None]
+        return (idle[0], len(idle)) if idle else (None, 0)
+
+    def _dispatch_loop(self):
+        """派發線程：把任務交給空閒的工作進程"""
+        while self.is_running:
+            worker, idle_count = self._acquire_idle_worker()
+            if worker is None:
+                self.idle_event.wait(0.5)
+                self.idle_event.clear()
+                continue
+
+            # 最後幾個空閒進程只留給高優先級任務
+            max_priority = self.reserved_priority if idle_count <= self.reserved_workers else None
+            task = self.task_source(1.0, max_priority)
+            if task is None:
+                continue
+
+            job = {
+                'id': task['id'],
+                'type': task['type'],
+                'ticker': task['ticker'],
+                'subtitles': task['subtitles'],
+                'options': task['options']
+            }
+
+            with self.lock:
+                worker['task'] = task
+                worker['busy_since'] = time.time()
+                worker['cancel_event'].clear()
+                task['worker'] = worker['id']
+            worker['inbox'].put(job)
+
+            self.logger.debug(f"任務 {task['id']} 已派發到工作進程 {worker['id']}")
+
+    def _collect_loop(self):
+        """收集線程：處理工作進程事件並監控進程存活狀態"""
+        last_check = time.time()
+
+        while self.is_running:
+            try:
+                event, worker_id, task_id, payload = self.events.get(timeout=0.5)
+                self._handle_event(event, worker_id, task_id, payload)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                self.logger.error(f"處理工作進程事件時出錯: {e}")
+
+            if time.time() - last_check >= self.check_interval:
+                last_check = time.time()
+                self._check_workers()
+
+    def _handle_event(self, event, worker_id, task_id, payload):
+        """處理單個工作進程事件
+
+        參數:
+            event (str): 事件類型 (ready, progress, completed, failed)
+            worker_id (int): 工作者編號
+            task_id (str): 任務 ID
+            payload: 事件內容
+        """
+        worker = self.workers.get(worker_id)
+        if worker is None:
+            return
+
+        if event == 'ready':
+            with self.lock:
+                worker['ready'] = True
+                worker['restart_delay'] = 0.0
+            self.idle_event.set()
+            return
+
+        if event == 'progress':
+            progress, message = payload
+            with self.lock:
+                task = worker['task']
+            # 只轉發工作者目前任務的進度，並附上領取者標識，任務已由他人重新領取時不會覆寫進度
+            if task is not None and task['id'] == task_id:
+                self.on_progress(task_id, progress, message, task.get('claimed_by'))
+            return
+
+        with self.lock:
+            task = worker['task']
+            if task is None or task['id'] != task_id:
+                return
+            self._release_worker(worker)
+            if event == 'completed':
+                worker['tasks_completed'] += 1
+            else:
+                worker['tasks_failed'] += 1
+
+        if event == 'completed':
+            task['subtitles'] = payload.get('subtitles', task['subtitles'])
+            task['timings'] = payload.get('timings', {})
+            self.on_finished(task, payload['result'], None)
+        else:
+            self.on_finished(task, None, payload)
+
+        self.idle_event.set()
+
+    def _release_worker(self, worker):
+        """把工作進程標記為空閒並累計忙碌時間（需持有鎖）
+
+        參數:
+            worker (dict): 工作進程狀態
+        """
+        if worker['busy_since'] is not None:
+            worker['busy_time'] += time.time() - worker['busy_since']
+        worker['busy_since'] = None
+        worker['task'] = None
+
+    def _check_workers(self):
+        """檢查工作進程存活狀態，重啟異常退出的進程"""
+        now = time.time()
+        for worker in list(self.workers.values()):
+            process = worker['process']
+            if process is None or process.is_alive() or not self.is_running:
+                continue
+
+            # 首次發現退出：處理未完成的任務並安排重啟時間
+            if worker['restart_at'] is None:
+                with self.lock:
+                    task = worker['task']
+                    self._release_worker(worker)
+                    if task is not None:
+                        worker['tasks_failed'] += 1
+                    # 尚未就緒即退出（例如初始化失敗）時以指數退避延後重啟
+                    if not worker['ready']:
+                        worker['restart_delay'] = min(max(worker['restart_delay'] * 2, 1.0), 60.0)
+                    worker['restart_at'] = now + worker['restart_delay']
+
+                self.logger.error(f"工作進程 {worker['id']} 異常退出 (退出碼 {process.exitcode})")
+                if task is not None:
+                    self._recover_task(task, process.exitcode)
+
+            if now >= worker['restart_at']:
+                worker['restarts'] += 1
+                worker['restart_at'] = None
+                self.logger.info(f"正在重啟工作進程 {worker['id']}")
+                self._spawn_worker(worker['id'])
+
+    def _recover_task(self, task, exitcode):
+        """處理因工作進程崩潰而中斷的任務
+
+        參數:
+            task (dict): 任務信息
+            exitcode (int): 工作進程退出碼
+        """
+        task['attempts'] = task.get('attempts', 0) + 1
+        if self.on_requeue and task['attempts'] < self.max_attempts:
+            self.logger.warning(f"任務 {task['id']} 重新排隊 (第 {task['attempts']} 次嘗試失敗)")
+            self.on_requeue(task)
+        else:
+            self.on_finished(task, None, f"工作進程異常退出 (退出碼 {exitcode})")
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 股票代碼表產生工具
+
+從交易所公開的完整上市清單產生 symbols.csv，並合併人工維護的 symbols_curated.csv
+（中文名稱、英文名稱與常用別名，以及指數等不在上市清單中的代碼）。
+
+用法:
+    python -m src.data.build_symbols [--markets TW US HK] [--output src/data/symbols.csv]
+
+資料來源:
+    TW: 臺灣證券交易所 ISIN 代碼公告（上市 strMode=2 -> .TW，上櫃 strMode=4 -> .TWO）
+    US: Nasdaq Trader 代碼目錄（nasdaqlisted.txt 與 otherlisted.txt，涵蓋 NASDAQ、NYSE、NYSE American 等）
+    HK: 香港交易所證券名單（英文與中文版 ListOfSecurities.xlsx，需要 openpyxl）
+"""
+
+import os
+import io
+import csv
+import sys
+import logging
+import argparse
+import importlib.util
+from html.parser import HTMLParser
+
+import requests
+
+from src.data.symbol_index import DEFAULT_SYMBOLS_FILE
+
+CURATED_SYMBOLS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'symbols_curated.csv')
+
+TWSE_ISIN_URL = 'https://isin.twse.com.tw/isin/C_public.jsp?strMode={mode}'
+NASDAQ_LISTED_URL = 'https://www.nasdaqtrader.com/dynamic/SymDir/nasdaqlisted.txt'
+OTHER_LISTED_URL = 'https://www.nasdaqtrader.com/dynamic/SymDir/otherlisted.txt'
+HKEX_LIST_URL = 'https://www.hkex.com.hk/eng/services/trading/securities/securitieslists/ListOfSecurities.xlsx'
+HKEX_LIST_ZH_URL = 'https://www.hkex.com.hk/chi/services/trading/securities/securitieslists/ListOfSecurities_c.xlsx'
+
+# 台股 ISIN 公告的市場模式與 Yahoo Finance 後綴
+TWSE_MODES = {2: '.TW', 4: '.TWO'}
+
+# 台股收錄的 CFI 代碼前綴（ES: 股票，CE: ETF）
+TWSE_CFI_PREFIXES = ('ES', 'CE')
+
+# 港股收錄的證券類別
+HKEX_CATEGORIES = ('Equity', 'Exchange Traded Products', 'Real Estate Investment Trusts')
+
+# 美股名稱中去除的證券類型後綴（例如 "Apple Inc. - Common Stock"）
+US_NAME_SEPARATOR = ' - '
+
+FIELDS = ['ticker', 'market', 'name', 'name_zh', 'aliases']
+
+MARKET_ORDER = {'TW': 0, 'US': 1, 'HK': 2}
+
+logger = logging.getLogger(__name__)
+
+class _TableParser(HTMLParser):
+    """把 HTML 表格解析為逐列的儲存格文字"""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.row = None
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self.row = []
+        elif tag == 'td' and self.row is not None:
+            self.cell = []
+
+    def handle_endtag(self, tag):
+        if tag == 'td' and self.cell is not None:
+            self.row.append(''.join(self.cell).strip())
+            self.cell = None
+        elif tag == 'tr' and self.row is not None:
+            self.rows.append(self.row)
+            self.row = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+def _get(url, timeout):
+    """下載文件
+
+    參數:
+        url (str): 網址
+        timeout (float): 逾時秒數
+
+    返回:
+        requests.Response: 回應
+    """
+    response = requests.get(url, timeout=timeout, headers={'User-Agent': 'Mozilla/5.0'})
+    response.raise_for_status()
+    return response
+
+def parse_twse(html, suffix):
+    """解析臺灣證券交易所 ISIN 代碼公告
+
+    參數:
+        html (str): 公告頁面
+        suffix (str): Yahoo Finance 後綴 (.TW 或 .TWO)
+
+    返回:
+        list: 代碼列表 [{ticker, market, name, name_zh, aliases}, ...]
+    """
+    parser = _TableParser()
+    parser.feed(html)
+
+    rows = []
+    for cells in parser.rows:
+        # 有價證券代號及名稱, 國際證券辨識號碼, 上市日, 市場別, 產業別, CFICode, 備註
+        if len(cells) < 6 or not cells[5].startswith(TWSE_CFI_PREFIXES):
+            continue
+        parts = cells[0].replace('　', ' ').split(None, 1)
+        if len(parts) != 2:
+            continue
+        code, name_zh = parts
+        rows.append({'ticker': f"{code}{suffix}", 'market': 'TW', 'name': '', 'name_zh': name_zh.strip(), 'aliases': ''})
+    return rows
+
+def parse_nasdaq_directory(text, symbol_field):
+    """解析 Nasdaq Trader 代碼目錄
+
+    參數:
+        text (str): 以 | 分隔的目錄文件
+        symbol_field (str): 代碼欄位名稱（nasdaqlisted 為 Symbol，otherlisted 為 ACT Symbol）
+
+    返回:
+        list: 代碼列表
+    """
+    lines = [line for line in text.splitlines() if line and not line.startswith('File Creation Time')]
+    rows = []
+    for record in csv.DictReader(lines, delimiter='|'):
+        symbol = (record.get(symbol_field) or '').strip()
+        # 跳過測試代碼與優先股、認股權證等特殊代碼
+        if not symbol or record.get('Test Issue') == 'Y' or any(c in symbol for c in '$=+^'):
+            continue
+        name = (record.get('Security Name') or '').split(US_NAME_SEPARATOR)[0].strip()
+        # Yahoo Finance 以 - 表示股票類別（例如 BRK-B）
+        rows.append({'ticker': symbol.replace('.', '-'), 'market': 'US', 'name': name, 'name_zh': '', 'aliases': ''})
+    return rows
+
+def _read_hkex(content):
+    """讀取香港交易所證券名單
+
+    參數:
+        content (bytes): xlsx 文件內容
+
+    返回:
+        dict: 股票代碼 -> (名稱, 類別)
+    """
+    import pandas as pd
+
+    # 表頭前有標題與更新日期等列，只取第一欄為數字代碼的資料列（代碼、名稱、類別）
+    table = pd.read_excel(io.BytesIO(content), header=None, dtype=str, usecols=[0, 1, 2]).fillna('')
+    securities = {}
+    for code, name, category in table.itertuples(index=False):
+        code = code.strip()
+        if code.isdigit():
+            securities[int(code)] = (name.strip(), category.strip())
+    return securities
+
+def parse_hkex(content, content_zh=None):
+    """解析香港交易所證券名單
+
+    參數:
+        content (bytes): 英文版 xlsx 文件內容
+        content_zh (bytes, 可選): 中文版 xlsx 文件內容
+
+    返回:
+        list: 代碼列表
+    """
+    securities = _read_hkex(content)
+    names_zh = _read_hkex(content_zh) if content_zh else {}
+
+    rows = []
+    for code, (name, category) in sorted(securities.items()):
+        if category not in HKEX_CATEGORIES:
+            continue
+        rows.append({
+            'ticker': f"{code:04d}.HK",
+            'market': 'HK',
+            'name': name,
+            'name_zh': names_zh.get(code, ('', ''))[0],
+            'aliases': ''
+        })
+    return rows
+
+def fetch_market(market, timeout=30):
+    """下載並解析一個市場的完整上市清單
+
+    參數:
+        market (str): 市場 (TW, US, HK)
+        timeout (float): 每個請求的逾時秒數
+
+    返回:
+        list: 代碼列表
+    """
+    if market == 'TW':
+        rows = []
+        for mode, suffix in TWSE_MODES.items():
+            response = _get(TWSE_ISIN_URL.format(mode=mode), timeout)
+            rows.extend(parse_twse(response.content.decode('ms950', errors='replace'), suffix))
+        return rows
+
+    if market == 'US':
+        return (parse_nasdaq_directory(_get(NASDAQ_LISTED_URL, timeout).text, 'Symbol')
+                + parse_nasdaq_directory(_get(OTHER_LISTED_URL, timeout).text, 'ACT Symbol'))
+
+    if market == 'HK':
+        # pandas 讀取 xlsx 需要 openpyxl，先檢查以免下載後才失敗
+        if importlib.util.find_spec('openpyxl') is None:
+            raise RuntimeError("解析港股證券名單需要 openpyxl，請執行 pip install openpyxl 或以 --markets TW US 略過港股")
+        content = _get(HKEX_LIST_URL, timeout).content
+        try:
+            content_zh = _get(HKEX_LIST_ZH_URL, timeout).content
+        except requests.RequestException as e:
+            logger.warning(f"下載港股中文名稱失敗，只使用英文名稱: {e}")
+            content_zh = None
+        return parse_hkex(content, content_zh)
+
+    raise ValueError(f"不支援的市場: {market}")
+
+def read_symbols(path):
+    """讀取代碼表
+
+    參數:
+        path (str): CSV 路徑
+
+    返回:
+        list: 代碼列表，文件不存在時返回空列表
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [{field: (row.get(field) or '').strip() for field in FIELDS} for row in csv.DictReader(f)]
+
+def merge_symbols(listed, curated):
+    """合併上市清單與人工維護的代碼表
+
+    人工維護的非空欄位優先（例如台股的英文名稱、美股的中文名稱與別名），
+    不在上市清單中的人工代碼（指數等）保留。
+
+    參數:
+        listed (list): 上市清單
+        curated (list): 人工維護的代碼表
+
+    返回:
+        list: 按市場與代碼排序的代碼表
+    """
+    merged = {}
+    for row in listed:
+        merged.setdefault(row['ticker'].upper(), dict(row))
+    for row in curated:
+        ticker = row['ticker'].upper()
+        target = merged.setdefault(ticker, {field: '' for field in FIELDS})
+        target.update({field: value for field, value in row.items() if value})
+        target['ticker'] = ticker
+    return sorted(merged.values(), key=lambda row: (MARKET_ORDER.get(row['market'], 9), row['ticker']))
+
+def write_symbols(rows, path):
+    """以原子方式寫入代碼表
+
+    參數:
+        rows (list): 代碼列表
+        path (str): CSV 路徑
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temp_path, path)
+
+def main(argv=None):
+    """產生代碼表
+
+    參數:
+        argv (list, 可選): 參數列表
+
+    返回:
+        int: 退出碼（0 成功，1 有市場下載失敗，此時不覆寫代碼表）
+    """
+    parser = argparse.ArgumentParser(description='從交易所上市清單產生股票代碼表')
+    parser.add_argument('--markets', nargs='+', default=['TW', 'US', 'HK'], choices=('TW', 'US', 'HK'))
+    parser.add_argument('--curated', default=CURATED_SYMBOLS_FILE, help='人工維護的代碼表')
+    parser.add_argument('--output', default=DEFAULT_SYMBOLS_FILE, help='輸出的代碼表')
+    parser.add_argument('--timeout', type=float, default=30, help='每個請求的逾時秒數')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+    listed = []
+    for market in args.markets:
+        try:
+            rows = fetch_market(market, args.timeout)
+        except Exception as e:
+            logger.error(f"下載 {market} 上市清單失敗: {e}")
+            return 1
+        logger.info(f"{market}: {len(rows)} 檔")
+        listed.extend(rows)
+
+    # 只更新部分市場時，保留現有代碼表中其他市場的代碼
+    kept = [row for row in read_symbols(args.output) if row['market'] not in args.markets]
+    rows = merge_symbols(kept + listed, read_symbols(args.curated))
+    write_symbols(rows, args.output)
+    logger.info(f"已寫入代碼表: {args.output} ({len(rows)} 檔)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,566 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 緩存管理器
+"""
+
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 進程內共用的緩存管理器
+_shared_manager = None
+_shared_manager_lock = threading.Lock()
+
+class CacheManager:
+    """緩存管理器
+
+    各模組把自己的緩存目錄註冊為命名空間（例如 data、charts、audio、temp、digital_humans、market、artifacts、scratch），
+    寫入緩存文件時調用 record()，讀取命中時調用 touch()。
+    管理器以索引記錄每個文件的大小、最後存取時間與所屬模組，
+    在背景線程中分批掃描目錄並執行淘汰：先刪除超過有效期的文件，
+    再按最近存取時間淘汰超出命名空間上限與全局上限的文件。
+    每次維護只處理有限數量的文件，record() 與 touch() 只更新記憶體中的索引，請求不會被淘汰阻塞。
+
+    自行管理生命週期的目錄（渲染結果緩存、任務暫存目錄）以 evictable=False 註冊：計入用量與統計，
+    只刪除超過有效期的遺留文件，不參與按存取時間的淘汰。
+    多個進程共用同一份索引文件，保存時在文件鎖內與其他進程寫入的記錄合併（取較新的存取時間）。
+    """
+
+    def __init__(self, config=None):
+        """初始化緩存管理器
+
+        參數:
+            config (dict, 可選): 緩存設定 (enabled, expire_days, max_size_mb, interval_seconds,
+                scan_batch, evict_batch, min_age_seconds, index_file, namespaces)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.namespaces = {}
+        self.entries = {}
+        self.scanners = {}
+        self.scan_generation = {}
+        self.scan_cursor = 0
+        self.dirty = False
+        self.saved_entries = {}
+        self.removed = set()
+
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_pass = None
+        self.totals = {'expired_files': 0, 'evicted_files': 0, 'freed_bytes': 0, 'passes': 0}
+
+        self.configure(config)
+        self._load_index()
+
+    def configure(self, config=None):
+        """套用緩存設定（已註冊的命名空間重新讀取各自的上限）
+
+        參數:
+            config (dict, 可選): 緩存設定
+        """
+        self.config = config or {}
+        self.enabled = self.config.get('enabled', True)
+        expire_days = self.config.get('expire_days', 7)
+        self.expire_seconds = float(expire_days) * 86400 if expire_days is not None else None
+        max_size_mb = self.config.get('max_size_mb', 1000)
+        self.max_bytes = int(float(max_size_mb) * 1024 * 1024) if max_size_mb is not None else None
+        self.interval = float(self.config.get('interval_seconds', 60))
+        self.scan_batch = int(self.config.get('scan_batch', 2000))
+        self.evict_batch = int(self.config.get('evict_batch', 200))
+        # 剛寫入的文件可能仍在使用中（例如渲染中的臨時文件），不淘汰
+        self.min_age = float(self.config.get('min_age_seconds', 300))
+        self.index_file = self.config.get('index_file', os.path.join(os.getcwd(), 'cache', 'cache_index.json'))
+
+        with self.lock:
+            for name, namespace in self.namespaces.items():
+                self._apply_limits(namespace, namespace['defaults'])
+
+    def register(self, name, path, owner=None, max_size_mb=None, expire_days=None, evictable=True):
+        """註冊緩存命名空間（重複註冊相同名稱時更新設定）
+
+        參數:
+            name (str): 命名空間名稱
+            path (str): 緩存目錄
+            owner (str, 可選): 所屬模組
+            max_size_mb (float, 可選): 命名空間上限（MB），配置中 namespaces.<name>.max_size_mb 優先
+            expire_days (float, 可選): 命名空間有效期（天），預設使用全局 expire_days
+            evictable (bool): 是否參與按存取時間的淘汰（自行管理生命週期的目錄設為 False）
+
+        返回:
+            str: 命名空間名稱
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            namespace = self.namespaces.get(name) or {
+                'name': name,
+                'files': 0,
+                'bytes': 0,
+                'expired_files': 0,
+                'evicted_files': 0,
+                'freed_bytes': 0,
+                'touches': 0
+            }
+            namespace.update({
+                'path': path,
+                'owner': owner or namespace.get('owner') or name,
+                'evictable': evictable,
+                'defaults': {'max_size_mb': max_size_mb, 'expire_days': expire_days}
+            })
+            self._apply_limits(namespace, namespace['defaults'])
+            self.namespaces[name] = namespace
+        return name
+
+    def _apply_limits(self, namespace, defaults):
+        """計算命名空間的大小上限與有效期（調用方需持有鎖）"""
+        overrides = self.config.get('namespaces', {}).get(namespace['name'], {})
+        max_size_mb = overrides.get('max_size_mb', defaults.get('max_size_mb'))
+        expire_days = overrides.get('expire_days', defaults.get('expire_days'))
+        namespace['max_bytes'] = int(float(max_size_mb) * 1024 * 1024) if max_size_mb is not None else None
+        namespace['expire_seconds'] = float(expire_days) * 86400 if expire_days is not None else self.expire_seconds
+
+    def _namespace_for(self, path):
+        """按路徑找出所屬的命名空間（多個命名空間重疊時取最深的目錄）
+
+        參數:
+            path (str): 文件絕對路徑
+
+        返回:
+            str: 命名空間名稱，不屬於任何命名空間時返回 None
+        """
+        best = None
+        for name, namespace in self.namespaces.items():
+            root = namespace['path']
+            if path.startswith(root + os.sep) and (best is None or len(root) > len(self.namespaces[best]['path'])):
+                best = name
+        return best
+
+    def record(self, path, owner=None):
+        """記錄寫入的緩存文件
+
+        參數:
+            path (str): 文件路徑
+            owner (str, 可選): 寫入文件的模組
+        """
+        if not self.enabled:
+            return
+        path = os.path.abspath(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+
+        with self.lock:
+            name = self._namespace_for(path)
+            if name is None:
+                return
+            previous = self.entries.get(path)
+            namespace = self.namespaces[name]
+            if previous is None:
+                namespace['files'] += 1
+            else:
+                namespace['bytes'] -= previous['size']
+            namespace['bytes'] += size
+            self.entries[path] = {
+                'namespace': name,
+                'size': size,
+                'last_access': time.time(),
+                'owner': owner or namespace['owner'],
+                'generation': self.scan_generation.get(name, 0)
+            }
+            self.dirty = True
+
+    def touch(self, path):
+        """記錄緩存文件被讀取（更新最後存取時間）
+
+        參數:
+            path (str): 文件路徑
+        """
+        if not self.enabled:
+            return
+        path = os.path.abspath(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None:
+                entry['last_access'] = time.time()
+                self.namespaces[entry['namespace']]['touches'] += 1
+                self.dirty = True
+                return
+        # 尚未掃描到的文件以寫入的方式記錄
+        self.record(path)
+
+    def start(self):
+        """啟動背景維護線程"""
+        if self.thread is not None or not self.enabled:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._maintenance_loop, name='cache-manager')
+        self.thread.daemon = True
+        self.thread.start()
+        self.logger.info(f"緩存管理已啟動: {len(self.namespaces)} 個命名空間")
+
+    def stop(self):
+        """停止背景維護線程並保存索引"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+        self._save_index()
+
+    def _maintenance_loop(self):
+        """背景維護迴圈"""
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.maintain()
+            except Exception as e:
+                self.logger.error(f"緩存維護失敗: {e}")
+
+    def maintain(self):
+        """執行一次增量維護：掃描一批文件、刪除過期文件、淘汰超出上限的文件
+
+        返回:
+            dict: 本次維護的統計
+        """
+        start_time = time.time()
+        scanned = self._scan_step(self.scan_batch)
+        expired, expired_bytes = self._expire_step(self.evict_batch)
+        evicted, evicted_bytes = self._evict_step(self.evict_batch)
+        self._save_index()
+
+        self.last_pass = {
+            'at': start_time,
+            'scanned': scanned,
+            'expired_files': expired,
+            'evicted_files': evicted,
+            'freed_bytes': expired_bytes + evicted_bytes,
+            'duration': round(time.time() - start_time, 3)
+        }
+        with self.lock:
+            self.totals['passes'] += 1
+            self.totals['expired_files'] += expired
+            self.totals['evicted_files'] += evicted
+            self.totals['freed_bytes'] += expired_bytes + evicted_bytes
+
+        if expired or evicted:
+            self.logger.info(f"緩存維護: 過期 {expired} 個, 淘汰 {evicted} 個文件, "
+                             f"釋放 {(expired_bytes + evicted_bytes) / 1024 / 1024:.1f} MB")
+        return self.last_pass
+
+    def _walk(self, name, root):
+        """逐個產生命名空間目錄中的文件（不進入其他命名空間的目錄）"""
+        nested = {ns['path'] for other, ns in self.namespaces.items() if other != name}
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if os.path.join(directory, d) not in nested]
+            for filename in filenames:
+                yield os.path.join(directory, filename)
+
+    def _scan_step(self, budget):
+        """掃描一批文件，把尚未記錄的文件加入索引
+
+        命名空間輪流掃描（從上次中斷的位置繼續），每個命名空間完整掃描一輪後，移除索引中已不存在的文件。
+
+        參數:
+            budget (int): 本次最多掃描的文件數量
+
+        返回:
+            int: 掃描的文件數量
+        """
+        scanned = 0
+        names = list(self.namespaces)
+        for _ in range(len(names)):
+            name = names[self.scan_cursor % len(names)]
+            namespace = self.namespaces[name]
+            if not os.path.isdir(namespace['path']):
+                self.scan_cursor += 1
+                continue
+
+            scanner = self.scanners.get(name)
+            if scanner is None:
+                scanner = self.scanners[name] = self._walk(name, namespace['path'])
+                self.scan_generation[name] = self.scan_generation.get(name, 0) + 1
+            generation = self.scan_generation[name]
+
+            for path in scanner:
+                scanned += 1
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                with self.lock:
+                    entry = self.entries.get(path)
+                    if entry is None:
+                        # 重啟前保存的存取記錄優先，否則以文件時間估計
+                        last_access, owner = self.saved_entries.pop(path, None) or (
+                            max(stat.st_mtime, stat.st_atime), namespace['owner'])
+                        namespace['files'] += 1
+                        namespace['bytes'] += stat.st_size
+                        self.entries[path] = {
+                            'namespace': name,
+                            'size': stat.st_size,
+                            'last_access': last_access,
+                            'owner': owner,
+                            'generation': generation
+                        }
+                        self.dirty = True
+                    else:
+                        if entry['size'] != stat.st_size:
+                            namespace['bytes'] += stat.st_size - entry['size']
+                            entry['size'] = stat.st_size
+                        entry['generation'] = generation
+                if scanned >= budget:
+                    return scanned
+
+            # 本輪掃描完成：未被掃描到的文件已被刪除
+            del self.scanners[name]
+            self.scan_cursor += 1
+            with self.lock:
+                for path in [p for p, e in self.entries.items() if e['namespace'] == name and e['generation'] < generation]:
+                    self._forget(path)
+
+        return scanned
+
+    def _expire_step(self, budget):
+        """刪除超過有效期的文件
+
+        參數:
+            budget (int): 本次最多刪除的文件數量
+
+        返回:
+            tuple: (刪除的文件數量, 釋放的位元組數)
+        """
+        now = time.time()
+        with self.lock:
+            expired = []
+            for path, entry in self.entries.items():
+                expire_seconds = self.namespaces[entry['namespace']]['expire_seconds']
+                if expire_seconds is not None and now - entry['last_access'] > max(expire_seconds, self.min_age):
+                    expired.append(path)
+                    if len(expired) >= budget:
+                        break
+
+        count, freed = 0, 0
+        for path in expired:
+            size = self._remove(path, 'expired_files')
+            if size is not None:
+                count += 1
+                freed += size
+        return count, freed
+
+    def _evict_step(self, budget):
+        """按最近存取時間淘汰超出命名空間上限與全局上限的文件
+
+        參數:
+            budget (int): 本次最多淘汰的文件數量
+
+        返回:
+            tuple: (淘汰的文件數量, 釋放的位元組數)
+        """
+        count, freed = 0, 0
+        now = time.time()
+
+        # 先處理各命名空間的上限，再處理全局上限
+        targets = [(name, ns['bytes'] - ns['max_bytes']) for name, ns in self.namespaces.items()
+                   if ns['evictable'] and ns['max_bytes'] is not None and ns['bytes'] > ns['max_bytes']]
+        if self.max_bytes is not None:
+            total = sum(ns['bytes'] for ns in self.namespaces.values())
+            if total > self.max_bytes:
+                targets.append((None, total - self.max_bytes))
+
+        for name, excess in targets:
+            if count >= budget:
+                break
+            with self.lock:
+                candidates = heapq.nsmallest(
+                    budget - count,
+                    ((e['last_access'], p) for p, e in self.entries.items()
+                     if (name is None or e['namespace'] == name) and now - e['last_access'] > self.min_age
+                     and self.namespaces[e['namespace']]['evictable'])
+                )
+            for _, path in candidates:
+                if excess <= 0:
+                    break
+                size = self._remove(path, 'evicted_files')
+                if size is not None:
+                    count += 1
+                    freed += size
+                    excess -= size
+
+        return count, freed
+
+    def _remove(self, path, counter):
+        """刪除緩存文件並更新索引
+
+        參數:
+            path (str): 文件路徑
+            counter (str): 命名空間統計的計數欄位
+
+        返回:
+            int: 釋放的位元組數，刪除失敗時返回 None
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"刪除緩存文件失敗: {path}, {e}")
+            return None
+
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return 0
+            namespace = self.namespaces[entry['namespace']]
+            namespace[counter] += 1
+            namespace['freed_bytes'] += entry['size']
+            self._forget(path)
+            self.removed.add(path)
+
+        # 刪除留下的空目錄（不刪除命名空間根目錄）
+        directory = os.path.dirname(path)
+        if directory != namespace['path']:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        return entry['size']
+
+    def _forget(self, path):
+        """從索引中移除文件（調用方需持有鎖）"""
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            namespace = self.namespaces[entry['namespace']]
+            namespace['files'] -= 1
+            namespace['bytes'] -= entry['size']
+            self.dirty = True
+
+    def _load_index(self):
+        """讀取保存的索引（保留重啟前記錄的最後存取時間與所屬模組）"""
+        self.saved_entries = self._read_index_file()
+
+    def _save_index(self):
+        """保存索引（只保存最後存取時間與所屬模組，大小在掃描時重新讀取）
+
+        在文件鎖內讀取其他進程保存的索引並合併：相同文件取較新的存取時間（同時更新本進程的記錄，
+        使淘汰順序反映所有進程的讀取），本進程刪除的文件與已完整掃描的命名空間中不存在的文件被移除。
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            snapshot = {path: [entry['last_access'], entry['owner']] for path, entry in self.entries.items()}
+            removed = self.removed
+            self.removed = set()
+            scanned_roots = [ns['path'] for name, ns in self.namespaces.items()
+                             if name in self.scan_generation and name not in self.scanners]
+            self.dirty = False
+
+        temp_path = f"{self.index_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            with open(f"{self.index_file}.lock", 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+                merged = self._read_index_file()
+                for path in removed:
+                    merged.pop(path, None)
+                for path in [p for p in merged if p not in snapshot]:
+                    if any(path.startswith(root + os.sep) for root in scanned_roots) and not os.path.exists(path):
+                        del merged[path]
+
+                newer = {}
+                for path, (last_access, owner) in snapshot.items():
+                    saved = merged.get(path)
+                    if saved is not None and saved[0] > last_access:
+                        newer[path] = saved[0]
+                    else:
+                        merged[path] = [last_access, owner]
+
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(merged, f)
+                os.replace(temp_path, self.index_file)
+        except Exception as e:
+            self.logger.warning(f"保存緩存索引失敗: {self.index_file}, {e}")
+            return
+
+        with self.lock:
+            for path, last_access in newer.items():
+                entry = self.entries.get(path)
+                if entry is not None and entry['last_access'] < last_access:
+                    entry['last_access'] = last_access
+
+    def _read_index_file(self):
+        """讀取索引文件
+
+        返回:
+            dict: 文件路徑 -> [最後存取時間, 所屬模組]，文件不存在或損壞時返回空字典
+        """
+        if not os.path.exists(self.index_file):
+            return {}
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"讀取緩存索引失敗: {self.index_file}, {e}")
+            return {}
+
+    def stats(self):
+        """獲取緩存統計
+
+        返回:
+            dict: 全局上限與使用量、各命名空間的文件數、大小、上限、淘汰統計，以及最近一次維護的結果
+        """
+        with self.lock:
+            namespaces = {
+                name: {
+                    'path': ns['path'],
+                    'owner': ns['owner'],
+                    'files': ns['files'],
+                    'bytes': ns['bytes'],
+                    'max_bytes': ns['max_bytes'],
+                    'expire_days': ns['expire_seconds'] / 86400 if ns['expire_seconds'] is not None else None,
+                    'evictable': ns['evictable'],
+                    'touches': ns['touches'],
+                    'expired_files': ns['expired_files'],
+                    'evicted_files': ns['evicted_files'],
+                    'freed_bytes': ns['freed_bytes'],
+                    'scan_complete': name not in self.scanners and name in self.scan_generation
+                }
+                for name, ns in self.namespaces.items()
+            }
+            return {
+                'enabled': self.enabled,
+                'bytes': sum(ns['bytes'] for ns in namespaces.values()),
+                'max_bytes': self.max_bytes,
+                'files': len(self.entries),
+                'namespaces': namespaces,
+                'totals': dict(self.totals),
+                'last_pass': self.last_pass
+            }
+
+def get_cache_manager(config=None):
+    """獲取進程內共用的緩存管理器
+
+    第一次調用時建立；之後傳入設定時套用到已有的實例（主控制器以配置文件中的 cache 設定調用）。
+
+    參數:
+        config (dict, 可選): 緩存設定
+
+    返回:
+        CacheManager: 共用緩存管理器
+    """
+    global _shared_manager
+    with _shared_manager_lock:
+        if _shared_manager is None:
+            _shared_manager = CacheManager(config)
+        elif config is not None:
+            _shared_manager.configure(config)
+        return _shared_manager
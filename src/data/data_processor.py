@@ -7,14 +7,30 @@
 
 import os
 import pandas as pd
-import numpy as np
 import logging
 import json
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')  # 設置 Matplotlib 後端，避免需要 GUI
 from datetime import datetime, timedelta
 
+from src.data.cache_manager import get_cache_manager
+from src.data.indicators import add_indicators
+
+_pyplot_module = None
+
+def _pyplot():
+    """延遲載入 pyplot（首次繪製圖表時才載入 Matplotlib）
+
+    返回:
+        module: 已設置 Agg 後端與深色樣式的 matplotlib.pyplot
+    """
+    global _pyplot_module
+    if _pyplot_module is None:
+        import matplotlib
+        matplotlib.use('Agg')  # 設置 Matplotlib 後端，避免需要 GUI
+        import matplotlib.pyplot as plt
+        plt.style.use('dark_background')
+        _pyplot_module = plt
+    return _pyplot_module
+
 class DataProcessor:
     """數據處理器
     
@@ -33,15 +49,14 @@ class DataProcessor:
         
         # 確保緩存目錄存在
         os.makedirs(self.cache_dir, exist_ok=True)
-        
-        # 設置繪圖樣式
-        plt.style.use('dark_background')
+        get_cache_manager().register('charts', self.cache_dir, owner='data_processor')
     
-    def process_stock_data(self, stock_data):
+    def process_stock_data(self, stock_data, indicators=None):
         """處理股票數據
         
         參數:
             stock_data (pandas.DataFrame): 股票數據
+            indicators (list, 可選): 需要的技術指標名稱，預設為全部指標
             
         返回:
             pandas.DataFrame: 處理後的股票數據
@@ -54,7 +69,7 @@ class DataProcessor:
         stock_data = stock_data.sort_index()
         
         # 計算技術指標
-        processed_data = self._add_technical_indicators(stock_data)
+        processed_data = self._add_technical_indicators(stock_data, indicators)
         
         self.logger.info(f"股票數據處理完成，共 {len(processed_data)} 個數據點")
         return processed_data
@@ -292,70 +307,22 @@ class DataProcessor:
                 'file_path': None
             }
     
-    def _add_technical_indicators(self, data):
-        """添加技術指標
+    def _add_technical_indicators(self, data, indicators=None):
+        """添加技術指標（收集器已計算並隨緩存保存的指標不重新計算）
         
         參數:
             data (pandas.DataFrame): 原始股票數據
+            indicators (list, 可選): 需要的指標名稱，預設為全部指標
             
         返回:
             pandas.DataFrame: 添加技術指標後的數據
         """
-        if data.empty:
-            return data
-            
         try:
-            # 計算移動平均線
-            data['SMA_20'] = data['Close'].rolling(window=20).mean()
-            data['SMA_50'] = data['Close'].rolling(window=50).mean()
-            data['SMA_200'] = data['Close'].rolling(window=200).mean()
-            
-            # 計算 RSI
-            delta = data['Close'].diff()
-            gain = delta.where(delta > 0, 0).rolling(window=14).mean()
-            loss = -delta.where(delta < 0, 0).rolling(window=14).mean()
-            rs = gain / loss
-            data['RSI'] = 100 - (100 / (1 + rs))
-            
-            # 計算 MACD
-            exp1 = data['Close'].ewm(span=12, adjust=False).mean()
-            exp2 = data['Close'].ewm(span=26, adjust=False).mean()
-            data['MACD'] = exp1 - exp2
-            data['Signal_Line'] = data['MACD'].ewm(span=9, adjust=False).mean()
-            data['MACD_Histogram'] = data['MACD'] - data['Signal_Line']
-            
-            # 計算布林帶
-            data['Bollinger_Mid'] = data['SMA_20']
-            std = data['Close'].rolling(window=20).std()
-            data['Bollinger_Upper'] = data['Bollinger_Mid'] + (std * 2)
-            data['Bollinger_Lower'] = data['Bollinger_Mid'] - (std * 2)
-            
-            # 計算每日回報率
-            data['Daily_Return'] = data['Close'].pct_change()
-            
-            # 計算波動率 (20天)
-            data['Volatility'] = data['Daily_Return'].rolling(window=20).std() * np.sqrt(252)
-            
-            # 添加交易量相對變化
-            data['Volume_SMA_20'] = data['Volume'].rolling(window=20).mean()
-            data['Volume_Ratio'] = data['Volume'] / data['Volume_SMA_20']
-            
-            # 計算動量指標 (Momentum)
-            data['Momentum'] = data['Close'] / data['Close'].shift(10) - 1
-            
-            # 計算 ATR (Average True Range)
-            tr1 = data['High'] - data['Low']
-            tr2 = abs(data['High'] - data['Close'].shift())
-            tr3 = abs(data['Low'] - data['Close'].shift())
-            data['TR'] = pd.DataFrame([tr1, tr2, tr3]).max()
-            data['ATR'] = data['TR'].rolling(window=14).mean()
-            
-            return data
-            
+            return add_indicators(data, indicators)
         except Exception as e:
             self.logger.error(f"計算技術指標失敗: {e}")
             return data
-            
+    
     def _generate_candlestick_chart(self, stock_data, indicators, output_file):
         """生成 K 線圖
         
@@ -367,6 +334,7 @@ class DataProcessor:
         返回:
             bool: 是否成功
         """
+        plt = _pyplot()
         try:
             ticker = stock_data.attrs.get('ticker', 'STOCK')
             
@@ -492,6 +460,7 @@ class DataProcessor:
         返回:
             bool: 是否成功
         """
+        plt = _pyplot()
         try:
             ticker = stock_data.attrs.get('ticker', 'STOCK')
             
@@ -561,6 +530,7 @@ class DataProcessor:
         返回:
             bool: 是否成功
         """
+        plt = _pyplot()
         try:
             ticker = stock_data.attrs.get('ticker', 'STOCK')
             
@@ -1051,6 +1021,7 @@ class DataProcessor:
         返回:
             str: 圖表文件路徑
         """
+        plt = _pyplot()
         if not stock_data_list or len(stock_data_list) < 2:
             self.logger.error("需要至少兩檔股票進行比較")
             return None
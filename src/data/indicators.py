@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 技術指標計算
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+# 指標名稱 -> 產生的欄位（欄位已全部存在時視為已計算）
+INDICATOR_COLUMNS = {
+    'sma_20': ['SMA_20'],
+    'sma_50': ['SMA_50'],
+    'sma_200': ['SMA_200'],
+    'rsi': ['RSI'],
+    'macd': ['MACD', 'Signal_Line', 'MACD_Histogram'],
+    'bollinger': ['Bollinger_Mid', 'Bollinger_Upper', 'Bollinger_Lower'],
+    'daily_return': ['Daily_Return'],
+    'volatility': ['Volatility'],
+    'volume': ['Volume_SMA_20', 'Volume_Ratio'],
+    'momentum': ['Momentum'],
+    'atr': ['TR', 'ATR']
+}
+
+# 預設計算全部指標（收集器寫入緩存的數據包含全部欄位，處理器命中緩存時不需再計算）
+DEFAULT_INDICATORS = tuple(INDICATOR_COLUMNS)
+
+# 各指標需要的原始欄位（Close 以外）
+REQUIRED_INPUTS = {
+    'volume': ('Volume',),
+    'atr': ('High', 'Low')
+}
+
+logger = logging.getLogger(__name__)
+
+class IndicatorEngine:
+    """技術指標計算引擎
+
+    輸入可以是單檔股票的 Series，也可以是多檔股票的寬表（每欄一檔股票），計算方式相同。
+    同一次計算中的中間結果（滾動窗口、均線、標準差、日回報率、價格差分）只計算一次，
+    由需要它們的指標共用，例如 SMA_20 與布林帶共用同一個 20 期滾動窗口。
+    """
+
+    def __init__(self, close, high=None, low=None, volume=None):
+        """初始化技術指標計算引擎
+
+        參數:
+            close (pandas.Series 或 pandas.DataFrame): 收盤價
+            high (pandas.Series 或 pandas.DataFrame, 可選): 最高價
+            low (pandas.Series 或 pandas.DataFrame, 可選): 最低價
+            volume (pandas.Series 或 pandas.DataFrame, 可選): 成交量
+        """
+        self.inputs = {'Close': close, 'High': high, 'Low': low, 'Volume': volume}
+        self.memo = {}
+
+    def _shared(self, key, func):
+        """讀取或計算共用的中間結果"""
+        if key not in self.memo:
+            self.memo[key] = func()
+        return self.memo[key]
+
+    def rolling(self, column, window):
+        """共用的滾動窗口"""
+        return self._shared(('rolling', column, window), lambda: self.inputs[column].rolling(window=window))
+
+    def sma(self, window, column='Close'):
+        """簡單移動平均"""
+        return self._shared(('sma', column, window), lambda: self.rolling(column, window).mean())
+
+    def std(self, window):
+        """收盤價的滾動標準差"""
+        return self._shared(('std', window), lambda: self.rolling('Close', window).std())
+
+    def ema(self, span):
+        """收盤價的指數移動平均"""
+        return self._shared(('ema', span), lambda: self.inputs['Close'].ewm(span=span, adjust=False).mean())
+
+    def delta(self):
+        """收盤價的差分"""
+        return self._shared('delta', lambda: self.inputs['Close'].diff())
+
+    def daily_return(self):
+        """日回報率"""
+        return self._shared('daily_return', lambda: self.inputs['Close'].pct_change())
+
+    def true_range(self):
+        """真實波幅（最高最低價差、與前收盤價差的最大值）"""
+        def compute():
+            prev_close = self.inputs['Close'].shift()
+            high, low = self.inputs['High'], self.inputs['Low']
+            return np.fmax(np.fmax(high - low, (high - prev_close).abs()), (low - prev_close).abs())
+        return self._shared('true_range', compute)
+
+    def available(self, name):
+        """是否有計算指定指標所需的原始欄位"""
+        return all(self.inputs.get(column) is not None for column in REQUIRED_INPUTS.get(name, ()))
+
+    def compute(self, name):
+        """計算一個指標
+
+        參數:
+            name (str): 指標名稱（INDICATOR_COLUMNS 的鍵）
+
+        返回:
+            dict: 欄位名稱 -> 計算結果
+        """
+        if name in ('sma_20', 'sma_50', 'sma_200'):
+            window = int(name.split('_')[1])
+            return {f'SMA_{window}': self.sma(window)}
+
+        if name == 'rsi':
+            delta = self.delta()
+            gain = delta.where(delta > 0, 0).rolling(window=14).mean()
+            loss = -delta.where(delta < 0, 0).rolling(window=14).mean()
+            return {'RSI': 100 - (100 / (1 + gain / loss))}
+
+        if name == 'macd':
+            macd = self.ema(12) - self.ema(26)
+            signal = macd.ewm(span=9, adjust=False).mean()
+            return {'MACD': macd, 'Signal_Line': signal, 'MACD_Histogram': macd - signal}
+
+        if name == 'bollinger':
+            mid, std = self.sma(20), self.std(20)
+            return {'Bollinger_Mid': mid, 'Bollinger_Upper': mid + std * 2, 'Bollinger_Lower': mid - std * 2}
+
+        if name == 'daily_return':
+            return {'Daily_Return': self.daily_return()}
+
+        if name == 'volatility':
+            return {'Volatility': self.daily_return().rolling(window=20).std() * np.sqrt(252)}
+
+        if name == 'volume':
+            volume_sma = self.sma(20, 'Volume')
+            return {'Volume_SMA_20': volume_sma, 'Volume_Ratio': self.inputs['Volume'] / volume_sma}
+
+        if name == 'momentum':
+            close = self.inputs['Close']
+            return {'Momentum': close / close.shift(10) - 1}
+
+        if name == 'atr':
+            tr = self.true_range()
+            return {'TR': tr, 'ATR': tr.rolling(window=14).mean()}
+
+        raise ValueError(f"不支援的技術指標: {name}")
+
+def missing_indicators(data, indicators=None):
+    """找出尚未計算的指標
+
+    參數:
+        data (pandas.DataFrame): 股票數據
+        indicators (list, 可選): 需要的指標名稱，預設為全部指標
+
+    返回:
+        list: 欄位不完整的指標名稱
+    """
+    names = DEFAULT_INDICATORS if indicators is None else indicators
+    unknown = [name for name in names if name not in INDICATOR_COLUMNS]
+    if unknown:
+        logger.warning(f"忽略不支援的技術指標: {', '.join(unknown)}")
+    return [name for name in names
+            if name in INDICATOR_COLUMNS and not all(column in data.columns for column in INDICATOR_COLUMNS[name])]
+
+def add_indicators(data, indicators=None):
+    """添加技術指標（只計算尚未存在的指標）
+
+    參數:
+        data (pandas.DataFrame): 股票數據（直接寫入欄位）
+        indicators (list, 可選): 需要的指標名稱，預設為全部指標
+
+    返回:
+        pandas.DataFrame: 添加技術指標後的數據
+    """
+    if data is None or data.empty:
+        return data
+
+    names = missing_indicators(data, indicators)
+    if not names:
+        return data
+
+    engine = IndicatorEngine(*(data[column] if column in data.columns else None
+                               for column in ('Close', 'High', 'Low', 'Volume')))
+    for name in names:
+        if not engine.available(name):
+            logger.debug(f"缺少原始欄位，跳過技術指標: {name}")
+            continue
+        for column, values in engine.compute(name).items():
+            data[column] = values
+    return data
+
+def add_indicators_bulk(frames, indicators=None):
+    """批量添加技術指標
+
+    交易日與缺少的指標都相同的股票（通常是同一市場）合併為寬表，每個指標對所有股票只計算一次，
+    結果與逐個調用 add_indicators 相同。
+
+    參數:
+        frames (dict): 股票代碼 -> 股票數據（直接寫入欄位）
+        indicators (list, 可選): 需要的指標名稱，預設為全部指標
+
+    返回:
+        dict: 股票代碼 -> 添加技術指標後的數據
+    """
+    # 按交易日索引分組，避免不同市場的休市日在滾動窗口中產生空值
+    groups = {}
+    for ticker, data in frames.items():
+        if data is None or data.empty:
+            continue
+        names = tuple(missing_indicators(data, indicators))
+        if names:
+            groups.setdefault((tuple(data.index), names), []).append(ticker)
+
+    results = dict(frames)
+    for (_, names), tickers in groups.items():
+        if len(tickers) == 1:
+            results[tickers[0]] = add_indicators(frames[tickers[0]], names)
+            continue
+
+        panels = {}
+        for column in ('Close', 'High', 'Low', 'Volume'):
+            if all(column in frames[t].columns for t in tickers):
+                panels[column] = pd.DataFrame({t: frames[t][column] for t in tickers})
+        engine = IndicatorEngine(panels['Close'], panels.get('High'), panels.get('Low'), panels.get('Volume'))
+
+        for name in names:
+            if not engine.available(name):
+                logger.debug(f"缺少原始欄位，跳過技術指標: {name}")
+                continue
+            for column, panel in engine.compute(name).items():
+                for ticker in tickers:
+                    frames[ticker][column] = panel[ticker]
+
+        for ticker in tickers:
+            results[ticker] = frames[ticker]
+
+    return results
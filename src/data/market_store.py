@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 行情數據存儲
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+import pandas as pd
+
+from src.data.cache_manager import get_cache_manager
+
+# Parquet 需要 pyarrow，未安裝時以 pickle 保存
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# 行情數據欄位（技術指標不寫入存儲，讀取後按需計算）
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# 時間範圍對應的天數（用於判斷存儲的歷史是否足夠）
+PERIOD_DAYS = {
+    '1d': 1, '5d': 5, '1mo': 31, '3mo': 92, '6mo': 183,
+    '1y': 366, '2y': 731, '5y': 1827, '10y': 3653, 'ytd': 366, 'max': float('inf')
+}
+
+# 分鐘級數據可回溯的最長天數（超過時只能重新下載）
+INTRADAY_LOOKBACK_DAYS = {
+    '1m': 7, '2m': 60, '5m': 60, '15m': 60, '30m': 60, '60m': 730, '90m': 60, '1h': 730
+}
+
+# 分鐘級數據每根 K 線的秒數：緩存有效期與存儲刷新間隔不超過一根 K 線，刷新時才能取得新的 K 線
+BAR_SECONDS = {
+    '1m': 60, '2m': 120, '5m': 300, '15m': 900, '30m': 1800, '60m': 3600, '90m': 5400, '1h': 3600
+}
+
+def bar_seconds(interval):
+    """獲取分鐘級數據每根 K 線的秒數
+
+    參數:
+        interval (str): 數據間隔
+
+    返回:
+        float: 秒數，日線及以上的間隔返回 None
+    """
+    return BAR_SECONDS.get(interval)
+
+class MarketStore:
+    """行情數據存儲
+
+    每個股票代碼與數據間隔保存一份列式文件（Parquet，可壓縮；無 pyarrow 時使用 pickle），
+    內容為目前取得的最長歷史。刷新時只下載最後一根 K 線之後的數據並追加，
+    任何時間範圍都從同一份歷史切片得到，每日刷新只需要一兩根 K 線而非整年數據。
+    """
+
+    def __init__(self, config=None):
+        """初始化行情數據存儲
+
+        參數:
+            config (dict, 可選): 設定 (dir, format, compression, refresh_minutes)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.store_dir = self.config.get('dir', os.path.join(os.getcwd(), 'cache', 'market'))
+        self.compression = self.config.get('compression', 'snappy')
+        self.refresh_seconds = float(self.config.get('refresh_minutes', 60)) * 60
+        # 增量刷新時重疊 K 線收盤價的相對容差，超過時視為上游已重新調整歷史（拆股或除權息）
+        self.adjust_tolerance = float(self.config.get('adjust_tolerance', 0.0005))
+
+        self.format = self.config.get('format', 'parquet')
+        if self.format == 'parquet' and not PARQUET_AVAILABLE:
+            self.logger.info("未安裝 pyarrow，行情數據以 pickle 保存")
+            self.format = 'pickle'
+
+        self.lock = threading.Lock()
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.cache_manager = get_cache_manager()
+        self.cache_manager.register('market', self.store_dir, owner='market_store')
+
+    def _paths(self, ticker, interval):
+        """獲取數據文件與描述文件路徑
+
+        參數:
+            ticker (str): 股票代碼
+            interval (str): 數據間隔
+
+        返回:
+            tuple: (數據文件路徑, 描述文件路徑)
+        """
+        directory = os.path.join(self.store_dir, interval)
+        os.makedirs(directory, exist_ok=True)
+        extension = 'parquet' if self.format == 'parquet' else 'pkl'
+        base = os.path.join(directory, ticker.replace('^', 'IDX_'))
+        return f"{base}.{extension}", f"{base}.json"
+
+    def load(self, ticker, interval):
+        """讀取已存儲的歷史
+
+        參數:
+            ticker (str): 股票代碼
+            interval (str): 數據間隔
+
+        返回:
+            tuple: (pandas.DataFrame, 描述字典)，沒有存儲時返回 (None, None)
+        """
+        data_path, meta_path = self._paths(ticker, interval)
+        if not os.path.exists(data_path) or not os.path.exists(meta_path):
+            return None, None
+
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if self.format == 'parquet':
+                data = pd.read_parquet(data_path)
+            else:
+                data = pd.read_pickle(data_path)
+            self.cache_manager.touch(data_path)
+            self.cache_manager.touch(meta_path)
+            return data, meta
+        except Exception as e:
+            self.logger.warning(f"讀取行情數據失敗: {data_path}, {e}")
+            return None, None
+
+    def save(self, ticker, interval, data, period=None, meta=None, replace=False):
+        """寫入歷史（與既有存儲合併，相同時間的 K 線以新數據為準）
+
+        參數:
+            ticker (str): 股票代碼
+            interval (str): 數據間隔
+            data (pandas.DataFrame): 新數據
+            period (str, 可選): 這次下載的時間範圍（整段下載時提供，用於記錄存儲的深度）
+            meta (dict, 可選): 既有的描述字典
+            replace (bool): 是否以新數據取代既有歷史而不合併（上游重新調整價格後的整段下載）
+
+        返回:
+            pandas.DataFrame: 合併後的完整歷史
+        """
+        data_path, meta_path = self._paths(ticker, interval)
+
+        with self.lock:
+            if meta is None:
+                stored, meta = self.load(ticker, interval)
+            else:
+                stored, _ = self.load(ticker, interval)
+            meta = dict(meta or {})
+
+            columns = [c for c in OHLCV_COLUMNS if c in data.columns]
+            merged = data[columns]
+            if stored is not None and not stored.empty and not replace:
+                merged = pd.concat([stored, align_timezone(merged, stored.index.tz)])
+                merged = merged[~merged.index.duplicated(keep='last')]
+            merged = merged.sort_index()
+
+            if period is not None and PERIOD_DAYS.get(period, 0) > PERIOD_DAYS.get(meta.get('depth'), 0):
+                meta['depth'] = period
+            meta['refreshed_at'] = time.time()
+            meta['bars'] = len(merged)
+
+            # 先寫臨時文件再改名，讀取端不會看到寫到一半的文件
+            suffix = f".{os.getpid()}_{threading.get_ident()}.tmp"
+            try:
+                if self.format == 'parquet':
+                    merged.to_parquet(data_path + suffix, compression=self.compression)
+                else:
+                    merged.to_pickle(data_path + suffix)
+                os.replace(data_path + suffix, data_path)
+                with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+                    json.dump(meta, f)
+                os.replace(meta_path + suffix, meta_path)
+                self.cache_manager.record(data_path)
+                self.cache_manager.record(meta_path)
+            except Exception as e:
+                self.logger.error(f"寫入行情數據失敗: {data_path}, {e}")
+                for path in (data_path + suffix, meta_path + suffix):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        return merged
+
+    def covers(self, meta, period):
+        """存儲的歷史是否足以切出指定時間範圍
+
+        參數:
+            meta (dict): 描述字典
+            period (str): 時間範圍
+
+        返回:
+            bool: 是否足夠
+        """
+        if not meta or period not in PERIOD_DAYS:
+            return False
+        return PERIOD_DAYS.get(meta.get('depth'), 0) >= PERIOD_DAYS[period]
+
+    def is_stale(self, meta, interval=None):
+        """存儲是否需要刷新
+
+        分鐘級數據的刷新間隔不超過一根 K 線。
+
+        參數:
+            meta (dict): 描述字典
+            interval (str, 可選): 數據間隔
+
+        返回:
+            bool: 是否超過刷新間隔
+        """
+        refresh_seconds = min(self.refresh_seconds, bar_seconds(interval) or self.refresh_seconds)
+        return time.time() - (meta or {}).get('refreshed_at', 0) >= refresh_seconds
+
+    def can_append(self, data, interval):
+        """是否能以增量下載補齊（分鐘級數據只能回溯有限天數）
+
+        參數:
+            data (pandas.DataFrame): 已存儲的歷史
+            interval (str): 數據間隔
+
+        返回:
+            bool: 是否能增量下載
+        """
+        if data is None or data.empty:
+            return False
+        limit = INTRADAY_LOOKBACK_DAYS.get(interval)
+        if limit is None:
+            return True
+        last = data.index[-1]
+        now = pd.Timestamp.now(tz=last.tz) if last.tz is not None else pd.Timestamp.now()
+        return (now - last).days < limit
+
+    def append_start(self, data):
+        """增量下載的開始時間
+        
+        從倒數第二根 K 線開始下載，與存儲重疊一根已完成的 K 線（最後一根可能是盤中未完成的 K 線），
+        用於檢查上游是否已重新調整歷史價格。
+
+        參數:
+            data (pandas.DataFrame): 已存儲的歷史
+
+        返回:
+            pandas.Timestamp: 開始時間（包含）
+        """
+        return data.index[-2] if len(data) > 1 else data.index[-1]
+
+    def is_readjusted(self, stored, new_bars):
+        """重疊 K 線的收盤價是否與存儲不同
+        
+        上游返回的是復權價格，拆股或除權息後全部歷史都會重新調整，
+        只追加新的 K 線會在存儲的歷史中留下永久的價格跳空，需要重新下載整段歷史。
+
+        參數:
+            stored (pandas.DataFrame): 已存儲的歷史
+            new_bars (pandas.DataFrame): 從 append_start 開始下載的數據
+
+        返回:
+            bool: 是否已重新調整
+        """
+        if stored is None or stored.empty or new_bars is None or new_bars.empty or 'Close' not in new_bars.columns:
+            return False
+        anchor = self.append_start(stored)
+        fetched = align_timezone(new_bars, stored.index.tz)
+        if anchor not in fetched.index:
+            return False
+        old_close = float(stored.at[anchor, 'Close'])
+        new_close = float(fetched['Close'].loc[[anchor]].iloc[-1])
+        return abs(new_close - old_close) > self.adjust_tolerance * max(abs(old_close), 1e-9)
+
+    def slice_period(self, data, period):
+        """從完整歷史切出指定時間範圍（以目前時間為基準）
+
+        參數:
+            data (pandas.DataFrame): 完整歷史
+            period (str): 時間範圍
+
+        返回:
+            pandas.DataFrame: 切片（副本）
+        """
+        if data is None:
+            return None
+        return slice_period(data, period).copy()
+
+def align_timezone(data, tz):
+    """把數據的時間索引轉為指定時區（yf.download 與 history 的時區處理不同）
+
+    參數:
+        data (pandas.DataFrame): 數據
+        tz: 目標時區，None 表示不含時區（保留當地時間）
+
+    返回:
+        pandas.DataFrame: 時區一致的數據
+    """
+    if data.index.tz is None and tz is not None:
+        data = data.copy()
+        data.index = data.index.tz_localize(tz)
+    elif data.index.tz is not None and tz is None:
+        data = data.copy()
+        data.index = data.index.tz_localize(None)
+    elif data.index.tz is not None and str(data.index.tz) != str(tz):
+        data = data.copy()
+        data.index = data.index.tz_convert(tz)
+    return data
+
+def slice_period(data, period, now=None):
+    """切出指定時間範圍（與 yfinance 的 period 語義相同）
+
+    參數:
+        data (pandas.DataFrame): 完整數據
+        period (str): 時間範圍
+        now (pandas.Timestamp, 可選): 計算範圍的基準時間，預設為目前時間
+
+    返回:
+        pandas.DataFrame: 切片
+    """
+    if data.empty or not period or period == 'max':
+        return data
+
+    if now is None:
+        last = data.index[-1]
+        now = pd.Timestamp.now(tz=last.tz) if last.tz is not None else pd.Timestamp.now()
+
+    if period == 'ytd':
+        start = now.normalize().replace(month=1, day=1)
+    elif period.endswith('d'):
+        # N 天指最近 N 個交易日
+        days = int(period[:-1])
+        dates = pd.Index(data.index.normalize()).unique()
+        start = dates[-days] if len(dates) >= days else dates[0]
+    else:
+        start = now - pd.Timedelta(days=PERIOD_DAYS.get(period, 366))
+
+    return data[data.index >= start]
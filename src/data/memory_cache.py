@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 進程內行情數據緩存
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# 磁碟緩存的有效期（與 StockDataCollector 的一天規則一致）
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+# 進程內共用的緩存實例
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+class MemoryCache:
+    """進程內行情數據 LRU 緩存
+
+    以 (股票代碼, 時間範圍, 數據間隔) 為鍵保存已計算技術指標的 DataFrame，
+    每個條目記錄數據版本（產生或寫入磁碟緩存的時間），到期時間與磁碟緩存相同。
+    總大小超過上限時淘汰最久未使用的條目。熱門股票直接從記憶體返回，不需讀取磁碟。
+    """
+
+    def __init__(self, config=None):
+        """初始化行情數據緩存
+
+        參數:
+            config (dict, 可選): 設定 (max_mb, ttl_seconds)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.max_bytes = int(float(self.config.get('max_mb', 256)) * 1024 * 1024)
+        self.ttl = float(self.config.get('ttl_seconds', DEFAULT_TTL_SECONDS))
+
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """讀取緩存
+
+        參數:
+            key (tuple): 緩存鍵
+
+        返回:
+            pandas.DataFrame: 數據副本，未命中或已過期時返回 None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if time.time() - entry['version'] >= entry['ttl']:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            data = entry['data']
+
+        # 返回副本，調用方修改數據不會影響緩存
+        return data.copy()
+
+    def put(self, key, data, version=None, ttl=None):
+        """寫入緩存
+
+        已有較新版本時不覆蓋；單個條目超過上限時不緩存。
+
+        參數:
+            key (tuple): 緩存鍵
+            data (pandas.DataFrame): 數據
+            version (float, 可選): 數據版本（時間戳），預設為當前時間
+            ttl (float, 可選): 此條目的有效秒數（例如分鐘級數據為一根 K 線），不超過緩存的 ttl_seconds
+
+        返回:
+            bool: 是否已寫入
+        """
+        if data is None or data.empty:
+            return False
+
+        version = time.time() if version is None else version
+        ttl = self.ttl if ttl is None else min(float(ttl), self.ttl)
+        if time.time() - version >= ttl:
+            return False
+
+        size = int(data.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            self.logger.debug(f"數據超過記憶體緩存上限，不緩存: {key}")
+            return False
+
+        with self.lock:
+            current = self.entries.get(key)
+            if current is not None and current['version'] > version:
+                return False
+            if current is not None:
+                self._remove(key)
+
+            self.entries[key] = {'data': data.copy(), 'version': version, 'ttl': ttl, 'bytes': size}
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+        return True
+
+    def invalidate(self, key):
+        """刪除緩存條目
+
+        參數:
+            key (tuple): 緩存鍵
+        """
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def clear(self):
+        """清空緩存"""
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        """刪除條目（調用方需持有鎖）
+
+        參數:
+            key (tuple): 緩存鍵
+        """
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry['bytes']
+
+    def stats(self):
+        """獲取緩存統計
+
+        返回:
+            dict: 條目數、大小、上限、命中與未命中次數、命中率、淘汰與過期次數
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+def get_shared_cache(config=None):
+    """獲取進程內共用的行情數據緩存（第一次調用時以其設定建立）
+
+    參數:
+        config (dict, 可選): 設定 (max_mb, ttl_seconds)
+
+    返回:
+        MemoryCache: 共用緩存
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = MemoryCache(config)
+        return _shared_cache
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 行情數據來源
+"""
+
+import os
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+import pandas as pd
+
+from src.data.market_store import OHLCV_COLUMNS, PARQUET_AVAILABLE, align_timezone, slice_period
+
+class DataProvider(ABC):
+    """行情數據來源基類
+
+    StockDataCollector 透過數據來源獲取原始行情、基本信息與新聞，
+    緩存、增量刷新與技術指標計算都在收集器中完成，與來源無關。
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    def history(self, ticker, period=None, interval="1d", start=None):
+        """獲取原始行情數據
+
+        參數:
+            ticker (str): 股票代碼
+            period (str, 可選): 時間範圍（與 start 二選一）
+            interval (str): 數據間隔
+            start (datetime, 可選): 開始時間（包含）
+
+        返回:
+            pandas.DataFrame: OHLCV 數據，沒有數據時返回空 DataFrame
+        """
+
+    def download(self, tickers, period, interval="1d"):
+        """批量獲取多檔股票的原始行情數據（預設逐檔調用 history）
+
+        參數:
+            tickers (list): 股票代碼列表
+            period (str): 時間範圍
+            interval (str): 數據間隔
+
+        返回:
+            dict: 股票代碼 -> OHLCV 數據（不含沒有數據的股票）
+        """
+        frames = {}
+        for ticker in tickers:
+            data = self.history(ticker, period=period, interval=interval)
+            if data is not None and not data.empty:
+                frames[ticker] = data
+        return frames
+
+    @abstractmethod
+    def info(self, ticker):
+        """獲取股票基本信息
+
+        參數:
+            ticker (str): 股票代碼
+
+        返回:
+            dict: 基本信息
+        """
+
+    @abstractmethod
+    def news(self, ticker):
+        """獲取股票新聞（Yahoo Finance 格式的原始條目）
+
+        參數:
+            ticker (str): 股票代碼
+
+        返回:
+            list: 新聞條目
+        """
+
+class YahooProvider(DataProvider):
+    """Yahoo Finance 數據來源（yfinance）"""
+
+    name = 'yahoo'
+
+    def __init__(self, config=None):
+        """初始化 Yahoo Finance 數據來源
+
+        參數:
+            config (dict, 可選): 設定 (threads)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        # 延遲導入，使用本地數據來源時不需要安裝 yfinance
+        import yfinance as yf
+        self.yf = yf
+
+    def history(self, ticker, period=None, interval="1d", start=None):
+        if start is not None:
+            return self.yf.Ticker(ticker).history(start=start, interval=interval)
+        return self.yf.Ticker(ticker).history(period=period, interval=interval)
+
+    def download(self, tickers, period, interval="1d"):
+        data = self.yf.download(
+            list(tickers),
+            period=period,
+            interval=interval,
+            group_by='ticker',
+            auto_adjust=True,
+            actions=False,
+            threads=self.config.get('threads', True),
+            progress=False
+        )
+        return self._split_download(data, tickers)
+
+    def _split_download(self, data, tickers):
+        """把分組下載的結果拆分為每檔股票的數據
+
+        參數:
+            data (pandas.DataFrame): yf.download 的結果
+            tickers (list): 請求的股票代碼列表
+
+        返回:
+            dict: 股票代碼 -> 數據（去除全為空值的行）
+        """
+        frames = {}
+        if data is None or data.empty:
+            return frames
+
+        columns = data.columns
+        if getattr(columns, 'nlevels', 1) > 1:
+            # group_by='ticker' 時第一層為代碼，部分版本的第二層才是代碼
+            level = 0 if set(tickers) & set(columns.get_level_values(0)) else 1
+            available = set(columns.get_level_values(level))
+            for ticker in tickers:
+                if ticker in available:
+                    frames[ticker] = data.xs(ticker, axis=1, level=level).dropna(how='all').copy()
+        elif len(tickers) == 1:
+            frames[tickers[0]] = data.dropna(how='all').copy()
+
+        for ticker, frame in list(frames.items()):
+            if frame.empty:
+                del frames[ticker]
+                continue
+            frame.attrs['ticker'] = ticker
+
+        return frames
+
+    def info(self, ticker):
+        return self.yf.Ticker(ticker).info
+
+    def news(self, ticker):
+        return self.yf.Ticker(ticker).news
+
+class LocalProvider(DataProvider):
+    """本地數據來源
+
+    從數據目錄讀取 Parquet 或 CSV 行情文件，不需要網路，結果可重現：
+        <dir>/<interval>/<代碼>.parquet|.csv（找不到時讀取 <dir>/<代碼>.parquet|.csv）
+        <dir>/info/<代碼>.json
+        <dir>/news/<代碼>.json
+    代碼中的 ^ 寫為 IDX_（例如 IDX_GSPC.csv）。
+    時間範圍從文件中最後一根 K 線往前計算，與目前時間無關。
+    """
+
+    name = 'local'
+
+    def __init__(self, config=None):
+        """初始化本地數據來源
+
+        參數:
+            config (dict, 可選): 設定 (fixtures_dir)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.fixtures_dir = self.config.get('fixtures_dir', os.path.join(os.getcwd(), 'fixtures', 'market'))
+
+    def _file_name(self, ticker):
+        """代碼對應的文件名（不含副檔名）"""
+        return ticker.replace('^', 'IDX_')
+
+    def _find_history_file(self, ticker, interval):
+        """尋找行情文件
+
+        參數:
+            ticker (str): 股票代碼
+            interval (str): 數據間隔
+
+        返回:
+            str: 文件路徑，找不到時返回 None
+        """
+        name = self._file_name(ticker)
+        for directory in (os.path.join(self.fixtures_dir, interval), self.fixtures_dir):
+            for extension in ('parquet', 'csv'):
+                path = os.path.join(directory, f"{name}.{extension}")
+                if os.path.exists(path):
+                    return path
+        return None
+
+    def read_history(self, ticker, interval):
+        """讀取行情文件的全部數據
+
+        參數:
+            ticker (str): 股票代碼
+            interval (str): 數據間隔
+
+        返回:
+            pandas.DataFrame: 數據，沒有文件時返回 None
+        """
+        path = self._find_history_file(ticker, interval)
+        if path is None:
+            return None
+
+        if path.endswith('.parquet'):
+            data = pd.read_parquet(path)
+        else:
+            # CSV 的時間為當地時間；帶有時區偏移時保留當地時間並去除時區
+            data = pd.read_csv(path, index_col=0)
+            try:
+                index = pd.to_datetime(data.index)
+            except ValueError:
+                index = pd.to_datetime(data.index.str[:19])
+            data.index = index.tz_localize(None) if index.tz is not None else index
+        data = data.sort_index()
+        data.attrs['ticker'] = ticker
+        return data
+
+    def history(self, ticker, period=None, interval="1d", start=None):
+        data = self.read_history(ticker, interval)
+        if data is None:
+            self.logger.warning(f"本地數據目錄中沒有行情文件: {ticker} ({interval})")
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+
+        if start is not None:
+            start = pd.Timestamp(start)
+            if data.index.tz is not None and start.tz is None:
+                start = start.tz_localize(data.index.tz)
+            elif data.index.tz is None and start.tz is not None:
+                start = start.tz_localize(None)
+            return data[data.index >= start]
+
+        # 以最後一根 K 線為基準，結果與目前時間無關
+        return slice_period(data, period, now=data.index[-1] if not data.empty else None)
+
+    def _read_json(self, kind, ticker, default):
+        """讀取基本信息或新聞文件"""
+        path = os.path.join(self.fixtures_dir, kind, f"{self._file_name(ticker)}.json")
+        if not os.path.exists(path):
+            return default
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def info(self, ticker):
+        return self._read_json('info', ticker, {'symbol': ticker})
+
+    def news(self, ticker):
+        return self._read_json('news', ticker, [])
+
+class RecordingProvider(DataProvider):
+    """錄製數據來源
+
+    包裝另一個數據來源（通常是 Yahoo Finance），把每次取得的結果以 LocalProvider 的目錄結構寫入數據目錄，
+    之後可以用 LocalProvider 離線重播。行情數據與已錄製的內容合併，相同時間的 K 線以新數據為準。
+    """
+
+    name = 'record'
+
+    def __init__(self, source, config=None):
+        """初始化錄製數據來源
+
+        參數:
+            source (DataProvider): 實際的數據來源
+            config (dict, 可選): 設定 (fixtures_dir, format: parquet 或 csv)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.source = source
+        self.local = LocalProvider(self.config)
+        self.fixtures_dir = self.local.fixtures_dir
+        self.format = self.config.get('format', 'parquet' if PARQUET_AVAILABLE else 'csv')
+        if self.format == 'parquet' and not PARQUET_AVAILABLE:
+            self.format = 'csv'
+        self.lock = threading.Lock()
+
+    def history(self, ticker, period=None, interval="1d", start=None):
+        data = self.source.history(ticker, period=period, interval=interval, start=start)
+        self._record_history(ticker, interval, data)
+        return data
+
+    def download(self, tickers, period, interval="1d"):
+        frames = self.source.download(tickers, period, interval)
+        for ticker, data in frames.items():
+            self._record_history(ticker, interval, data)
+        return frames
+
+    def info(self, ticker):
+        info = self.source.info(ticker)
+        self._record_json('info', ticker, info)
+        return info
+
+    def news(self, ticker):
+        news = self.source.news(ticker)
+        self._record_json('news', ticker, news)
+        return news
+
+    def _record_history(self, ticker, interval, data):
+        """把行情數據合併寫入數據目錄
+
+        參數:
+            ticker (str): 股票代碼
+            interval (str): 數據間隔
+            data (pandas.DataFrame): 行情數據
+        """
+        if data is None or data.empty:
+            return
+
+        directory = os.path.join(self.fixtures_dir, interval)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.local._file_name(ticker)}.{self.format}")
+
+        try:
+            with self.lock:
+                columns = [c for c in OHLCV_COLUMNS if c in data.columns]
+                merged = data[columns]
+                existing = self.local.read_history(ticker, interval)
+                if existing is not None and not existing.empty:
+                    merged = pd.concat([existing, align_timezone(merged, existing.index.tz)])
+                    merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+                if self.format == 'csv':
+                    merged = align_timezone(merged, None)
+
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                if self.format == 'parquet':
+                    merged.to_parquet(temp_path)
+                else:
+                    merged.to_csv(temp_path)
+                os.replace(temp_path, path)
+        except Exception as e:
+            self.logger.warning(f"錄製行情數據失敗: {ticker}, {e}")
+
+    def _record_json(self, kind, ticker, value):
+        """把基本信息或新聞寫入數據目錄
+
+        參數:
+            kind (str): info 或 news
+            ticker (str): 股票代碼
+            value: 要寫入的數據
+        """
+        directory = os.path.join(self.fixtures_dir, kind)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.local._file_name(ticker)}.json")
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False, indent=2, default=str)
+        except Exception as e:
+            self.logger.warning(f"錄製數據失敗: {path}, {e}")
+
+def create_provider(config=None):
+    """按設定建立數據來源
+
+    參數:
+        config (dict, 可選): 設定 (type: yahoo、local 或 record；fixtures_dir；format)
+
+    返回:
+        DataProvider: 數據來源
+    """
+    config = config or {}
+    provider_type = config.get('type', 'yahoo')
+
+    if provider_type == 'local':
+        return LocalProvider(config)
+    if provider_type == 'record':
+        return RecordingProvider(YahooProvider(config), config)
+    if provider_type != 'yahoo':
+        logging.getLogger(__name__).warning(f"不支援的數據來源類型: {provider_type}，使用 Yahoo Finance")
+    return YahooProvider(config)
@@ -5,13 +5,29 @@
 股票數據影片自動化製作系統 - 股票數據收集器
 """
 
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import requests
 import logging
 from datetime import datetime, timedelta
 import os
+import time
+import zlib
+
+from src.data.market_store import OHLCV_COLUMNS, MarketStore, bar_seconds
+from src.data.indicators import add_indicators, add_indicators_bulk
+from src.data.streaming_indicators import STREAMING_INTERVALS, IndicatorStream
+from src.data.providers import create_provider
+from src.data.symbol_index import get_symbol_index
+from src.data.memory_cache import DEFAULT_TTL_SECONDS, get_shared_cache
+from src.data.cache_manager import get_cache_manager
+from src.utils.single_flight import SingleFlight
+
+# 進程內共用：同一時間相同的上游請求只發出一次
+_inflight = SingleFlight()
+
+# 模擬數據的固定結束日期（與執行時間無關，同一代碼的模擬數據在任何時候都相同）
+SIMULATED_END_DATE = datetime(2024, 12, 31)
 
 class StockDataCollector:
     """股票數據收集器
@@ -19,16 +35,45 @@ class StockDataCollector:
     負責從各種來源獲取股票數據和相關信息。
     """
     
-    def __init__(self, api_keys=None):
+    def __init__(self, api_keys=None, config=None):
         """初始化股票數據收集器
         
         參數:
             api_keys (dict, 可選): API密鑰字典
+            config (dict, 可選): 數據設定（provider: 數據來源設定；market_store: 行情數據存儲設定；
+                memory_cache: 進程內緩存設定，enabled 為 False 時停用；symbol_index: 代碼表設定 (path)；
+                simulated_fallback: 無法獲取數據時是否返回模擬數據，預設 True；
+                indicators: 寫入緩存前計算的技術指標名稱，預設為全部指標；
+                streaming_intervals: 以串流狀態增量更新技術指標的數據間隔，預設為 1m 至 30m）
         """
         self.api_keys = api_keys or {}
+        self.config = config or {}
         self.logger = logging.getLogger(__name__)
         self.cache_dir = os.path.join(os.getcwd(), 'cache', 'data')
         os.makedirs(self.cache_dir, exist_ok=True)
+        self.cache_manager = get_cache_manager()
+        self.cache_manager.register('data', self.cache_dir, owner='stock_collector')
+        
+        # 數據來源：yahoo（預設）、local（本地數據目錄，離線重播）或 record（錄製 Yahoo Finance 的結果）
+        self.provider = create_provider(self.config.get('provider', {}))
+        self.simulated_fallback = self.config.get('simulated_fallback', True)
+        
+        # 技術指標在寫入緩存前計算一次，命中緩存的數據不需再計算
+        self.indicators = self.config.get('indicators')
+        
+        # 分鐘級數據刷新頻繁：保存每個 (股票, 時間範圍, 數據間隔) 的指標流，刷新時只計算新的 K 線
+        self.streaming_intervals = set(self.config.get('streaming_intervals', STREAMING_INTERVALS))
+        self.indicator_streams = {}
+        
+        # 行情數據存儲：保存最長歷史，刷新時只下載新的 K 線
+        # 本地數據來源本身就是完整歷史（且以最後一根 K 線計算時間範圍），預設不再另存一份
+        store_config = self.config.get('market_store', {})
+        store_enabled = store_config.get('enabled', self.provider.name != 'local')
+        self.market_store = MarketStore(store_config) if store_enabled else None
+        
+        # 進程內共用的行情數據緩存：所有收集器實例共用，熱門股票不需讀取磁碟
+        memory_config = self.config.get('memory_cache', {})
+        self.memory_cache = get_shared_cache(memory_config) if memory_config.get('enabled', True) else None
         
     def get_stock_data(self, ticker, period="1y", interval="1d", use_cache=True):
         """獲取股票數據
@@ -46,42 +91,283 @@ class StockDataCollector:
         
         # 檢查緩存
         if use_cache:
-            cache_path = self._get_cache_path(ticker, period, interval)
-            if os.path.exists(cache_path):
-                cache_age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(cache_path))
-                # 如果緩存不超過1天，則使用緩存
-                if cache_age.days < 1:
-                    try:
-                        self.logger.info(f"使用緩存數據: {cache_path}")
-                        return pd.read_pickle(cache_path)
-                    except Exception as e:
-                        self.logger.warning(f"讀取緩存失敗: {e}")
+            data = self._read_cache(ticker, period, interval)
+            if data is not None:
+                return data
         
-        # 嘗試從Yahoo Finance獲取數據
+        # 相同參數的並發請求只獲取一次，其餘調用等待並共用結果（返回副本）
+        data, shared = _inflight.do(
+            ('stock_data', ticker, period, interval),
+            lambda: self._fetch_stock_data(ticker, period, interval, use_cache)
+        )
+        return data.copy() if shared and data is not None else data
+        
+    def get_data_version(self, ticker, period="1y", interval="1d"):
+        """獲取股票數據的版本（只讀取本地狀態，不向上游請求）
+
+        版本由最後一根 K 線的時間與數值決定：數據有新的 K 線或盤中更新了最後一根 K 線時版本改變，
+        數據未變時（例如休市日）版本不變。依序使用未過期的記憶體或磁碟緩存、
+        未過期的行情數據存儲的最後一根 K 線；都沒有時返回 None，由呼叫端以交易日作為版本，
+        數據留給任務在工作者中獲取。
+
+        參數:
+            ticker (str): 股票代碼
+            period (str): 時間範圍
+            interval (str): 數據間隔
+
+        返回:
+            str: 數據版本，本地沒有未過期的數據時返回 None
+        """
         try:
-            stock = yf.Ticker(ticker)
-            data = stock.history(period=period, interval=interval)
+            data = self._read_cache(ticker, period, interval)
+            if data is None and self.market_store is not None:
+                stored, meta = self.market_store.load(ticker, interval)
+                if (stored is not None and self.market_store.covers(meta, period)
+                        and not self.market_store.is_stale(meta, interval)):
+                    data = stored
+        except Exception as e:
+            self.logger.warning(f"獲取數據版本失敗: {ticker}, {e}")
+            return None
+        if data is None or data.empty:
+            return None
+
+        columns = [c for c in OHLCV_COLUMNS if c in data.columns]
+        last_bar = data[columns].iloc[-1]
+        values = ','.join(f"{value:.6g}" for value in last_bar.astype(float))
+        return f"{data.index[-1]}:{zlib.crc32(values.encode('utf-8')):08x}"
+        
+    def _fetch_stock_data(self, ticker, period, interval, use_cache):
+        """從行情數據存儲或上游獲取股票數據並寫入緩存
+        
+        參數:
+            ticker (str): 股票代碼
+            period (str): 時間範圍
+            interval (str): 數據間隔
+            use_cache (bool): 是否使用緩存
+            
+        返回:
+            pandas.DataFrame: 股票數據
+        """
+        memory_key = (ticker, period, interval)
+        
+        # 檢查緩存之後，上一個相同請求可能剛完成並寫入緩存
+        if use_cache and self.memory_cache is not None:
+            data = self.memory_cache.get(memory_key)
+            if data is not None:
+                return data
+        
+        # 嘗試從行情數據存儲（增量刷新）或數據來源獲取數據
+        try:
+            data = self._load_history(ticker, period, interval)
             
             # 檢查是否成功獲取數據
             if data.empty:
-                self.logger.warning(f"無法從Yahoo Finance獲取數據: {ticker}")
-                return self._create_default_data(ticker)
+                self.logger.warning(f"無法從數據來源 ({self.provider.name}) 獲取數據: {ticker}")
+                return self._fallback_data(ticker)
                 
             # 計算技術指標
-            data = self._add_technical_indicators(data)
+            data = self._update_technical_indicators(ticker, period, interval, data)
             
             # 儲存到緩存
             if use_cache:
-                cache_path = self._get_cache_path(ticker, period, interval)
-                data.to_pickle(cache_path)
-                self.logger.info(f"數據已緩存到: {cache_path}")
+                self._write_cache(ticker, period, interval, data)
                 
             return data
             
         except Exception as e:
-            self.logger.error(f"從Yahoo Finance獲取數據失敗: {e}")
-            return self._create_default_data(ticker)
+            self.logger.error(f"從數據來源 ({self.provider.name}) 獲取數據失敗: {e}")
+            return self._fallback_data(ticker)
+            
+    def get_many(self, tickers, period="1y", interval="1d", use_cache=True, chunk_size=50,
+                 write_cache=None, fallback=True, stats=None):
+        """批量獲取多檔股票數據
+        
+        已有緩存的股票直接讀取緩存，其餘股票合併為一次分組下載（每 chunk_size 檔一次請求），
+        拆分為每檔股票的數據後計算技術指標並寫入緩存。
+        批量下載失敗的股票改為逐檔獲取（與 get_stock_data 的結果相同）。
+        
+        參數:
+            tickers (list): 股票代碼列表
+            period (str): 時間範圍
+            interval (str): 數據間隔
+            use_cache (bool): 是否讀取緩存
+            chunk_size (int): 每次下載的最大股票數量
+            write_cache (bool, 可選): 是否把下載結果寫入緩存，預設與 use_cache 相同
+            fallback (bool): 批量下載失敗的股票是否逐檔獲取（為 False 時結果中不包含這些股票）
+            stats (dict, 可選): 填入下載統計 (requests: 下載請求次數, downloaded: 批量下載成功的股票數)
+            
+        返回:
+            dict: 股票代碼 -> 股票數據（保持輸入順序）
+        """
+        tickers = list(dict.fromkeys(tickers))
+        if write_cache is None:
+            write_cache = use_cache
+        self.logger.info(f"批量獲取股票數據: {len(tickers)} 檔, 週期: {period}, 間隔: {interval}")
+        
+        results = {}
+        if use_cache:
+            for ticker in tickers:
+                data = self._read_cache(ticker, period, interval)
+                if data is not None:
+                    results[ticker] = data
+                    
+        missing = [t for t in tickers if t not in results]
+        requests_made = 0
+        if missing:
+            frames, requests_made = self._download_many(missing, period, interval, chunk_size)
+            for ticker, data in frames.items():
+                if write_cache:
+                    self._write_cache(ticker, period, interval, data)
+                results[ticker] = data
+                
+            if stats is not None:
+                stats['downloaded'] = len(frames)
+                
+            if fallback:
+                for ticker in missing:
+                    if ticker not in results:
+                        results[ticker] = self.get_stock_data(ticker, period, interval, use_cache)
+                        
+        if stats is not None:
+            stats['requests'] = requests_made
+            stats.setdefault('downloaded', 0)
+                    
+        return {ticker: results[ticker] for ticker in tickers if ticker in results}
+        
+    def has_fresh_cache(self, ticker, period="1y", interval="1d"):
+        """檢查是否已有未過期的緩存（與 get_stock_data 讀取緩存的規則相同，不讀取數據）
+        
+        參數:
+            ticker (str): 股票代碼
+            period (str): 時間範圍
+            interval (str): 數據間隔
             
+        返回:
+            bool: 是否有新鮮緩存
+        """
+        if self.memory_cache is not None and self.memory_cache.get((ticker, period, interval)) is not None:
+            return True
+        cache_path = self._get_cache_path(ticker, period, interval)
+        try:
+            return time.time() - os.path.getmtime(cache_path) < self._cache_ttl(interval)
+        except OSError:
+            return False
+        
+    def _download_many(self, tickers, period, interval, chunk_size=50):
+        """分組下載多檔股票的原始數據並計算技術指標
+        
+        行情數據存儲中已有足夠且未過期歷史的股票直接切片，不重新下載；
+        下載結果同時寫入行情數據存儲。
+        
+        參數:
+            tickers (list): 股票代碼列表
+            period (str): 時間範圍
+            interval (str): 數據間隔
+            chunk_size (int): 每次下載的最大股票數量
+            
+        返回:
+            tuple: (股票代碼 -> 添加技術指標後的數據（不含失敗的股票）, 下載請求次數)
+        """
+        frames = {}
+        to_download = []
+        for ticker in tickers:
+            if self.market_store is not None:
+                stored, meta = self.market_store.load(ticker, interval)
+                if stored is not None and self.market_store.covers(meta, period) and not self.market_store.is_stale(meta, interval):
+                    frames[ticker] = self.market_store.slice_period(stored, period)
+                    frames[ticker].attrs['ticker'] = ticker
+                    continue
+            to_download.append(ticker)
+            
+        chunk_size = max(1, int(chunk_size))
+        requests_made = 0
+        for i in range(0, len(to_download), chunk_size):
+            chunk = to_download[i:i + chunk_size]
+            requests_made += 1
+            
+            try:
+                downloaded = self.provider.download(chunk, period, interval)
+            except Exception as e:
+                self.logger.error(f"批量下載股票數據失敗: {e}")
+                continue
+                
+            for ticker, frame in downloaded.items():
+                # 原始行情同時寫入行情數據存儲，之後的刷新只需下載新的 K 線
+                if self.market_store is not None:
+                    self.market_store.save(ticker, interval, frame, period=period)
+                frames[ticker] = frame
+                
+        frames = self._add_technical_indicators_bulk(frames)
+        return {t: d for t, d in frames.items() if d is not None and not d.empty}, requests_made
+        
+    def _load_history(self, ticker, period, interval):
+        """獲取原始行情數據
+        
+        存儲的歷史足夠且未過期時直接切片；過期時只下載最後一根 K 線之後的數據並追加
+        （重疊的 K 線價格不同時表示上游已重新調整歷史，改為重新下載完整歷史）；
+        存儲的歷史不足（或分鐘級數據已超出可回溯範圍）時下載整段時間範圍。
+        
+        參數:
+            ticker (str): 股票代碼
+            period (str): 時間範圍
+            interval (str): 數據間隔
+            
+        返回:
+            pandas.DataFrame: 原始行情數據（不含技術指標）
+        """
+        if self.market_store is None:
+            return self.provider.history(ticker, period=period, interval=interval)
+            
+        stored, meta = self.market_store.load(ticker, interval)
+        
+        if stored is not None and self.market_store.covers(meta, period):
+            if not self.market_store.is_stale(meta, interval):
+                self.logger.info(f"使用行情數據存儲: {ticker} ({interval})")
+                return self.market_store.slice_period(stored, period)
+                
+            if self.market_store.can_append(stored, interval):
+                try:
+                    new_bars = self.provider.history(ticker, interval=interval,
+                                                     start=self.market_store.append_start(stored))
+                except Exception as e:
+                    self.logger.warning(f"增量刷新行情數據失敗，使用已存儲的數據: {ticker}, {e}")
+                    return self.market_store.slice_period(stored, period)
+                if self.market_store.is_readjusted(stored, new_bars):
+                    return self._reload_history(ticker, period, interval, stored, meta)
+                self.logger.info(f"增量刷新行情數據: {ticker} ({interval}), 新增 {len(new_bars)} 根 K 線")
+                merged = self.market_store.save(ticker, interval, new_bars, meta=meta)
+                return self.market_store.slice_period(merged, period)
+        
+        data = self.provider.history(ticker, period=period, interval=interval)
+        if not data.empty:
+            self.market_store.save(ticker, interval, data, period=period)
+        return data
+            
+    def _reload_history(self, ticker, period, interval, stored, meta):
+        """上游重新調整價格（拆股或除權息）後重新下載存儲深度的完整歷史並取代存儲
+        
+        參數:
+            ticker (str): 股票代碼
+            period (str): 時間範圍
+            interval (str): 數據間隔
+            stored (pandas.DataFrame): 已存儲的歷史
+            meta (dict): 存儲的描述字典
+            
+        返回:
+            pandas.DataFrame: 原始行情數據（不含技術指標）
+        """
+        depth = meta.get('depth') or period
+        self.logger.info(f"歷史價格已重新調整，重新下載完整歷史: {ticker} ({interval}, {depth})")
+        try:
+            data = self.provider.history(ticker, period=depth, interval=interval)
+        except Exception as e:
+            self.logger.warning(f"重新下載歷史失敗，使用已存儲的數據: {ticker}, {e}")
+            return self.market_store.slice_period(stored, period)
+        if data.empty:
+            return self.market_store.slice_period(stored, period)
+        merged = self.market_store.save(ticker, interval, data, period=depth, meta=meta, replace=True)
+        return self.market_store.slice_period(merged, period)
+        
     def get_stock_info(self, ticker, use_cache=True):
         """獲取股票基本信息
         
@@ -103,14 +389,27 @@ class StockDataCollector:
                 if cache_age.days < 1:
                     try:
                         self.logger.info(f"使用緩存數據: {cache_path}")
-                        return pd.read_pickle(cache_path)
+                        info = pd.read_pickle(cache_path)
+                        self.cache_manager.touch(cache_path)
+                        return info
                     except Exception as e:
                         self.logger.warning(f"讀取緩存失敗: {e}")
         
-        # 嘗試從Yahoo Finance獲取數據
+        info, shared = _inflight.do(('stock_info', ticker), lambda: self._fetch_stock_info(ticker, use_cache))
+        return dict(info) if shared else info
+        
+    def _fetch_stock_info(self, ticker, use_cache):
+        """從數據來源獲取股票基本信息並寫入緩存
+        
+        參數:
+            ticker (str): 股票代碼
+            use_cache (bool): 是否使用緩存
+            
+        返回:
+            dict: 股票基本信息
+        """
         try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
+            info = self.provider.info(ticker)
             
             # 處理過大的字符串字段
             if 'longBusinessSummary' in info and len(info['longBusinessSummary']) > 1000:
@@ -121,6 +420,7 @@ class StockDataCollector:
                 cache_path = os.path.join(self.cache_dir, f"{ticker}_info.pkl")
                 pd.to_pickle(info, cache_path)
                 self.logger.info(f"信息已緩存到: {cache_path}")
+                self.cache_manager.record(cache_path)
                 
             return info
             
@@ -150,14 +450,31 @@ class StockDataCollector:
                 if cache_age.seconds < 4 * 60 * 60:
                     try:
                         self.logger.info(f"使用緩存數據: {cache_path}")
-                        return pd.read_pickle(cache_path)
+                        news = pd.read_pickle(cache_path)
+                        self.cache_manager.touch(cache_path)
+                        return news
                     except Exception as e:
                         self.logger.warning(f"讀取緩存失敗: {e}")
         
-        # 嘗試從Yahoo Finance獲取數據
+        news, shared = _inflight.do(
+            ('latest_news', ticker, max_items),
+            lambda: self._fetch_latest_news(ticker, max_items, use_cache)
+        )
+        return [dict(item) for item in news] if shared else news
+        
+    def _fetch_latest_news(self, ticker, max_items, use_cache):
+        """從數據來源獲取股票新聞並寫入緩存
+        
+        參數:
+            ticker (str): 股票代碼
+            max_items (int): 最大新聞條數
+            use_cache (bool): 是否使用緩存
+            
+        返回:
+            list: 新聞列表
+        """
         try:
-            stock = yf.Ticker(ticker)
-            news = stock.news
+            news = self.provider.news(ticker)
             
             # 格式化新聞數據
             formatted_news = []
@@ -181,6 +498,7 @@ class StockDataCollector:
                 cache_path = os.path.join(self.cache_dir, f"{ticker}_news.pkl")
                 pd.to_pickle(formatted_news, cache_path)
                 self.logger.info(f"新聞已緩存到: {cache_path}")
+                self.cache_manager.record(cache_path)
                 
             return formatted_news
             
@@ -188,6 +506,56 @@ class StockDataCollector:
             self.logger.error(f"獲取股票新聞失敗: {e}")
             return []
             
+    def search_stocks(self, keyword, limit=10, market=None, with_quotes=True):
+        """按代碼或名稱搜索股票（本地代碼表，不需要網路）
+        
+        參數:
+            keyword (str): 代碼、英文或中文名稱（可以是部分名稱）
+            limit (int): 最大結果數量
+            market (str, 可選): 只返回指定市場 (TW, US, HK)
+            with_quotes (bool): 是否從已緩存的數據附加最新價格
+            
+        返回:
+            list: 搜索結果（ticker, market, name, name_zh, score；有緩存數據時附加 last_price, change, change_percent）
+        """
+        index = get_symbol_index(self.config.get('symbol_index', {}).get('path'))
+        results = index.search(keyword, limit=limit, market=market)
+        
+        if with_quotes:
+            for result in results:
+                quote = self.get_cached_quote(result['ticker'])
+                if quote:
+                    result.update(quote)
+                    
+        return results
+        
+    def get_cached_quote(self, ticker, period="1y", interval="1d"):
+        """從已緩存的數據獲取最新價格（記憶體緩存、磁碟緩存或行情數據存儲，不發出網路請求）
+        
+        參數:
+            ticker (str): 股票代碼
+            period (str): 緩存的時間範圍
+            interval (str): 數據間隔
+            
+        返回:
+            dict: 最新價格 (last_price, change, change_percent, as_of)，沒有緩存時返回 None
+        """
+        data = self._read_cache(ticker, period, interval)
+        if data is None and self.market_store is not None:
+            data, _ = self.market_store.load(ticker, interval)
+        if data is None or len(data) < 2 or 'Close' not in data.columns:
+            return None
+            
+        close = data['Close']
+        last_price = float(close.iloc[-1])
+        previous = float(close.iloc[-2])
+        return {
+            'last_price': last_price,
+            'change': last_price - previous,
+            'change_percent': (last_price / previous - 1) * 100 if previous else 0.0,
+            'as_of': data.index[-1].strftime('%Y-%m-%d %H:%M:%S')
+        }
+        
     def get_market_index(self, index_symbol="^GSPC", period="1y", interval="1d", use_cache=True):
         """獲取市場指數數據
         
@@ -202,12 +570,11 @@ class StockDataCollector:
         """
         self.logger.info(f"獲取市場指數: {index_symbol}")
         
-        # 使用與股票數據相同的方法，但檢查不同的緩存路徑
-        cache_key = f"{index_symbol.replace('^', 'IDX_')}"
+        # 使用與股票數據相同的方法（並發請求同樣合併為一次）
         return self.get_stock_data(index_symbol, period, interval, use_cache)
     
     def _add_technical_indicators(self, data):
-        """添加技術指標
+        """添加技術指標（已存在的指標不重新計算）
         
         參數:
             data (pandas.DataFrame): 原始股票數據
@@ -215,52 +582,88 @@ class StockDataCollector:
         返回:
             pandas.DataFrame: 添加技術指標後的數據
         """
-        if data.empty:
-            return data
-            
         try:
-            # 計算移動平均線
-            data['SMA_20'] = data['Close'].rolling(window=20).mean()
-            data['SMA_50'] = data['Close'].rolling(window=50).mean()
-            data['SMA_200'] = data['Close'].rolling(window=200).mean()
-            
-            # 計算RSI
-            delta = data['Close'].diff()
-            gain = delta.where(delta > 0, 0).rolling(window=14).mean()
-            loss = -delta.where(delta < 0, 0).rolling(window=14).mean()
-            rs = gain / loss
-            data['RSI'] = 100 - (100 / (1 + rs))
-            
-            # 計算MACD
-            exp1 = data['Close'].ewm(span=12, adjust=False).mean()
-            exp2 = data['Close'].ewm(span=26, adjust=False).mean()
-            data['MACD'] = exp1 - exp2
-            data['Signal_Line'] = data['MACD'].ewm(span=9, adjust=False).mean()
-            data['MACD_Histogram'] = data['MACD'] - data['Signal_Line']
-            
-            # 計算布林帶
-            data['Bollinger_Upper'] = data['SMA_20'] + (data['Close'].rolling(window=20).std() * 2)
-            data['Bollinger_Lower'] = data['SMA_20'] - (data['Close'].rolling(window=20).std() * 2)
-            
-            # 計算每日回報率
-            data['Daily_Return'] = data['Close'].pct_change()
-            
-            # 計算波動率 (20天)
-            data['Volatility'] = data['Daily_Return'].rolling(window=20).std() * np.sqrt(252)
-            
-            # 添加交易量相對變化
-            data['Volume_SMA_20'] = data['Volume'].rolling(window=20).mean()
-            data['Volume_Ratio'] = data['Volume'] / data['Volume_SMA_20']
-            
-            return data
-            
+            return add_indicators(data, self.indicators)
         except Exception as e:
             self.logger.error(f"計算技術指標失敗: {e}")
             return data
+
+    def _update_technical_indicators(self, ticker, period, interval, data):
+        """添加技術指標（分鐘級數據以指標流增量更新）
+        
+        參數:
+            ticker (str): 股票代碼
+            period (str): 時間範圍
+            interval (str): 數據間隔
+            data (pandas.DataFrame): 原始股票數據
+            
+        返回:
+            pandas.DataFrame: 添加技術指標後的數據
+        """
+        if interval not in self.streaming_intervals:
+            return self._add_technical_indicators(data)
             
+        # 相同參數的刷新由 _inflight 合併，同一個指標流不會被並發更新
+        stream = self.indicator_streams.setdefault((ticker, period, interval), IndicatorStream(self.indicators))
+        try:
+            return stream.update(data)
+        except Exception as e:
+            self.logger.warning(f"增量更新技術指標失敗，重新計算: {ticker} ({interval}), {e}")
+            stream.frame = None
+            return self._add_technical_indicators(data)
+    
+    def get_indicator_stream_stats(self):
+        """獲取指標流統計
+        
+        返回:
+            dict: 指標流數量、逐根更新的 K 線數量與整段重新計算次數
+        """
+        streams = list(self.indicator_streams.values())
+        return {
+            'streams': len(streams),
+            'streamed_bars': sum(stream.streamed_bars for stream in streams),
+            'recomputes': sum(stream.recomputes for stream in streams)
+        }
+        
+    def _add_technical_indicators_bulk(self, frames):
+        """批量添加技術指標
+
+        交易日相同的股票（通常是同一市場）合併為寬表，每個指標對所有股票只計算一次，
+        結果與逐個調用 _add_technical_indicators 相同。
+
+        參數:
+            frames (dict): 股票代碼 -> 原始股票數據
+
+        返回:
+            dict: 股票代碼 -> 添加技術指標後的數據
+        """
+        try:
+            return add_indicators_bulk(frames, self.indicators)
+        except Exception as e:
+            self.logger.error(f"批量計算技術指標失敗: {e}")
+            return {ticker: self._add_technical_indicators(data) if data is not None else None
+                    for ticker, data in frames.items()}
+
+    def _fallback_data(self, ticker):
+        """無法獲取數據時的返回值
+        
+        參數:
+            ticker (str): 股票代碼
+            
+        返回:
+            pandas.DataFrame: 模擬股票數據，simulated_fallback 為 False 時返回 None
+        """
+        if not self.simulated_fallback:
+            return None
+        self.logger.warning(f"使用模擬數據代替: {ticker}")
+        return self._create_default_data(ticker)
+        
     def _create_default_data(self, ticker):
         """創建默認數據（當無法獲取真實數據時）
         
+        以股票代碼作為隨機種子，日期範圍固定為 SIMULATED_END_DATE 之前一年，
+        同一代碼每次生成相同的數據。
+        
         參數:
             ticker (str): 股票代碼
             
@@ -270,17 +673,18 @@ class StockDataCollector:
         self.logger.info(f"創建 {ticker} 的模擬數據")
         
         # 創建日期範圍
-        end_date = datetime.now()
+        end_date = SIMULATED_END_DATE
         start_date = end_date - timedelta(days=365)
         dates = pd.date_range(start=start_date, end=end_date, freq='B')
         
         # 生成模擬價格數據
+        rng = np.random.default_rng(zlib.crc32(ticker.encode('utf-8')))
         n = len(dates)
-        close = 100 + np.cumsum(np.random.normal(0, 1, n)) / 10
-        high = close + np.random.uniform(0, 3, n)
-        low = close - np.random.uniform(0, 3, n)
-        open_price = low + np.random.uniform(0, high - low, n)
-        volume = np.random.randint(100000, 1000000, n)
+        close = 100 + np.cumsum(rng.normal(0, 1, n)) / 10
+        high = close + rng.uniform(0, 3, n)
+        low = close - rng.uniform(0, 3, n)
+        open_price = low + rng.uniform(0, high - low, n)
+        volume = rng.integers(100000, 1000000, n)
         
         # 創建DataFframe
         df = pd.DataFrame({
@@ -300,6 +704,79 @@ class StockDataCollector:
         
         return df
         
+    def _cache_ttl(self, interval):
+        """緩存的有效秒數
+        
+        日線及以上為 1 天；分鐘級數據為一根 K 線，刷新時才會到達行情數據存儲與指標流。
+        
+        參數:
+            interval (str): 數據間隔
+            
+        返回:
+            float: 有效秒數
+        """
+        return bar_seconds(interval) or DEFAULT_TTL_SECONDS
+        
+    def _read_cache(self, ticker, period, interval):
+        """讀取已計算技術指標的緩存（先查記憶體緩存，再查未過期的磁碟緩存）
+        
+        參數:
+            ticker (str): 股票代碼
+            period (str): 時間範圍
+            interval (str): 數據間隔
+            
+        返回:
+            pandas.DataFrame: 緩存數據，沒有可用緩存時返回 None
+        """
+        memory_key = (ticker, period, interval)
+        if self.memory_cache is not None:
+            data = self.memory_cache.get(memory_key)
+            if data is not None:
+                self.logger.info(f"使用記憶體緩存數據: {ticker}")
+                return data
+                
+        cache_path = self._get_cache_path(ticker, period, interval)
+        if os.path.exists(cache_path):
+            cache_mtime = os.path.getmtime(cache_path)
+            ttl = self._cache_ttl(interval)
+            # 如果緩存未過期（日線 1 天、分鐘級數據一根 K 線），則使用緩存
+            if time.time() - cache_mtime < ttl:
+                try:
+                    self.logger.info(f"使用緩存數據: {cache_path}")
+                    data = pd.read_pickle(cache_path)
+                    self.cache_manager.touch(cache_path)
+                    if self.memory_cache is not None:
+                        self.memory_cache.put(memory_key, data, version=cache_mtime, ttl=ttl)
+                    return data
+                except Exception as e:
+                    self.logger.warning(f"讀取緩存失敗: {e}")
+        return None
+        
+    def _write_cache(self, ticker, period, interval, data):
+        """寫入磁碟緩存與記憶體緩存
+        
+        參數:
+            ticker (str): 股票代碼
+            period (str): 時間範圍
+            interval (str): 數據間隔
+            data (pandas.DataFrame): 已計算技術指標的數據
+            
+        返回:
+            bool: 是否成功寫入磁碟緩存
+        """
+        cache_path = self._get_cache_path(ticker, period, interval)
+        try:
+            data.to_pickle(cache_path)
+        except Exception as e:
+            self.logger.warning(f"寫入緩存失敗: {ticker}, {e}")
+            return False
+        self.logger.info(f"數據已緩存到: {cache_path}")
+        self.cache_manager.record(cache_path)
+        if self.memory_cache is not None:
+            self.memory_cache.put((ticker, period, interval), data, version=os.path.getmtime(cache_path),
+                                  ttl=self._cache_ttl(interval))
+        return True
+        
     def _get_cache_path(self, ticker, period, interval):
         """獲取緩存文件路徑
         
@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 串流技術指標
+"""
+
+import math
+import logging
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from src.data.indicators import DEFAULT_INDICATORS, INDICATOR_COLUMNS, add_indicators, missing_indicators
+
+# 預設以串流狀態增量更新技術指標的數據間隔（分鐘級數據刷新頻繁）
+STREAMING_INTERVALS = ('1m', '2m', '5m', '15m', '30m')
+
+# 一次刷新新增的 K 線超過此數量時改為整段重新計算（向量化計算更快）
+MAX_STREAMED_BARS = 200
+
+# 與 IndicatorEngine 相同的參數
+SMA_WINDOWS = (20, 50, 200)
+RSI_PERIOD = 14
+MACD_SPANS = (12, 26, 9)
+BOLLINGER_WINDOW = 20
+VOLATILITY_WINDOW = 20
+VOLUME_WINDOW = 20
+MOMENTUM_PERIOD = 10
+ATR_PERIOD = 14
+ANNUALIZATION = math.sqrt(252)
+
+class RollingWindow:
+    """固定長度的滑動窗口
+
+    以 Welford 算法維護窗口內有效值的平均與平方差和，推入、淘汰與修改最後一個值都是 O(1)。
+    窗口未滿或含有空值時結果為 NaN（與 pandas rolling 的預設 min_periods 相同）。
+    每推入窗口長度次後從窗口內容重新計算一次，避免浮點誤差累積。
+    """
+
+    def __init__(self, size):
+        """初始化滑動窗口
+
+        參數:
+            size (int): 窗口長度
+        """
+        self.size = size
+        self.values = deque()
+        self.count = 0
+        self.nan_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.updates = 0
+
+    def _add(self, x):
+        if math.isnan(x):
+            self.nan_count += 1
+            return
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def _remove(self, x):
+        if math.isnan(x):
+            self.nan_count -= 1
+            return
+        self.count -= 1
+        if self.count == 0:
+            self.mean = 0.0
+            self.m2 = 0.0
+            return
+        delta = x - self.mean
+        self.mean -= delta / self.count
+        self.m2 -= delta * (x - self.mean)
+
+    def push(self, x):
+        """推入新值（窗口已滿時淘汰最舊的值）"""
+        self.values.append(x)
+        self._add(x)
+        if len(self.values) > self.size:
+            self._remove(self.values.popleft())
+        self.updates += 1
+        if self.updates >= self.size:
+            self._resync()
+
+    def replace_last(self, x):
+        """修改最後一個值（例如尚未收盤的 K 線）"""
+        old = self.values[-1]
+        self.values[-1] = x
+        self._remove(old)
+        self._add(x)
+
+    def seed(self, values):
+        """以序列的最後 size 個值初始化窗口"""
+        self.values = deque(float(v) for v in values[-self.size:])
+        self._resync()
+
+    def _resync(self):
+        """從窗口內容重新計算平均與平方差和"""
+        valid = np.array([v for v in self.values if not math.isnan(v)], dtype=float)
+        self.count = len(valid)
+        self.nan_count = len(self.values) - self.count
+        self.mean = float(valid.mean()) if self.count else 0.0
+        self.m2 = float(((valid - self.mean) ** 2).sum()) if self.count else 0.0
+        self.updates = 0
+
+    def full(self):
+        """窗口是否已滿且沒有空值"""
+        return len(self.values) == self.size and self.nan_count == 0
+
+    def average(self):
+        """窗口平均"""
+        return self.mean if self.full() else math.nan
+
+    def std(self):
+        """窗口樣本標準差（ddof=1）"""
+        if not self.full() or self.count < 2:
+            return math.nan
+        return math.sqrt(max(self.m2, 0.0) / (self.count - 1))
+
+class EMA:
+    """指數移動平均（與 pandas ewm(span, adjust=False) 相同）
+
+    保留上一根 K 線的值，修改最後一個值時 O(1) 重新計算。
+    """
+
+    def __init__(self, span):
+        """初始化指數移動平均
+
+        參數:
+            span (int): 跨度
+        """
+        self.alpha = 2.0 / (span + 1)
+        self.value = math.nan
+        self.prev = math.nan
+
+    def _next(self, base, x):
+        if math.isnan(x):
+            return base
+        if math.isnan(base):
+            return x
+        return self.alpha * x + (1 - self.alpha) * base
+
+    def push(self, x):
+        """推入新值"""
+        self.prev = self.value
+        self.value = self._next(self.prev, x)
+
+    def replace_last(self, x):
+        """修改最後一個值"""
+        self.value = self._next(self.prev, x)
+
+    def seed(self, values):
+        """以已計算的 EMA 序列初始化"""
+        self.value = float(values[-1]) if len(values) else math.nan
+        self.prev = float(values[-2]) if len(values) > 1 else math.nan
+
+def _true_range(high, low, prev_close):
+    """真實波幅（忽略空值，與 IndicatorEngine 相同）"""
+    candidates = [v for v in (high - low, abs(high - prev_close), abs(low - prev_close)) if not math.isnan(v)]
+    return max(candidates) if candidates else math.nan
+
+class StreamingIndicators:
+    """單一股票的串流技術指標狀態
+
+    保存每個指標的運行狀態（均線的窗口和、EMA、RSI 漲跌窗口、布林帶與波動率的 Welford 方差、ATR），
+    推入一根新 K 線或修改最後一根 K 線都是 O(1)，產生的欄位與 IndicatorEngine 相同。
+    """
+
+    def __init__(self, indicators=None):
+        """初始化串流技術指標狀態
+
+        參數:
+            indicators (list, 可選): 需要輸出的指標名稱，預設為全部指標
+        """
+        self.indicators = [name for name in (DEFAULT_INDICATORS if indicators is None else indicators)
+                           if name in INDICATOR_COLUMNS]
+        self.sma = {window: RollingWindow(window) for window in SMA_WINDOWS}
+        self.gain = RollingWindow(RSI_PERIOD)
+        self.loss = RollingWindow(RSI_PERIOD)
+        self.ema_fast = EMA(MACD_SPANS[0])
+        self.ema_slow = EMA(MACD_SPANS[1])
+        self.signal = EMA(MACD_SPANS[2])
+        self.returns = RollingWindow(VOLATILITY_WINDOW)
+        self.volume = RollingWindow(VOLUME_WINDOW)
+        self.tr = RollingWindow(ATR_PERIOD)
+        self.closes = deque(maxlen=MOMENTUM_PERIOD + 1)
+        self.last = None
+
+    def columns(self):
+        """輸出的欄位名稱"""
+        return [column for name in self.indicators for column in INDICATOR_COLUMNS[name]]
+
+    def seed(self, data):
+        """以歷史數據初始化狀態（向量化計算，之後的 K 線逐根更新）
+
+        參數:
+            data (pandas.DataFrame): 原始股票數據（至少包含 Close）
+        """
+        nan = np.full(len(data), np.nan)
+        close = data['Close'].to_numpy(dtype=float)
+        high = data['High'].to_numpy(dtype=float) if 'High' in data.columns else nan
+        low = data['Low'].to_numpy(dtype=float) if 'Low' in data.columns else nan
+        volume = data['Volume'].to_numpy(dtype=float) if 'Volume' in data.columns else nan
+
+        prev_close = np.concatenate(([np.nan], close[:-1]))
+        delta = close - prev_close
+        for window in self.sma.values():
+            window.seed(close)
+        self.gain.seed(np.where(delta > 0, delta, 0.0))
+        self.loss.seed(np.where(delta < 0, -delta, 0.0))
+        self.returns.seed(close / prev_close - 1)
+        self.volume.seed(volume)
+        self.tr.seed(np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close)))
+        self.closes = deque((float(v) for v in close), maxlen=MOMENTUM_PERIOD + 1)
+
+        series = pd.Series(close)
+        fast = series.ewm(span=MACD_SPANS[0], adjust=False).mean()
+        slow = series.ewm(span=MACD_SPANS[1], adjust=False).mean()
+        self.ema_fast.seed(fast.to_numpy())
+        self.ema_slow.seed(slow.to_numpy())
+        self.signal.seed((fast - slow).ewm(span=MACD_SPANS[2], adjust=False).mean().to_numpy())
+
+        self.last = None
+        if len(close):
+            self.last = (close[-1], volume[-1])
+
+    def push(self, bar):
+        """推入一根新 K 線
+
+        參數:
+            bar (dict): K 線 (Close，可選 High, Low, Volume)
+
+        返回:
+            dict: 欄位名稱 -> 指標值
+        """
+        return self._update(bar, replace=False)
+
+    def replace_last(self, bar):
+        """修改最後一根 K 線（盤中尚未完成的 K 線）
+
+        參數:
+            bar (dict): K 線 (Close，可選 High, Low, Volume)
+
+        返回:
+            dict: 欄位名稱 -> 指標值
+        """
+        if not self.closes:
+            return self._update(bar, replace=False)
+        return self._update(bar, replace=True)
+
+    def _update(self, bar, replace):
+        close = float(bar['Close'])
+        high = float(bar.get('High', math.nan))
+        low = float(bar.get('Low', math.nan))
+        volume = float(bar.get('Volume', math.nan))
+
+        if replace:
+            self.closes[-1] = close
+        else:
+            self.closes.append(close)
+        prev_close = self.closes[-2] if len(self.closes) > 1 else math.nan
+        delta = close - prev_close
+
+        op = 'replace_last' if replace else 'push'
+        for window in self.sma.values():
+            getattr(window, op)(close)
+        getattr(self.gain, op)(delta if delta > 0 else 0.0)
+        getattr(self.loss, op)(-delta if delta < 0 else 0.0)
+        getattr(self.returns, op)(close / prev_close - 1 if prev_close else math.nan)
+        getattr(self.volume, op)(volume)
+        getattr(self.tr, op)(_true_range(high, low, prev_close))
+        getattr(self.ema_fast, op)(close)
+        getattr(self.ema_slow, op)(close)
+        getattr(self.signal, op)(self.ema_fast.value - self.ema_slow.value)
+
+        self.last = (close, volume)
+        return self.values()
+
+    def values(self):
+        """目前的指標值
+
+        返回:
+            dict: 欄位名稱 -> 指標值（只包含設定的指標）
+        """
+        if self.last is None:
+            return {column: math.nan for column in self.columns()}
+        close, volume = self.last
+
+        values = {}
+        for name in self.indicators:
+            if name in ('sma_20', 'sma_50', 'sma_200'):
+                window = int(name.split('_')[1])
+                values[f'SMA_{window}'] = self.sma[window].average()
+            elif name == 'rsi':
+                gain, loss = self.gain.average(), self.loss.average()
+                if math.isnan(gain) or math.isnan(loss):
+                    values['RSI'] = math.nan
+                elif loss == 0:
+                    values['RSI'] = 100.0 if gain > 0 else math.nan
+                else:
+                    values['RSI'] = 100 - (100 / (1 + gain / loss))
+            elif name == 'macd':
+                macd = self.ema_fast.value - self.ema_slow.value
+                values.update({'MACD': macd, 'Signal_Line': self.signal.value,
+                               'MACD_Histogram': macd - self.signal.value})
+            elif name == 'bollinger':
+                mid, std = self.sma[BOLLINGER_WINDOW].average(), self.sma[BOLLINGER_WINDOW].std()
+                values.update({'Bollinger_Mid': mid, 'Bollinger_Upper': mid + std * 2,
+                               'Bollinger_Lower': mid - std * 2})
+            elif name == 'daily_return':
+                values['Daily_Return'] = self.returns.values[-1] if self.returns.values else math.nan
+            elif name == 'volatility':
+                values['Volatility'] = self.returns.std() * ANNUALIZATION
+            elif name == 'volume':
+                volume_sma = self.volume.average()
+                values.update({'Volume_SMA_20': volume_sma,
+                               'Volume_Ratio': volume / volume_sma if volume_sma else math.nan})
+            elif name == 'momentum':
+                full = len(self.closes) == MOMENTUM_PERIOD + 1
+                values['Momentum'] = close / self.closes[0] - 1 if full and self.closes[0] else math.nan
+            elif name == 'atr':
+                values.update({'TR': self.tr.values[-1] if self.tr.values else math.nan,
+                               'ATR': self.tr.average()})
+        return values
+
+class IndicatorStream:
+    """單一股票與數據間隔的指標流
+
+    保存上一次的計算結果與串流狀態。刷新後的數據若只是在上一次結果之後追加 K 線
+    （最後一根 K 線可以被修改，開頭可以因時間範圍移動而減少），只對新的 K 線逐根更新；
+    否則整段重新計算並重新初始化狀態。
+    串流結果從更早的歷史延續計算，開頭被切掉的 K 線不會使均線重新進入暖機期。
+    """
+
+    def __init__(self, indicators=None, max_new_bars=MAX_STREAMED_BARS):
+        """初始化指標流
+
+        參數:
+            indicators (list, 可選): 需要的指標名稱，預設為全部指標
+            max_new_bars (int): 逐根更新的最大新 K 線數量
+        """
+        self.logger = logging.getLogger(__name__)
+        self.indicators = indicators
+        self.max_new_bars = max_new_bars
+        self.state = None
+        self.frame = None
+        self.streamed_bars = 0
+        self.recomputes = 0
+
+    def update(self, data):
+        """計算刷新後數據的技術指標
+
+        參數:
+            data (pandas.DataFrame): 原始股票數據（直接寫入欄位）
+
+        返回:
+            pandas.DataFrame: 添加技術指標後的數據
+        """
+        if data is None or data.empty or not missing_indicators(data, self.indicators):
+            return data
+
+        start = self._extension_start(data)
+        if start is None:
+            return self._recompute(data)
+
+        columns = self.state.columns()
+        overlap = self.frame.loc[data.index[0]:, columns].iloc[:-1]
+        bars = data.iloc[start:].to_dict('records')
+
+        rows = [self.state.replace_last(bars[0])]
+        rows.extend(self.state.push(bar) for bar in bars[1:])
+        self.streamed_bars += len(bars)
+
+        new_rows = pd.DataFrame(rows, index=data.index[start:], columns=columns)
+        for column in columns:
+            data[column] = np.concatenate((overlap[column].to_numpy(dtype=float), new_rows[column].to_numpy(dtype=float)))
+
+        self.frame = data[columns].copy()
+        return data
+
+    def _extension_start(self, data):
+        """數據是否為上一次結果的延續
+
+        返回:
+            int: 上一次最後一根 K 線在新數據中的位置，不是延續時返回 None
+        """
+        if self.frame is None or self.frame.empty or not data.index.is_unique:
+            return None
+        last = self.frame.index[-1]
+        if last not in data.index or data.index[0] not in self.frame.index:
+            return None
+
+        start = data.index.get_loc(last)
+        first = self.frame.index.get_loc(data.index[0])
+        if not isinstance(start, int) or not isinstance(first, int):
+            return None
+        # 重疊部分的長度必須一致，且新增的 K 線不能太多
+        if len(self.frame) - first != start + 1 or len(data) - start - 1 > self.max_new_bars:
+            return None
+        return start
+
+    def _recompute(self, data):
+        """整段重新計算並重新初始化串流狀態"""
+        data = add_indicators(data, self.indicators)
+        self.state = StreamingIndicators(self.indicators)
+        self.state.seed(data)
+        self.frame = data[self.state.columns()].copy()
+        self.recomputes += 1
+        return data
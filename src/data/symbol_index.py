@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 股票代碼搜索索引
+"""
+
+import os
+import re
+import csv
+import logging
+import threading
+import unicodedata
+
+# 隨套件附帶的台股、美股與港股代碼表 (ticker, market, name, name_zh, aliases)
+DEFAULT_SYMBOLS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'symbols.csv')
+
+# 各類索引鍵的完全匹配與前綴匹配分數
+KEY_SCORES = {
+    'code': (100, 80),
+    'name_zh': (95, 75),
+    'name': (90, 70),
+    'word': (60, 55)
+}
+
+# 模糊匹配（n-gram 重疊率）的最高分數與最低重疊率
+FUZZY_SCORE = 50
+FUZZY_MIN_OVERLAP = 0.75
+
+# 進程內共用的索引實例
+_shared_index = None
+_shared_index_lock = threading.Lock()
+
+def normalize(text):
+    """正規化搜索文字（全形轉半形、小寫、去除空白與標點）
+
+    參數:
+        text (str): 文字
+
+    返回:
+        str: 正規化後的文字
+    """
+    text = unicodedata.normalize('NFKC', str(text)).lower()
+    return re.sub(r"[\s\.\-&'(),^]+", '', text)
+
+def _bigrams(text):
+    """文字的二元組集合（單字元文字返回其本身）"""
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+class SymbolIndex:
+    """股票代碼搜索索引
+
+    從代碼表載入台股、美股與港股，建立兩種索引：
+    前綴樹（代碼、英文名稱、英文名稱的每個單詞、中文名稱）用於完全與前綴匹配，
+    二元組倒排索引用於部分與模糊匹配（例如「積電」、「semicondutor」）。
+    查詢只在記憶體中進行，不需要網路。
+    """
+
+    def __init__(self, path=None):
+        """初始化股票代碼搜索索引
+
+        參數:
+            path (str, 可選): 代碼表路徑（CSV），預設為隨套件附帶的代碼表
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path or DEFAULT_SYMBOLS_FILE
+        self.entries = []
+        self.by_ticker = {}
+        self.trie = {}
+        self.grams = {}
+        self.load(self.path)
+
+    def load(self, path):
+        """載入代碼表並建立索引
+
+        參數:
+            path (str): 代碼表路徑
+
+        返回:
+            int: 已載入的股票數量
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+        except Exception as e:
+            self.logger.error(f"載入股票代碼表失敗: {path}, {e}")
+            return 0
+
+        for row in rows:
+            ticker = (row.get('ticker') or '').strip().upper()
+            if ticker:
+                aliases = [a.strip() for a in (row.get('aliases') or '').split('|') if a.strip()]
+                self.add(ticker, (row.get('market') or '').strip(), (row.get('name') or '').strip(),
+                         (row.get('name_zh') or '').strip(), aliases)
+
+        self.logger.info(f"已載入股票代碼表: {len(self.entries)} 檔")
+        return len(self.entries)
+
+    def add(self, ticker, market, name, name_zh='', aliases=None):
+        """加入一檔股票
+
+        參數:
+            ticker (str): 股票代碼（Yahoo Finance 格式，例如 2330.TW、0700.HK）
+            market (str): 市場 (TW, US, HK)
+            name (str): 英文名稱
+            name_zh (str, 可選): 中文名稱
+            aliases (list, 可選): 常用別名（例如 TSMC、Google），按名稱匹配
+        """
+        entry_id = len(self.entries)
+        self.entries.append({'ticker': ticker, 'market': market, 'name': name, 'name_zh': name_zh})
+        self.by_ticker[ticker] = entry_id
+
+        code = ticker.split('.')[0]
+        keys = [('code', normalize(ticker)), ('code', normalize(code)), ('name', normalize(name)), ('name_zh', normalize(name_zh))]
+        keys.extend(('name', normalize(alias)) for alias in aliases or [])
+
+        # 模糊匹配使用代碼、完整名稱與別名的二元組
+        grams = set()
+        for kind, key in keys:
+            grams |= _bigrams(key)
+
+        keys.extend(('word', normalize(word)) for word in name.split())
+        for kind, key in keys:
+            if key:
+                self._insert(key, kind, entry_id)
+
+        for gram in grams:
+            self.grams.setdefault(gram, []).append(entry_id)
+
+    def _insert(self, key, kind, entry_id):
+        """把索引鍵插入前綴樹
+
+        節點以單個字元為子節點鍵；'ids' 記錄經過該節點的 (股票, 鍵類型)，'end' 記錄在該節點結束的鍵。
+        """
+        node = self.trie
+        for char in key:
+            node = node.setdefault(char, {})
+            node.setdefault('ids', set()).add((entry_id, kind))
+        node.setdefault('end', set()).add((entry_id, kind))
+
+    def search(self, query, limit=10, market=None):
+        """搜索股票
+
+        參數:
+            query (str): 代碼、名稱或名稱的一部分
+            limit (int): 最大結果數量
+            market (str, 可選): 只返回指定市場 (TW, US, HK)
+
+        返回:
+            list: 搜索結果（ticker, market, name, name_zh, score），按分數排序
+        """
+        key = normalize(query)
+        if not key:
+            return []
+
+        scores = {}
+
+        # 前綴樹：完全匹配與前綴匹配
+        node = self.trie
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                break
+        else:
+            exact = node.get('end', set())
+            for entry_id, kind in node.get('ids', set()):
+                exact_score, prefix_score = KEY_SCORES[kind]
+                score = exact_score if (entry_id, kind) in exact else prefix_score
+                if score > scores.get(entry_id, 0):
+                    scores[entry_id] = score
+
+        # 二元組：部分與模糊匹配
+        query_grams = _bigrams(key)
+        if len(key) >= 2 and query_grams:
+            overlap = {}
+            for gram in query_grams:
+                for entry_id in self.grams.get(gram, ()):
+                    overlap[entry_id] = overlap.get(entry_id, 0) + 1
+            for entry_id, count in overlap.items():
+                ratio = count / len(query_grams)
+                if ratio >= FUZZY_MIN_OVERLAP:
+                    score = int(FUZZY_SCORE * ratio)
+                    if score > scores.get(entry_id, 0):
+                        scores[entry_id] = score
+
+        if market:
+            market = market.upper()
+            scores = {i: s for i, s in scores.items() if self.entries[i]['market'] == market}
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], len(self.entries[item[0]]['ticker']), item[0]))
+        return [dict(self.entries[entry_id], score=score) for entry_id, score in ranked[:limit]]
+
+    def get(self, ticker):
+        """按股票代碼查找
+
+        參數:
+            ticker (str): 股票代碼
+
+        返回:
+            dict: 股票資料，找不到時返回 None
+        """
+        entry_id = self.by_ticker.get(str(ticker).strip().upper())
+        return dict(self.entries[entry_id]) if entry_id is not None else None
+
+def get_symbol_index(path=None):
+    """獲取進程內共用的股票代碼搜索索引（第一次調用時載入）
+
+    參數:
+        path (str, 可選): 代碼表路徑
+
+    返回:
+        SymbolIndex: 共用索引
+    """
+    global _shared_index
+    with _shared_index_lock:
+        if _shared_index is None:
+            _shared_index = SymbolIndex(path)
+        return _shared_index
@@ -6,13 +6,20 @@
 """
 
 import os
-import cv2
 import json
 import logging
 import numpy as np
 from datetime import datetime
 import subprocess
 import tempfile
+import threading
+
+from src.data.cache_manager import get_cache_manager
+from src.utils.cancellation import TaskCancelled, raise_if_cancelled, remove_files, run_subprocess
+
+# 進程內共用的已解碼模板幀：模板路徑 -> {mtime, fps, size, frames, bytes}
+_template_frames = {}
+_template_frames_lock = threading.Lock()
 
 class DigitalHuman:
     """數位人模組
@@ -31,8 +38,12 @@ class DigitalHuman:
         self.templates_dir = self.config.get('templates_dir', 'templates/digital_humans')
         self.cache_dir = os.path.join(os.getcwd(), 'cache', 'digital_humans')
         
+        # 已解碼模板幀的記憶體上限（進程內所有模板合計）
+        self.template_cache_bytes = float(self.config.get('template_cache_mb', 512)) * 1024 * 1024
+        
         # 確保目錄存在
         os.makedirs(self.cache_dir, exist_ok=True)
+        get_cache_manager().register('digital_humans', self.cache_dir, owner='digital_human')
         
         # 載入預設設定
         self.default_settings = {
@@ -90,7 +101,7 @@ class DigitalHuman:
         self.logger.info(f"找到 {len(templates)} 個數位人模板")
         return templates
     
-    def generate_video(self, template_name, audio_file, output_file=None, settings=None):
+    def generate_video(self, template_name, audio_file, output_file=None, settings=None, cancel_token=None):
         """生成數位人視頻
         
         參數:
@@ -98,10 +109,13 @@ class DigitalHuman:
             audio_file (str): 音頻文件路徑
             output_file (str, 可選): 輸出文件路徑
             settings (dict, 可選): 設定
+            cancel_token (CancellationToken, 可選): 取消令牌，取消時停止寫入幀、終止 ffmpeg
+                並刪除不完整的輸出
             
         返回:
             str: 生成的視頻檔案路徑
         """
+        import cv2
         # 設置預設輸出檔案
         if output_file is None:
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -113,16 +127,8 @@ class DigitalHuman:
         combined_settings = {**self.default_settings, **settings}
         
         # 查找模板
-        template_path = os.path.join(self.templates_dir, f"{template_name}.mp4")
-        if not os.path.exists(template_path):
-            # 嘗試其他副檔名
-            for ext in ['.avi', '.mov']:
-                alt_path = os.path.join(self.templates_dir, f"{template_name}{ext}")
-                if os.path.exists(alt_path):
-                    template_path = alt_path
-                    break
-                    
-        if not os.path.exists(template_path):
+        template_path = self._resolve_template_path(template_name)
+        if template_path is None:
             self.logger.error(f"找不到數位人模板: {template_name}")
             return None
             
@@ -137,14 +143,20 @@ class DigitalHuman:
             audio = AudioSegment.from_file(audio_file)
             audio_duration = len(audio) / 1000.0  # 轉換為秒
             
-            # 讀取模板視頻
-            cap = cv2.VideoCapture(template_path)
+            # 優先使用已解碼的模板幀，超出記憶體上限的模板逐幀讀取
+            decoded = self.load_template_frames(template_path)
+            cap = cv2.VideoCapture(template_path) if decoded is None else None
             
             # 獲取視頻信息
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if decoded is not None:
+                fps = decoded['fps']
+                width, height = decoded['size']
+                frame_count = len(decoded['frames'])
+            else:
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
             template_duration = frame_count / fps
             
             # 計算循環次數
@@ -156,22 +168,30 @@ class DigitalHuman:
             
             # 循環視頻模板以匹配音頻長度
             for loop in range(loop_count):
-                # 重置視頻讀取位置
-                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                
                 # 計算當前循環需要的幀數
                 remaining_time = audio_duration - (loop * template_duration)
                 frames_needed = int(min(template_duration, remaining_time) * fps)
                 
+                if decoded is not None:
+                    for frame in decoded['frames'][:frames_needed]:
+                        raise_if_cancelled(cancel_token)
+                        out.write(frame)
+                    continue
+                
+                # 重置視頻讀取位置
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                
                 # 讀取並寫入幀
                 for _ in range(frames_needed):
+                    raise_if_cancelled(cancel_token)
                     ret, frame = cap.read()
                     if not ret:
                         break
                     out.write(frame)
             
             # 釋放資源
-            cap.release()
+            if cap is not None:
+                cap.release()
             out.release()
             
             # 使用 FFmpeg 合併視頻和音頻
@@ -191,7 +211,7 @@ class DigitalHuman:
                 output_file
             ]
             
-            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            run_subprocess(cmd, cancel_token)
             
             # 刪除臨時文件
             if os.path.exists(temp_output):
@@ -200,10 +220,112 @@ class DigitalHuman:
             self.logger.info(f"數位人視頻已生成: {output_file}")
             return output_file
             
+        except TaskCancelled:
+            self.logger.info(f"數位人視頻生成已取消: {output_file}")
+            if cap is not None:
+                cap.release()
+            out.release()
+            remove_files([output_file, output_file.replace('.mp4', '_temp.mp4')])
+            raise
+            
         except Exception as e:
             self.logger.error(f"生成數位人視頻失敗: {e}")
             return None
     
+    def _resolve_template_path(self, template_name):
+        """查找模板視頻文件
+        
+        參數:
+            template_name (str): 模板名稱
+            
+        返回:
+            str: 模板路徑，找不到時返回 None
+        """
+        for ext in ['.mp4', '.avi', '.mov']:
+            template_path = os.path.join(self.templates_dir, f"{template_name}{ext}")
+            if os.path.exists(template_path):
+                return template_path
+        return None
+        
+    def load_template_frames(self, template_path):
+        """解碼模板視頻的全部幀並保存在進程內緩存
+        
+        模板文件修改後重新解碼；加入後超過 template_cache_mb 的模板不緩存，返回 None。
+        
+        參數:
+            template_path (str): 模板路徑
+            
+        返回:
+            dict: 已解碼的模板 (fps, size, frames)，無法緩存時返回 None
+        """
+        import cv2
+        try:
+            mtime = os.path.getmtime(template_path)
+        except OSError:
+            return None
+            
+        with _template_frames_lock:
+            entry = _template_frames.get(template_path)
+            if entry is not None and entry['mtime'] == mtime:
+                return entry
+            cached_bytes = sum(e['bytes'] for path, e in _template_frames.items() if path != template_path)
+            
+        cap = cv2.VideoCapture(template_path)
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            
+            # 預估解碼後的大小，超出上限時不解碼
+            if not fps or cached_bytes + frame_count * width * height * 3 > self.template_cache_bytes:
+                return None
+                
+            frames = []
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+        finally:
+            cap.release()
+            
+        if not frames:
+            return None
+            
+        entry = {
+            'mtime': mtime,
+            'fps': fps,
+            'size': (width, height),
+            'frames': frames,
+            'bytes': sum(frame.nbytes for frame in frames)
+        }
+        with _template_frames_lock:
+            _template_frames[template_path] = entry
+            
+        self.logger.info(f"已解碼數位人模板: {os.path.basename(template_path)} "
+                         f"({len(frames)} 幀, {entry['bytes'] / 1024 / 1024:.1f} MB)")
+        return entry
+        
+    def preload_templates(self, template_names=None):
+        """預先解碼數位人模板
+        
+        參數:
+            template_names (list, 可選): 模板名稱列表，預設為全部模板
+            
+        返回:
+            int: 已解碼的模板數量
+        """
+        if template_names is None:
+            template_names = [t['name'] for t in self.list_templates()]
+            
+        loaded = 0
+        for template_name in template_names:
+            template_path = self._resolve_template_path(template_name)
+            if template_path and self.load_template_frames(template_path) is not None:
+                loaded += 1
+        return loaded
+        
     def extract_frames(self, template_path, output_dir=None):
         """從模板視頻中提取幀
         
@@ -214,6 +336,7 @@ class DigitalHuman:
         返回:
             dict: 幀信息
         """
+        import cv2
         if not os.path.exists(template_path):
             self.logger.error(f"找不到模板視頻: {template_path}")
             return None
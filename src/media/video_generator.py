@@ -6,22 +6,49 @@
 """
 
 import os
-import cv2
+import hashlib
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')  # 設置 Matplotlib 後端，避免需要 GUI
 import logging
 from datetime import datetime
-from pydub import AudioSegment
 import pandas as pd
 import threading
 import queue
+import contextlib
+
+from src.data.cache_manager import get_cache_manager
+from src.utils.cancellation import TaskCancelled, raise_if_cancelled, run_subprocess
+
+# 圖表樣式：rc_context 修改的是全局 rcParams，並發繪製的線程共用同一個樣式上下文，
+# 第一個進入的線程套用樣式，最後一個離開的線程恢復，避免一個線程恢復時影響其他仍在繪製的線程
+_chart_style_lock = threading.Lock()
+_chart_style_users = 0
+_chart_style_context = None
+
+@contextlib.contextmanager
+def _chart_style():
+    """在深色圖表樣式中繪製（可被多個線程同時使用）"""
+    global _chart_style_users, _chart_style_context
+    import matplotlib
+    import matplotlib.style
+    with _chart_style_lock:
+        if _chart_style_users == 0:
+            _chart_style_context = matplotlib.rc_context(matplotlib.style.library['dark_background'])
+            _chart_style_context.__enter__()
+        _chart_style_users += 1
+    try:
+        yield
+    finally:
+        with _chart_style_lock:
+            _chart_style_users -= 1
+            if _chart_style_users == 0:
+                _chart_style_context.__exit__(None, None, None)
+                _chart_style_context = None
 
 class VideoGenerator:
     """視頻生成器
     
     負責將資料、圖表、字幕和音頻合成為完整的視頻。
+    OpenCV、Matplotlib 與 pydub 在使用它們的方法中才載入，建立生成器（例如只提交任務的主控制器）不需要載入渲染依賴。
     """
     
     def __init__(self, config=None, output_dir='output'):
@@ -34,7 +61,7 @@ class VideoGenerator:
         self.logger = logging.getLogger(__name__)
         self.config = config or {}
         self.output_dir = output_dir
-        self.frames_queue = queue.Queue(maxsize=100)  # 用於多執行緒處理的佇列
+        self.frames_queue_size = self.config.get('frames_queue_size', 100)  # 每次渲染的幀佇列大小
         
         # 確保輸出目錄存在
         os.makedirs(output_dir, exist_ok=True)
@@ -43,9 +70,14 @@ class VideoGenerator:
         self.width = self.config.get('width', 1920)
         self.height = self.config.get('height', 1080)
         self.fps = self.config.get('fps', 30)
-        self.font = cv2.FONT_HERSHEY_SIMPLEX
         self.watermark = self.config.get('watermark', True)
         
+        # 完整圖表圖層緩存：動畫結束後每一幀的圖表相同，可預先渲染並在任務之間共用
+        self.chart_cache_dir = self.config.get('chart_cache_dir', os.path.join(os.getcwd(), 'cache', 'charts', 'layers'))
+        os.makedirs(self.chart_cache_dir, exist_ok=True)
+        self.cache_manager = get_cache_manager()
+        self.cache_manager.register('chart_layers', self.chart_cache_dir, owner='video_generator')
+        
     def create_stock_video(self, stock_data, subtitle_data, audio_file=None, output_file=None, digital_human=None):
         """創建股票分析視頻
         
@@ -66,10 +98,48 @@ class VideoGenerator:
             
         self.logger.info(f"開始生成股票視頻: {output_file}")
         
+        # 計算視頻時長
+        audio_duration = self.resolve_duration(subtitle_data, audio_file)
+            
+        # 渲染無聲視頻
+        if not self.render_video(stock_data, subtitle_data, audio_duration, output_file, digital_human):
+            return None
+        
+        # 如果音頻存在，將音頻添加到視頻
+        if audio_file and os.path.exists(audio_file):
+            output_with_audio = self.mux_audio(output_file, audio_file)
+            if output_with_audio:
+                # 如果添加音頻成功，替換原始視頻
+                if os.path.exists(output_file):
+                    os.remove(output_file)
+                output_file = output_with_audio
+        
+        self.logger.info(f"股票視頻生成完成: {output_file}")
+        return output_file
+        
+    @property
+    def font(self):
+        """OpenCV 字體"""
+        import cv2
+        return cv2.FONT_HERSHEY_SIMPLEX
+        
+    def resolve_duration(self, subtitle_data, audio_file=None):
+        """決定視頻時長
+        
+        優先使用音頻時長，沒有音頻時使用字幕結束時間，否則使用預設 60 秒。
+        
+        參數:
+            subtitle_data (list): 字幕數據列表
+            audio_file (str, 可選): 音頻文件路徑
+            
+        返回:
+            float: 時長（秒）
+        """
         # 準備音頻
         audio_duration = 0
         if audio_file and os.path.exists(audio_file):
             try:
+                from pydub import AudioSegment
                 audio = AudioSegment.from_file(audio_file)
                 audio_duration = len(audio) / 1000.0  # 轉換為秒
             except Exception as e:
@@ -84,23 +154,50 @@ class VideoGenerator:
         if audio_duration == 0:
             audio_duration = 60  # 預設 60 秒
             
+        return audio_duration
+        
+    def render_video(self, stock_data, subtitle_data, duration, output_file, digital_human=None, cancel_token=None):
+        """渲染無聲的股票分析視頻
+        
+        不需要音頻，可以在語音合成進行時並行執行，之後再以 mux_audio 合成音軌。
+        
+        參數:
+            stock_data (pandas.DataFrame): 股票數據
+            subtitle_data (list): 字幕數據列表
+            duration (float): 視頻時長（秒）
+            output_file (str): 輸出文件路徑
+            digital_human (dict, 可選): 數字人設定
+            cancel_token (CancellationToken, 可選): 取消令牌，取消時停止產生與寫入幀、
+                刪除不完整的輸出並拋出 TaskCancelled
+            
+        返回:
+            str: 生成的視頻檔案路徑，失敗時返回 None
+        """
+        import cv2
+        raise_if_cancelled(cancel_token)
+        
         # 計算總幀數
-        total_frames = int(audio_duration * self.fps)
+        total_frames = int(duration * self.fps)
         
         # 初始化視頻寫入器
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         video_writer = cv2.VideoWriter(output_file, fourcc, self.fps, (self.width, self.height))
         
+        # 每次渲染使用獨立的佇列，允許多個渲染同時進行
+        frames_queue = queue.Queue(maxsize=self.frames_queue_size)
+        
         # 啟動圖表生成執行緒
         chart_thread = threading.Thread(target=self._generate_stock_frames, 
-                                        args=(stock_data, total_frames, subtitle_data, digital_human))
+                                        args=(stock_data, total_frames, subtitle_data, digital_human, frames_queue,
+                                              cancel_token))
         chart_thread.start()
         
         # 主執行緒從佇列獲取圖表並寫入視頻
         frames_processed = 0
+        cancelled = False
         while frames_processed < total_frames:
             try:
-                frame = self.frames_queue.get(timeout=30)  # 最多等待 30 秒
+                frame = self._get_frame(frames_queue, 30, cancel_token)  # 最多等待 30 秒
                 video_writer.write(frame)
                 frames_processed += 1
                 
@@ -108,10 +205,13 @@ class VideoGenerator:
                 if frames_processed % 30 == 0:
                     self.logger.info(f"視頻生成進度: {frames_processed}/{total_frames} 幀 ({frames_processed/total_frames*100:.1f}%)")
                     
-                self.frames_queue.task_done()
+                frames_queue.task_done()
             except queue.Empty:
                 self.logger.warning("等待圖表生成逾時，可能發生執行緒死鎖或效能問題")
                 break
+            except TaskCancelled:
+                cancelled = True
+                break
         
         # 釋放資源
         video_writer.release()
@@ -120,20 +220,66 @@ class VideoGenerator:
         if chart_thread.is_alive():
             self.logger.warning("圖表生成執行緒仍在運行，等待它完成...")
             chart_thread.join(timeout=30)
+            
+        if cancelled:
+            self.logger.info(f"視頻渲染已取消: {output_file} ({frames_processed}/{total_frames} 幀)")
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            raise TaskCancelled("任務已取消")
+            
+        if not os.path.exists(output_file):
+            self.logger.error(f"渲染視頻失敗: {output_file}")
+            return None
+            
+        self.logger.info(f"無聲視頻渲染完成: {output_file} ({frames_processed} 幀)")
+        return output_file
         
-        # 如果音頻存在，將音頻添加到視頻
-        if audio_file and os.path.exists(audio_file):
-            output_with_audio = self._add_audio_to_video(output_file, audio_file)
-            if output_with_audio:
-                # 如果添加音頻成功，替換原始視頻
-                if os.path.exists(output_file):
-                    os.remove(output_file)
-                output_file = output_with_audio
+    def _get_frame(self, frames_queue, timeout, cancel_token=None):
+        """從幀佇列取出一幀，等待期間定期檢查取消令牌
         
-        self.logger.info(f"股票視頻生成完成: {output_file}")
-        return output_file
+        參數:
+            frames_queue (queue.Queue): 幀佇列
+            timeout (float): 最長等待秒數
+            cancel_token (CancellationToken, 可選): 取消令牌
+            
+        返回:
+            numpy.ndarray: 幀，逾時時拋出 queue.Empty，取消時拋出 TaskCancelled
+        """
+        if cancel_token is None:
+            return frames_queue.get(timeout=timeout)
+            
+        waited = 0.0
+        while True:
+            cancel_token.raise_if_cancelled()
+            try:
+                return frames_queue.get(timeout=0.2)
+            except queue.Empty:
+                waited += 0.2
+                if waited >= timeout:
+                    raise
+                    
+    def _put_frame(self, frames_queue, frame, cancel_token=None):
+        """把幀放入佇列，佇列已滿時定期檢查取消令牌，避免寫入端停止後永久阻塞
+        
+        參數:
+            frames_queue (queue.Queue): 幀佇列
+            frame (numpy.ndarray): 幀
+            cancel_token (CancellationToken, 可選): 取消令牌
+        """
+        if cancel_token is None:
+            frames_queue.put(frame)
+            return
+            
+        while True:
+            cancel_token.raise_if_cancelled()
+            try:
+                frames_queue.put(frame, timeout=0.2)
+                return
+            except queue.Full:
+                continue
         
-    def _generate_stock_frames(self, stock_data, total_frames, subtitle_data, digital_human=None):
+    def _generate_stock_frames(self, stock_data, total_frames, subtitle_data, digital_human=None, frames_queue=None,
+                               cancel_token=None):
         """生成股票視頻的每一幀
         
         參數:
@@ -141,17 +287,28 @@ class VideoGenerator:
             total_frames (int): 總幀數
             subtitle_data (list): 字幕數據
             digital_human (dict, 可選): 數字人設定
+            frames_queue (queue.Queue): 輸出幀的佇列
+            cancel_token (CancellationToken, 可選): 取消令牌，每一幀檢查一次
         """
+        import cv2
+        frame_idx = -1
         try:
             # 股票數據相關變數
             ticker = stock_data.attrs.get('ticker', 'STOCK')
             dates = stock_data.index
             prices = stock_data['Close']
             
+            # 圖表只在顯示的數據點數改變時重新繪製
+            chart_len = None
+            chart_image = None
+            
             # 生成視頻幀
             for frame_idx in range(total_frames):
+                raise_if_cancelled(cancel_token)
+                
                 # 計算當前時間點
                 current_time = frame_idx / self.fps
+                display_len = self._chart_display_len(len(dates), current_time)
                 
                 # 創建空白畫布
                 frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
@@ -164,7 +321,12 @@ class VideoGenerator:
                 self._draw_title(frame, f"{ticker} 股票分析")
                 
                 # 繪製股票圖表
-                chart_image = self._generate_stock_chart(stock_data, current_time)
+                if display_len != chart_len:
+                    chart_len = display_len
+                    if display_len >= len(dates):
+                        chart_image = self.get_chart_layer(stock_data)
+                    else:
+                        chart_image = self._generate_stock_chart(stock_data, current_time)
                 if chart_image is not None:
                     chart_h, chart_w, _ = chart_image.shape
                     y_offset = 120  # 標題下方的位置
@@ -188,20 +350,88 @@ class VideoGenerator:
                     self._add_watermark(frame)
                 
                 # 添加到佇列
-                self.frames_queue.put(frame)
+                self._put_frame(frames_queue, frame, cancel_token)
                 
+        except TaskCancelled:
+            # 寫入端會在取得下一幀前發現取消，不需要補齊剩餘幀
+            return
+            
         except Exception as e:
             self.logger.error(f"生成圖表幀時出錯: {e}")
             # 確保即使發生錯誤，佇列中也有足夠的幀
             remaining_frames = total_frames - frame_idx - 1
-            for _ in range(remaining_frames):
-                # 創建錯誤幀
-                error_frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-                error_frame[:, :] = (30, 30, 30)  # 深灰色背景
-                cv2.putText(error_frame, "圖表生成錯誤", (self.width//2-150, self.height//2), 
-                            self.font, 1.5, (255, 255, 255), 2, cv2.LINE_AA)
-                self.frames_queue.put(error_frame)
+            try:
+                for _ in range(remaining_frames):
+                    # 創建錯誤幀
+                    error_frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+                    error_frame[:, :] = (30, 30, 30)  # 深灰色背景
+                    cv2.putText(error_frame, "圖表生成錯誤", (self.width//2-150, self.height//2), 
+                                self.font, 1.5, (255, 255, 255), 2, cv2.LINE_AA)
+                    self._put_frame(frames_queue, error_frame, cancel_token)
+            except TaskCancelled:
+                return
     
+    def _chart_display_len(self, data_len, current_time):
+        """計算特定時間點圖表顯示的數據點數（20 秒內逐漸展示全部數據）
+        
+        參數:
+            data_len (int): 數據點總數
+            current_time (float): 當前時間點 (秒)
+            
+        返回:
+            int: 顯示的數據點數
+        """
+        progress = min(1.0, current_time / 20.0)
+        return max(10, int(data_len * progress))
+        
+    def _chart_cache_key(self, stock_data):
+        """計算完整圖表圖層的緩存鍵（股票、數據範圍、最新收盤價與指標欄位）
+        
+        參數:
+            stock_data (pandas.DataFrame): 股票數據
+            
+        返回:
+            str: 緩存鍵
+        """
+        ticker = stock_data.attrs.get('ticker', 'STOCK')
+        indicators = [c for c in ('SMA_20', 'SMA_50', 'SMA_200', 'Volume', 'RSI', 'MACD') if c in stock_data.columns]
+        raw = (f"{ticker}|{len(stock_data)}|{stock_data.index[0]}|{stock_data.index[-1]}|"
+               f"{float(stock_data['Close'].iloc[-1]):.6f}|{','.join(indicators)}")
+        return f"{ticker}_{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]}"
+        
+    def get_chart_layer(self, stock_data):
+        """獲取完整顯示所有數據的圖表圖層（優先讀取緩存）
+        
+        參數:
+            stock_data (pandas.DataFrame): 股票數據
+            
+        返回:
+            numpy.ndarray: 圖表圖像
+        """
+        import cv2
+        if stock_data is None or stock_data.empty:
+            return None
+            
+        cache_path = os.path.join(self.chart_cache_dir, f"{self._chart_cache_key(stock_data)}.png")
+        if os.path.exists(cache_path):
+            chart_image = cv2.imread(cache_path)
+            if chart_image is not None:
+                self.cache_manager.touch(cache_path)
+                return chart_image
+                
+        chart_image = self._generate_stock_chart(stock_data, float('inf'))
+        if chart_image is not None:
+            temp_path = f"{cache_path}.{os.getpid()}_{threading.get_ident()}.png"
+            try:
+                cv2.imwrite(temp_path, chart_image)
+                os.replace(temp_path, cache_path)
+                self.cache_manager.record(cache_path)
+            except Exception as e:
+                self.logger.warning(f"寫入圖表緩存失敗: {e}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        return chart_image
+        
     def _generate_stock_chart(self, stock_data, current_time):
         """為特定時間點生成股票圖表
         
@@ -212,90 +442,88 @@ class VideoGenerator:
         返回:
             numpy.ndarray: 圖表圖像
         """
+        import cv2
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
         try:
             # 根據當前時間計算數據索引
             # 設計一個動畫效果：逐漸展示更多數據
-            progress = min(1.0, current_time / 20.0)  # 20秒內完整顯示
             chart_width = 1600
             chart_height = 800
             
-            # 創建圖表
-            plt.figure(figsize=(chart_width/100, chart_height/100), dpi=100)
-            plt.style.use('dark_background')
-            
-            # 獲取數據
-            dates = stock_data.index
-            close_prices = stock_data['Close']
-            
-            # 計算顯示多少數據
-            data_len = len(dates)
-            display_len = max(10, int(data_len * progress))
-            
-            # 價格圖
-            ax1 = plt.subplot2grid((6, 1), (0, 0), rowspan=3, colspan=1)
-            ax1.plot(dates[-display_len:], close_prices[-display_len:], color='#1E90FF', linewidth=2)
-            
-            # 添加移動平均線
-            if 'SMA_20' in stock_data.columns:
-                ax1.plot(dates[-display_len:], stock_data['SMA_20'][-display_len:], color='#FF8C00', linewidth=1, label='SMA 20')
-            if 'SMA_50' in stock_data.columns:
-                ax1.plot(dates[-display_len:], stock_data['SMA_50'][-display_len:], color='#FF4500', linewidth=1, label='SMA 50')
-            if 'SMA_200' in stock_data.columns:
-                ax1.plot(dates[-display_len:], stock_data['SMA_200'][-display_len:], color='#9400D3', linewidth=1, label='SMA 200')
+            # 每次調用建立獨立的 Figure 與 Agg 畫布，不使用 pyplot 的全局狀態，多個線程可同時繪製
+            with _chart_style():
+                fig = Figure(figsize=(chart_width/100, chart_height/100), dpi=100)
+                canvas = FigureCanvasAgg(fig)
+                grid = fig.add_gridspec(6, 1)
                 
-            ax1.set_title('價格走勢', color='white')
-            ax1.legend(loc='upper left')
-            ax1.grid(True, alpha=0.3)
-            
-            # 交易量圖
-            ax2 = plt.subplot2grid((6, 1), (3, 0), rowspan=1, colspan=1, sharex=ax1)
-            if 'Volume' in stock_data.columns:
-                ax2.bar(dates[-display_len:], stock_data['Volume'][-display_len:], color='#1E90FF', alpha=0.7)
-                ax2.set_title('交易量', color='white')
-                ax2.grid(True, alpha=0.3)
-            
-            # RSI 指標
-            ax3 = plt.subplot2grid((6, 1), (4, 0), rowspan=1, colspan=1, sharex=ax1)
-            if 'RSI' in stock_data.columns:
-                ax3.plot(dates[-display_len:], stock_data['RSI'][-display_len:], color='#FF4500', linewidth=1.5)
-                ax3.axhline(70, color='#FF4500', linestyle='--', alpha=0.5)
-                ax3.axhline(30, color='#1E90FF', linestyle='--', alpha=0.5)
-                ax3.set_title('RSI', color='white')
-                ax3.grid(True, alpha=0.3)
-                ax3.set_ylim(0, 100)
-            
-            # MACD 指標
-            ax4 = plt.subplot2grid((6, 1), (5, 0), rowspan=1, colspan=1, sharex=ax1)
-            if all(col in stock_data.columns for col in ['MACD', 'Signal_Line', 'MACD_Histogram']):
-                ax4.plot(dates[-display_len:], stock_data['MACD'][-display_len:], color='#1E90FF', linewidth=1.5, label='MACD')
-                ax4.plot(dates[-display_len:], stock_data['Signal_Line'][-display_len:], color='#FF4500', linewidth=1, label='Signal')
+                # 獲取數據
+                dates = stock_data.index
+                close_prices = stock_data['Close']
                 
-                # 繪製 MACD 柱狀圖
-                hist = stock_data['MACD_Histogram'][-display_len:].values
-                for i, date in enumerate(dates[-display_len:]):
-                    if i < len(hist):
-                        if hist[i] >= 0:
-                            ax4.bar(date, hist[i], color='#00FF00', alpha=0.5)
-                        else:
-                            ax4.bar(date, hist[i], color='#FF4500', alpha=0.5)
+                # 計算顯示多少數據
+                display_len = self._chart_display_len(len(dates), current_time)
                 
-                ax4.set_title('MACD', color='white')
-                ax4.legend(loc='upper left')
-                ax4.grid(True, alpha=0.3)
-            
-            # 隱藏 x 軸標籤 (除了最後一個子圖)
-            plt.setp([a.get_xticklabels() for a in [ax1, ax2, ax3]], visible=False)
-            plt.subplots_adjust(left=0.05, right=0.95, top=0.95, bottom=0.1, hspace=0.3)
-            
-            # 將圖表轉換為圖像
-            plt.savefig('temp_chart.png', transparent=False)
-            plt.close()
-            
-            chart_image = cv2.imread('temp_chart.png')
-            
-            # 刪除臨時檔案
-            if os.path.exists('temp_chart.png'):
-                os.remove('temp_chart.png')
+                # 價格圖
+                ax1 = fig.add_subplot(grid[0:3, 0])
+                ax1.plot(dates[-display_len:], close_prices[-display_len:], color='#1E90FF', linewidth=2)
+                
+                # 添加移動平均線
+                if 'SMA_20' in stock_data.columns:
+                    ax1.plot(dates[-display_len:], stock_data['SMA_20'][-display_len:], color='#FF8C00', linewidth=1, label='SMA 20')
+                if 'SMA_50' in stock_data.columns:
+                    ax1.plot(dates[-display_len:], stock_data['SMA_50'][-display_len:], color='#FF4500', linewidth=1, label='SMA 50')
+                if 'SMA_200' in stock_data.columns:
+                    ax1.plot(dates[-display_len:], stock_data['SMA_200'][-display_len:], color='#9400D3', linewidth=1, label='SMA 200')
+                    
+                ax1.set_title('價格走勢', color='white')
+                ax1.legend(loc='upper left')
+                ax1.grid(True, alpha=0.3)
+                
+                # 交易量圖
+                ax2 = fig.add_subplot(grid[3, 0], sharex=ax1)
+                if 'Volume' in stock_data.columns:
+                    ax2.bar(dates[-display_len:], stock_data['Volume'][-display_len:], color='#1E90FF', alpha=0.7)
+                    ax2.set_title('交易量', color='white')
+                    ax2.grid(True, alpha=0.3)
+                
+                # RSI 指標
+                ax3 = fig.add_subplot(grid[4, 0], sharex=ax1)
+                if 'RSI' in stock_data.columns:
+                    ax3.plot(dates[-display_len:], stock_data['RSI'][-display_len:], color='#FF4500', linewidth=1.5)
+                    ax3.axhline(70, color='#FF4500', linestyle='--', alpha=0.5)
+                    ax3.axhline(30, color='#1E90FF', linestyle='--', alpha=0.5)
+                    ax3.set_title('RSI', color='white')
+                    ax3.grid(True, alpha=0.3)
+                    ax3.set_ylim(0, 100)
+                
+                # MACD 指標
+                ax4 = fig.add_subplot(grid[5, 0], sharex=ax1)
+                if all(col in stock_data.columns for col in ['MACD', 'Signal_Line', 'MACD_Histogram']):
+                    ax4.plot(dates[-display_len:], stock_data['MACD'][-display_len:], color='#1E90FF', linewidth=1.5, label='MACD')
+                    ax4.plot(dates[-display_len:], stock_data['Signal_Line'][-display_len:], color='#FF4500', linewidth=1, label='Signal')
+                    
+                    # 繪製 MACD 柱狀圖
+                    hist = stock_data['MACD_Histogram'][-display_len:].values
+                    for i, date in enumerate(dates[-display_len:]):
+                        if i < len(hist):
+                            if hist[i] >= 0:
+                                ax4.bar(date, hist[i], color='#00FF00', alpha=0.5)
+                            else:
+                                ax4.bar(date, hist[i], color='#FF4500', alpha=0.5)
+                    
+                    ax4.set_title('MACD', color='white')
+                    ax4.legend(loc='upper left')
+                    ax4.grid(True, alpha=0.3)
+                
+                # 隱藏 x 軸標籤 (除了最後一個子圖)
+                for ax in (ax1, ax2, ax3):
+                    ax.tick_params(labelbottom=False)
+                fig.subplots_adjust(left=0.05, right=0.95, top=0.95, bottom=0.1, hspace=0.3)
+                
+                # 將圖表直接在記憶體中轉換為圖像（避免共用臨時檔案）
+                canvas.draw()
+                chart_image = cv2.cvtColor(np.asarray(canvas.buffer_rgba()), cv2.COLOR_RGBA2BGR)
                 
             return chart_image
             
@@ -309,6 +537,7 @@ class VideoGenerator:
         參數:
             frame (numpy.ndarray): 視頻幀
         """
+        import cv2
         # 頂部和底部邊框
         cv2.rectangle(frame, (0, 0), (self.width, 80), (40, 40, 40), -1)
         cv2.rectangle(frame, (0, self.height-100), (self.width, self.height), (40, 40, 40), -1)
@@ -324,6 +553,7 @@ class VideoGenerator:
             frame (numpy.ndarray): 視頻幀
             title (str): 標題文字
         """
+        import cv2
         cv2.putText(frame, title, (20, 50), self.font, 1.5, (255, 255, 255), 2, cv2.LINE_AA)
         
         # 添加時間戳
@@ -339,6 +569,7 @@ class VideoGenerator:
             text (str): 字幕文字
             y_pos (int): 垂直位置
         """
+        import cv2
         # 計算文字大小以居中
         text_size = cv2.getTextSize(text, self.font, 1.0, 2)[0]
         x_pos = (self.width - text_size[0]) // 2
@@ -377,6 +608,7 @@ class VideoGenerator:
             dh_frame (numpy.ndarray): 數字人視頻幀
             position (str): 位置 ('bottom_right', 'bottom_left', 'top_right', 'top_left')
         """
+        import cv2
         if dh_frame is None:
             return
             
@@ -423,6 +655,7 @@ class VideoGenerator:
         參數:
             frame (numpy.ndarray): 視頻幀
         """
+        import cv2
         watermark_text = "自動生成"
         text_size = cv2.getTextSize(watermark_text, self.font, 0.5, 1)[0]
         
@@ -436,40 +669,88 @@ class VideoGenerator:
         cv2.putText(overlay, watermark_text, (x, y), self.font, 0.5, (200, 200, 200), 1, cv2.LINE_AA)
         cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
     
-    def _add_audio_to_video(self, video_file, audio_file):
+    def mux_audio(self, video_file, audio_file, output_file=None, cancel_token=None, subtitle_file=None):
         """將音頻添加到視頻
         
+        視頻與音頻分開產生時，兩者時長可能不同：
+        音頻較長時以最後一幀延長視頻（需重新編碼），否則直接複製視頻串流。
+        提供字幕文件時同時燒入字幕（需重新編碼），用於依實際音頻時長對齊的字幕，
+        這樣畫面渲染不需要等待語音合成。
+        
         參數:
             video_file (str): 視頻文件路徑
-            audio_file (str): 音頻文件路徑
+            audio_file (str): 音頻文件路徑，為 None 時只燒入字幕
+            output_file (str, 可選): 輸出文件路徑
+            cancel_token (CancellationToken, 可選): 取消令牌，取消時終止 ffmpeg 並刪除不完整的輸出
+            subtitle_file (str, 可選): 要燒入畫面的字幕文件（SRT 或 VTT）
             
         返回:
             str: 帶音頻的視頻檔案路徑
         """
-        output_file = os.path.splitext(video_file)[0] + "_with_audio.mp4"
+        if output_file is None:
+            output_file = os.path.splitext(video_file)[0] + "_with_audio.mp4"
         
         try:
-            import subprocess
+            from pydub.utils import mediainfo
             
+            filters = []
+            if subtitle_file and os.path.exists(subtitle_file):
+                filters.append(self._subtitle_filter(subtitle_file))
+                
+            cmd = ['ffmpeg', '-y', '-i', video_file]
+            if audio_file:
+                # 比較音頻與視頻時長（只讀取檔頭，不解碼）
+                audio_duration = float(mediainfo(audio_file).get('duration') or 0)
+                video_duration = float(mediainfo(video_file).get('duration') or 0)
+                pad_duration = audio_duration - video_duration
+                if pad_duration > 1.0 / self.fps:
+                    filters.append(f'tpad=stop_mode=clone:stop_duration={pad_duration:.3f}')
+                cmd += ['-i', audio_file]
+                
             # 使用 ffmpeg 合併視頻和音頻
-            cmd = [
-                'ffmpeg',
-                '-i', video_file,
-                '-i', audio_file,
-                '-c:v', 'copy',
-                '-c:a', 'aac',
-                '-strict', 'experimental',
-                '-shortest',
-                output_file
-            ]
-            
-            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if filters:
+                cmd += ['-vf', ','.join(filters), '-c:v', 'libx264', '-preset', 'veryfast']
+            else:
+                cmd += ['-c:v', 'copy']
+            cmd += ['-map', '0:v']
+            if audio_file:
+                cmd += [
+                    '-map', '1:a',
+                    '-c:a', 'aac',
+                    '-strict', 'experimental',
+                    '-shortest'
+                ]
+            cmd.append(output_file)
+            
+            run_subprocess(cmd, cancel_token)
             self.logger.info(f"成功將音頻添加到視頻: {output_file}")
             return output_file
             
+        except TaskCancelled:
+            self.logger.info(f"音視頻合成已取消: {output_file}")
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            raise
+            
         except Exception as e:
             self.logger.error(f"添加音頻到視頻時出錯: {e}")
             return None
+            
+    def _subtitle_filter(self, subtitle_file):
+        """建立燒入字幕的 ffmpeg 濾鏡
+        
+        路徑先按濾鏡選項值轉義（\\ ' :），再按濾鏡圖轉義（\\ ' [ ] , ;）。
+        
+        參數:
+            subtitle_file (str): 字幕文件路徑
+            
+        返回:
+            str: subtitles 濾鏡
+        """
+        path = os.path.abspath(subtitle_file)
+        for special in ("\\\\:'", "\\\\'[],;"):
+            path = ''.join('\\' + char if char in special else char for char in path)
+        return f"subtitles=filename={path}"
     
     def load_digital_human(self, video_path):
         """載入數字人視頻
@@ -480,6 +761,7 @@ class VideoGenerator:
         返回:
             dict: 數字人數據
         """
+        import cv2
         if not os.path.exists(video_path):
             self.logger.error(f"找不到數字人視頻: {video_path}")
             return None
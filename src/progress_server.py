@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 任務進度推送服務（ASGI）
+
+Flask 應用的 /api/task_events 與 /api/task_progress 在 WSGI 線程中等待，每個連線佔用一個線程。
+本服務以協程提供相同的兩個端點（路徑、事件格式與游標都相同），單個進程可以同時服務大量訂閱者，
+進度從與網頁服務共用的 SQLite 任務存儲讀取。
+
+用法:
+    python -m src.progress_server --host 0.0.0.0 --port 5556 [--config config.json]
+    uvicorn --factory src.progress_server:create_app --host 0.0.0.0 --port 5556
+
+部署時由反向代理把 /api/task_events/ 與 /api/task_progress/ 轉發到本服務（關閉代理緩衝），
+其餘路徑仍轉發到 Flask 應用。
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+from urllib.parse import parse_qs
+
+from src.core.task_store import MemoryTaskStore, create_task_store
+from src.core.progress_broker import AsyncProgressBroker, parse_timeout
+
+# 配置文件路徑的環境變數（uvicorn --factory 啟動時使用）
+CONFIG_ENV = 'PROGRESS_SERVER_CONFIG'
+
+EVENTS_PREFIX = '/api/task_events/'
+PROGRESS_PREFIX = '/api/task_progress/'
+
+logger = logging.getLogger(__name__)
+
+def create_app(config=None):
+    """建立 ASGI 應用
+
+    參數:
+        config (dict, 可選): 配置設定（task_store、progress_stream，與主控制器相同的結構），
+            預設讀取環境變數 PROGRESS_SERVER_CONFIG 指定的配置文件
+
+    返回:
+        callable: ASGI 應用
+    """
+    if config is None:
+        config_path = os.environ.get(CONFIG_ENV)
+        if config_path:
+            from src.cli import load_config
+            config = load_config(config_path)
+    config = config or {}
+
+    task_store = create_task_store(config.get('task_store', {}))
+    if isinstance(task_store, MemoryTaskStore):
+        raise ValueError("進度推送服務需要與網頁服務共用的 SQLite 任務存儲 (task_store.backend: sqlite)")
+
+    broker = AsyncProgressBroker(task_store.get, config.get('progress_stream', {}))
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await _lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        path = scope['path']
+        if scope['method'] != 'GET':
+            await _send_json(send, 405, {'error': '只支援 GET'})
+        elif path.startswith(EVENTS_PREFIX) and len(path) > len(EVENTS_PREFIX):
+            await _stream_events(broker, path[len(EVENTS_PREFIX):], receive, send)
+        elif path.startswith(PROGRESS_PREFIX) and len(path) > len(PROGRESS_PREFIX):
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            await _poll_progress(broker, path[len(PROGRESS_PREFIX):], query, send)
+        else:
+            await _send_json(send, 404, {'error': '找不到頁面'})
+
+    app.broker = broker
+    return app
+
+async def _lifespan(receive, send):
+    """處理 ASGI lifespan 事件（沒有需要啟動或關閉的資源）"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def _send_json(send, status, payload):
+    """發送 JSON 回應
+
+    參數:
+        send (callable): ASGI send
+        status (int): HTTP 狀態碼
+        payload (dict): 回應內容
+    """
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json; charset=utf-8'),
+                    (b'content-length', str(len(body)).encode('ascii'))]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _wait_disconnect(receive):
+    """等待客戶端斷線"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+async def _stream_events(broker, task_id, receive, send):
+    """以 Server-Sent Events 推送任務進度，客戶端斷線時停止
+
+    參數:
+        broker (AsyncProgressBroker): 進度推送中心
+        task_id (str): 任務 ID
+        receive (callable): ASGI receive
+        send (callable): ASGI send
+    """
+    if await broker.get_task(task_id) is None:
+        await _send_json(send, 404, {'error': f'找不到任務: {task_id}'})
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')]
+    })
+
+    events = broker.subscribe(task_id)
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(events.__anext__())
+            await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_chunk.done():
+                # 等待生成器處理取消（註銷訂閱者）後才能關閉
+                next_chunk.cancel()
+                await asyncio.gather(next_chunk, return_exceptions=True)
+                return
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                break
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        await events.aclose()
+
+async def _poll_progress(broker, task_id, query, send):
+    """長輪詢任務進度：帶上次返回的 cursor，有新進度或逾時（timeout 秒）時返回
+
+    參數:
+        broker (AsyncProgressBroker): 進度推送中心
+        task_id (str): 任務 ID
+        query (dict): 查詢參數
+        send (callable): ASGI send
+    """
+    timeout = query.get('timeout', [None])[0]
+    if timeout is not None:
+        timeout = parse_timeout(timeout)
+        if timeout is None:
+            await _send_json(send, 400, {'error': 'timeout 必須是數字'})
+            return
+
+    if await broker.get_task(task_id) is None:
+        await _send_json(send, 404, {'error': f'找不到任務: {task_id}'})
+        return
+
+    result = await broker.poll(task_id, query.get('cursor', [None])[0], timeout)
+    await _send_json(send, 200, result)
+
+def main(argv=None):
+    """以 uvicorn 啟動進度推送服務
+
+    參數:
+        argv (list, 可選): 參數列表
+
+    返回:
+        int: 退出碼
+    """
+    parser = argparse.ArgumentParser(description='任務進度推送服務（SSE 與長輪詢）')
+    parser.add_argument('--host', default='0.0.0.0', help='主機')
+    parser.add_argument('--port', type=int, default=5556, help='埠號')
+    parser.add_argument('--config', help='配置文件（JSON 或 YAML，讀取 task_store 與 progress_stream）')
+    parser.add_argument('--log-level', default='INFO', help='日誌級別')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    try:
+        import uvicorn
+    except ImportError:
+        logger.error("無法啟動進度推送服務: 未安裝 uvicorn")
+        return 1
+
+    config = None
+    if args.config:
+        from src.cli import load_config
+        config = load_config(args.config)
+
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level=args.log_level.lower())
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 import json
 import os
 import traceback
@@ -12,7 +12,7 @@ from src.core.subtitle_manager import SubtitleManager
 from src.core.tts_controller import TTSController
 from src.core.sync_manager import SyncManager
 from src.core.main_controller import MainController
-from src.data.stock_collector import StockDataCollector
+from src.core.progress_broker import parse_timeout
 from src.data.data_processor import DataProcessor
 from src.media.video_generator import VideoGenerator
 from src.media.digital_human import DigitalHuman
@@ -85,13 +85,16 @@ def generate_speech():
         # 確保目錄存在
         os.makedirs("cache/audio", exist_ok=True)
         
-        # 生成語音
-        success = tts_controller.generate_speech(text, output_file, rate)
+        # 生成語音（同時取得引擎提供的時長與逐詞邊界）
+        timing = {}
+        success = tts_controller.generate_speech(text, output_file, rate, timing=timing)
         
         if success:
             return jsonify({
                 'success': True,
-                'audio_path': output_file
+                'audio_path': output_file,
+                'duration': timing.get('duration'),
+                'word_boundaries': timing.get('words', [])
             })
         else:
             return jsonify({'error': '語音生成失敗'}), 500
@@ -131,28 +134,22 @@ def batch_generate_speech():
         output_dir = os.path.join(os.getcwd(), 'cache', 'audio')
         os.makedirs(output_dir, exist_ok=True)
         
-        # 批量生成語音
-        audio_files = []
-        
-        for i, subtitle in enumerate(subtitles):
-            if 'text' not in subtitle:
-                continue
-                
-            # 生成時間戳
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S") + f"_{i:03d}"
-            output_file = os.path.join(output_dir, f"speech_{timestamp}.mp3")
-            
-            # 生成語音
-            success = tts_controller.generate_speech(subtitle['text'], output_file, rate)
-            
-            if success:
-                audio_files.append(output_file)
+        # 批量生成語音（並行合成，結果保持字幕順序）
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        audio_files = tts_controller.batch_generate_speech(
+            subtitles,
+            output_dir,
+            f"speech_{timestamp}",
+            concurrency=data.get('concurrency'),
+            align_timing=data.get('alignTiming')
+        )
                 
         # 返回結果
         return jsonify({
             'success': True,
             'audio_files': audio_files,
-            'count': len(audio_files)
+            'count': len(audio_files),
+            'subtitles': subtitles
         })
             
     except Exception as e:
@@ -170,8 +167,7 @@ def get_stock_data():
         interval = request.args.get('interval', '1d')
             
         # 獲取股票數據
-        stock_collector = StockDataCollector()
-        stock_data = stock_collector.get_stock_data(ticker, period=period, interval=interval)
+        stock_data = main_controller.stock_collector.get_stock_data(ticker, period=period, interval=interval)
         
         if stock_data is None or stock_data.empty:
             return jsonify({'error': f'找不到股票數據: {ticker}'}), 404
@@ -306,6 +302,117 @@ def get_task_status(task_id):
         error_details = traceback.format_exc()
         return jsonify({'error': str(e), 'details': error_details}), 500
 
+@api_bp.route('/task_events/<task_id>', methods=['GET'])
+def stream_task_events(task_id):
+    """以 Server-Sent Events 推送任務進度（取代輪詢 /task_status）
+
+    每個連線在任務結束前佔用一個 WSGI 線程，只適合開發伺服器與少量訂閱者；
+    生產部署時由反向代理把本路徑轉發到 src/progress_server.py 的 ASGI 服務（協程，不佔用線程）。
+    """
+    try:
+        events = main_controller.stream_task_progress(task_id)
+        
+        if events is None:
+            return jsonify({'error': f'找不到任務: {task_id}'}), 404
+            
+        return Response(
+            stream_with_context(events),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except Exception as e:
+        error_details = traceback.format_exc()
+        return jsonify({'error': str(e), 'details': error_details}), 500
+
+@api_bp.route('/task_progress/<task_id>', methods=['GET'])
+def poll_task_progress(task_id):
+    """長輪詢任務進度：帶上次返回的 cursor，有新進度或逾時（timeout 秒）時返回
+
+    等待期間佔用一個 WSGI 線程，生產部署時與 /task_events 一起轉發到 src/progress_server.py。
+    """
+    try:
+        timeout = request.args.get('timeout')
+        if timeout is not None:
+            timeout = parse_timeout(timeout)
+            if timeout is None:
+                return jsonify({'error': 'timeout 必須是數字'}), 400
+                
+        result = main_controller.poll_task_progress(task_id, request.args.get('cursor'), timeout)
+        
+        if result is None:
+            return jsonify({'error': f'找不到任務: {task_id}'}), 404
+            
+        return jsonify(result)
+    except Exception as e:
+        error_details = traceback.format_exc()
+        return jsonify({'error': str(e), 'details': error_details}), 500
+
+@api_bp.route('/worker_stats', methods=['GET'])
+def get_worker_stats():
+    """獲取任務工作者使用率"""
+    try:
+        return jsonify(main_controller.get_worker_stats())
+    except Exception as e:
+        error_details = traceback.format_exc()
+        return jsonify({'error': str(e), 'details': error_details}), 500
+
+@api_bp.route('/queue_metrics', methods=['GET'])
+def get_queue_metrics():
+    """獲取各優先級類別的排隊等待統計"""
+    try:
+        window = float(request.args.get('window', 3600))
+        return jsonify(main_controller.get_queue_metrics(window))
+    except Exception as e:
+        error_details = traceback.format_exc()
+        return jsonify({'error': str(e), 'details': error_details}), 500
+
+@api_bp.route('/task_registry', methods=['GET'])
+def get_task_registry():
+    """獲取任務存儲的大小估算"""
+    try:
+        return jsonify(main_controller.get_registry_stats())
+    except Exception as e:
+        error_details = traceback.format_exc()
+        return jsonify({'error': str(e), 'details': error_details}), 500
+
+@api_bp.route('/data_cache', methods=['GET'])
+def get_data_cache_stats():
+    """獲取進程內行情數據緩存的命中統計"""
+    try:
+        return jsonify(main_controller.get_data_cache_stats())
+    except Exception as e:
+        error_details = traceback.format_exc()
+        return jsonify({'error': str(e), 'details': error_details}), 500
+
+@api_bp.route('/cache_stats', methods=['GET'])
+def get_cache_stats():
+    """獲取磁碟緩存的使用量、上限與清理統計"""
+    try:
+        return jsonify(main_controller.get_cache_stats())
+    except Exception as e:
+        error_details = traceback.format_exc()
+        return jsonify({'error': str(e), 'details': error_details}), 500
+
+@api_bp.route('/warmup', methods=['GET'])
+def get_warmup_status():
+    """獲取預熱排程狀態"""
+    try:
+        return jsonify(main_controller.get_warmup_status())
+    except Exception as e:
+        error_details = traceback.format_exc()
+        return jsonify({'error': str(e), 'details': error_details}), 500
+
+@api_bp.route('/warmup', methods=['POST'])
+def run_warmup():
+    """立即執行一次預熱"""
+    try:
+        if not main_controller.run_warmup():
+            return jsonify({'error': '預熱未啟用或正在執行'}), 400
+        return jsonify({'success': True, 'message': '預熱已開始'})
+    except Exception as e:
+        error_details = traceback.format_exc()
+        return jsonify({'error': str(e), 'details': error_details}), 500
+
 @api_bp.route('/cancel_task/<task_id>', methods=['POST'])
 def cancel_task(task_id):
     """取消任務"""
@@ -448,8 +555,7 @@ def generate_chart():
                 indicators = None
                 
         # 獲取股票數據
-        stock_collector = StockDataCollector()
-        stock_data = stock_collector.get_stock_data(ticker, period=period, interval=interval)
+        stock_data = main_controller.stock_collector.get_stock_data(ticker, period=period, interval=interval)
         
         if stock_data is None or stock_data.empty:
             return jsonify({'error': f'找不到股票數據: {ticker}'}), 404
@@ -475,6 +581,28 @@ def generate_chart():
         error_details = traceback.format_exc()
         return jsonify({'error': str(e), 'details': error_details}), 500
 
+@api_bp.route('/compare_stocks', methods=['GET'])
+def compare_stocks():
+    """比較多檔股票的相對表現與相關性"""
+    try:
+        tickers = [t for t in request.args.get('tickers', '').split(',') if t.strip()]
+        if len(tickers) < 2:
+            return jsonify({'error': '需要至少兩個股票代碼'}), 400
+            
+        period = request.args.get('period', '1y')
+        result = main_controller.compare_stocks(tickers, period)
+        
+        if not result:
+            return jsonify({'error': '比較股票失敗'}), 500
+            
+        return jsonify({
+            'success': True,
+            **result
+        })
+    except Exception as e:
+        error_details = traceback.format_exc()
+        return jsonify({'error': str(e), 'details': error_details}), 500
+
 @api_bp.route('/generate_report', methods=['GET'])
 def generate_report():
     """生成股票報告"""
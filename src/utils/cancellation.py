@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 協作式取消
+"""
+
+import os
+import time
+import logging
+import threading
+import subprocess
+
+class TaskCancelled(Exception):
+    """任務已被取消"""
+
+class CancellationToken:
+    """取消令牌
+
+    在任務的各個階段之間傳遞，長時間執行的迴圈定期調用 raise_if_cancelled()，
+    子進程透過 run_subprocess() 啟動，取消時會被終止。
+    令牌可以包裝 multiprocessing.Event，使其他進程能夠發出取消信號。
+    """
+
+    def __init__(self, event=None):
+        """初始化取消令牌
+
+        參數:
+            event (threading.Event 或 multiprocessing.Event, 可選): 底層事件，預設建立新的 threading.Event
+        """
+        self.event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        """發出取消信號"""
+        self.event.set()
+
+    @property
+    def is_cancelled(self):
+        """是否已取消"""
+        return self.event.is_set()
+
+    def raise_if_cancelled(self):
+        """已取消時拋出 TaskCancelled"""
+        if self.event.is_set():
+            raise TaskCancelled("任務已取消")
+
+    def wait(self, timeout):
+        """等待取消信號
+
+        參數:
+            timeout (float): 等待秒數
+
+        返回:
+            bool: 是否已取消
+        """
+        return self.event.wait(timeout)
+
+class LinkedCancellationToken(CancellationToken):
+    """連結到上層令牌的取消令牌
+
+    上層令牌取消時視為已取消；本令牌自身的取消不影響上層令牌，
+    用於任務內部的監控（例如暫存空間超限）中止任務而不改變外部的取消狀態。
+    """
+
+    def __init__(self, parent=None):
+        """初始化連結的取消令牌
+
+        參數:
+            parent (CancellationToken, 可選): 上層令牌
+        """
+        super().__init__()
+        self.parent = parent
+
+    @property
+    def is_cancelled(self):
+        """本令牌或上層令牌是否已取消"""
+        return self.event.is_set() or (self.parent is not None and self.parent.is_cancelled)
+
+    def raise_if_cancelled(self):
+        """本令牌或上層令牌已取消時拋出 TaskCancelled"""
+        if self.is_cancelled:
+            raise TaskCancelled("任務已取消")
+
+    def wait(self, timeout, poll_interval=0.2):
+        """等待本令牌或上層令牌的取消信號
+
+        參數:
+            timeout (float): 等待秒數
+            poll_interval (float): 檢查上層令牌的間隔秒數
+
+        返回:
+            bool: 是否已取消
+        """
+        if self.parent is None:
+            return self.event.wait(timeout)
+        deadline = time.monotonic() + timeout
+        while not self.is_cancelled:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.event.wait(min(poll_interval, remaining))
+        return True
+
+def raise_if_cancelled(cancel_token):
+    """令牌存在且已取消時拋出 TaskCancelled
+
+    參數:
+        cancel_token (CancellationToken): 取消令牌，可為 None
+    """
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+
+def run_subprocess(cmd, cancel_token=None, poll_interval=0.2, **kwargs):
+    """執行子進程，取消時終止它
+
+    與 subprocess.run(cmd, check=True) 行為相同，但執行期間每隔 poll_interval 檢查取消令牌，
+    取消時先發送 SIGTERM，等待 2 秒後仍未退出則強制終止，然後拋出 TaskCancelled。
+
+    參數:
+        cmd (list): 命令
+        cancel_token (CancellationToken, 可選): 取消令牌
+        poll_interval (float): 檢查間隔秒數
+        **kwargs: 傳給 subprocess.Popen 的其他參數
+
+    返回:
+        subprocess.CompletedProcess: 執行結果
+    """
+    raise_if_cancelled(cancel_token)
+
+    kwargs.setdefault('stdout', subprocess.DEVNULL)
+    kwargs.setdefault('stderr', subprocess.PIPE)
+    process = subprocess.Popen(cmd, **kwargs)
+
+    try:
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=poll_interval)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_token is not None and cancel_token.is_cancelled:
+                    _terminate(process)
+                    raise TaskCancelled("任務已取消")
+    except BaseException:
+        if process.poll() is None:
+            _terminate(process)
+        raise
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+def _terminate(process):
+    """終止子進程（先 SIGTERM，逾時後 SIGKILL）
+
+    參數:
+        process (subprocess.Popen): 子進程
+    """
+    logger = logging.getLogger(__name__)
+    logger.info(f"終止子進程: {process.pid}")
+
+    process.terminate()
+    try:
+        process.wait(timeout=2.0)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def remove_files(paths):
+    """刪除部分輸出文件（忽略不存在的文件）
+
+    參數:
+        paths (iterable): 文件路徑
+    """
+    logger = logging.getLogger(__name__)
+    for path in paths:
+        if path and isinstance(path, str) and os.path.isfile(path):
+            try:
+                os.remove(path)
+                logger.debug(f"已刪除部分輸出: {path}")
+            except OSError as e:
+                logger.warning(f"刪除部分輸出失敗: {path}, {e}")
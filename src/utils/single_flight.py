@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+股票數據影片自動化製作系統 - 並發請求合併
+"""
+
+import threading
+
+class _Call:
+    """進行中的調用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """並發請求合併
+
+    相同鍵的並發調用只執行一次：第一個調用者執行函數，
+    其餘調用者等待其完成並共用同一個結果（或同一個異常）。
+    調用完成後鍵即被移除，之後的調用會重新執行。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        """執行或等待相同鍵的調用
+
+        參數:
+            key (hashable): 調用鍵
+            func (callable): 無參數函數
+
+        返回:
+            tuple: (結果, 是否為共用結果)；共用結果與其他調用者是同一個物件
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self.calls[key] = call
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+        return call.result, call.waiters > 0
+
+    def in_flight(self):
+        """獲取進行中的調用數量
+
+        返回:
+            int: 調用數量
+        """
+        with self.lock:
+            return len(self.calls)